@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Adaptive frame sampling from cheap probe renders.
+
+Probes are exported at 72 DPI and a small pixel size on a small fixed
+grid, then bisected where neighbouring probes differ most; together they
+stay within half the frame budget, so the low-res probes cost far less
+than the full-size frames. The probes only locate where the image
+changes: the whole frame budget is then spread over the probe intervals
+in proportion to their measured change, with positions interpolated
+between probes. A steady change gets evenly spaced frames, while a
+stretch where nothing moves (e.g. below a geometry threshold) costs one
+frame and its share goes to the parts that do move.
+Frame times keep the original pace: a held frame simply shows longer.
+"""
+import os
+from operator import sub
+
+import animator
+import framecache
+import frameplan
+import pngio
+
+np = pngio.np
+
+PROBE_DPI = 72
+PROBE_PIXEL_SIZE = 256
+PROBE_FOLDER = '_probes'
+SIGNATURE_SIZE = 64   # probes are compared on a grid of this many pixels per side
+NOISE_LEVEL = 0.002   # mean differences below this count as unchanged
+DEFAULT_STEP = 0.01   # probe intervals changing less are not bisected (mean, 0..1)
+MIN_GAP = 1e-4        # narrower probe intervals are not bisected further
+PROBE_GRID = 9        # evenly spaced probes before bisection (ends + 7 between)
+
+
+def signature(frame, size=SIGNATURE_SIZE):
+    """RGB bytes point-sampled on a size x size grid"""
+    xs = [(2 * x + 1) * frame.width // (2 * size) for x in range(size)]
+    ys = [(2 * y + 1) * frame.height // (2 * size) for y in range(size)]
+    if np is not None and not isinstance(frame.pixels, bytearray):
+        return bytearray(frame.pixels[ys][:, xs].tobytes())
+    rgb = frame.rgb_bytes()
+    out = bytearray()
+    for y in ys:
+        row = y * frame.width * 3
+        for x in xs:
+            out += rgb[row + 3 * x:row + 3 * x + 3]
+    return out
+
+
+def difference(a, b):
+    """Mean absolute difference of two signatures, 0 (same) .. 1"""
+    if np is not None:
+        d = np.frombuffer(bytes(a), dtype=np.uint8).astype(np.int16) - \
+            np.frombuffer(bytes(b), dtype=np.uint8)
+        return float(np.abs(d).mean()) / 255.0
+    return sum(map(abs, map(sub, a, b))) / (255.0 * len(a))
+
+
+def select_positions(probes, diffs, budget):
+    """``budget`` frame positions from sorted probe positions and neighbour differences.
+
+    ``diffs[k]`` is the difference between probes k and k + 1; the image
+    change is taken as linear within an interval. Frames sit at equal steps
+    of the accumulated change, so intervals get frames in proportion to
+    their difference and none falls inside an unchanging one. Both ends are
+    always kept; a range where nothing changes gives just the two ends.
+    """
+    diffs = [d if d >= NOISE_LEVEL else 0.0 for d in diffs]
+    total = sum(diffs)
+    if budget <= 2 or total <= 0:
+        return [probes[0], probes[-1]]
+    positions = [probes[0]]
+    k = 0
+    acc = 0.0  # change from the first probe up to probes[k]
+    for i in range(1, budget - 1):
+        target = total * i / float(budget - 1)
+        while k < len(diffs) - 1 and (diffs[k] == 0.0 or acc + diffs[k] < target):
+            acc += diffs[k]
+            k += 1
+        t = min(1.0, max(0.0, (target - acc) / diffs[k])) if diffs[k] else 1.0
+        positions.append(probes[k] + t * (probes[k + 1] - probes[k]))
+    positions.append(probes[-1])
+    return positions
+
+
+def frame_times(positions, budget):
+    """Frame start times in steps of the evenly spaced ``budget``-frame timeline"""
+    return [p * (budget - 1) for p in positions]
+
+
+def sample_positions(db, doc, view, instance, is_instance, param_settings, budget, folder,
+                     transaction=None, log=None, load_frame=None, probes=None, refine=None,
+                     step=DEFAULT_STEP):
+    """Renders probes into <folder>/_probes and returns ``budget`` frame positions
+    (only the two ends when the image never changes).
+
+    ``probes`` evenly spaced probes (default: PROBE_GRID, at most half the
+    budget) are followed by up to ``refine`` bisections (default: the rest
+    of half the budget) of the intervals that change most, until none
+    changes by ``step`` or more. Probes go through the frame cache, so
+    re-runs only render new ones.
+    """
+    log = log or (lambda message, level=None: None)
+    view = view if view is not None else doc.ActiveView
+    if transaction is None:
+        transaction = lambda name: animator.DbTransaction(db, doc, name)
+    load_frame = load_frame or pngio.read_png
+    if probes is None:
+        probes = min(PROBE_GRID, budget // 2)
+    probes = max(2, probes)
+    refine = max(0, budget // 2 - probes) if refine is None else refine
+    plan = frameplan.build_plan(db, doc, instance, is_instance, param_settings, probes, log=log)
+    probe_dir = os.path.join(folder, PROBE_FOLDER)
+    if not os.path.isdir(probe_dir):
+        os.makedirs(probe_dir)
+    cache = framecache.FrameCache(probe_dir)
+    view_id = frameplan.element_id_value(view.Id)
+    is_active = view.Id == doc.ActiveView.Id
+    options = {'dpi': PROBE_DPI, 'pixel_size': PROBE_PIXEL_SIZE, 'scale': 1.0}
+    plan_signature = plan.signature()
+    signatures = {}
+    diffs = {}
+
+    def render(position):
+        values = plan.values_at(position)
+        key = framecache.frame_key(plan_signature, values, view_id, options)
+        idx = len(signatures)
+        path = animator.frame_file(probe_dir, idx)
+        if not cache.fetch(key, path):
+            with transaction('Probe params'):
+                plan.apply_values(values)
+            if is_active:
+                try:
+                    doc.RefreshActiveView()
+                except Exception:
+                    pass
+            path = animator.export_frame(db, doc, view, probe_dir, idx, PROBE_DPI,
+                                         PROBE_PIXEL_SIZE, 1.0, log=log)
+            cache.record(key, path)
+        signatures[position] = signature(load_frame(path))
+
+    def gap_diff(a, b):
+        if (a, b) not in diffs:
+            diffs[(a, b)] = difference(signatures[a], signatures[b])
+        return diffs[(a, b)]
+
+    # Probe writes are undone afterwards: the model and undo history stay as they were
+    with animator.DbTransactionGroup(db, doc, 'Adaptive probes'):
+        for position in plan.positions:
+            render(position)
+        for _ in range(refine):
+            points = sorted(signatures)
+            gaps = [(gap_diff(a, b), a, b) for a, b in zip(points, points[1:]) if b - a > MIN_GAP]
+            if not gaps:
+                break
+            d, a, b = max(gaps)
+            if d < step:
+                break
+            render((a + b) / 2.0)
+    points = sorted(signatures)
+    positions = select_positions(points, [gap_diff(a, b) for a, b in zip(points, points[1:])],
+                                 budget)
+    log('Adaptive sampling: {} probes, {} frames placed by image change'.format(
+        len(points), len(positions)))
+    return positions
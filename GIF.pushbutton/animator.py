@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""Frame export loop, independent of the WPF window.
+
+run_animation steps an element's parameters through a frame plan and
+exports one PNG per frame, reusing cached frames. The Revit API module
+(``db``), document, view, transaction factory and callbacks are passed in,
+so the same loop serves the dialog, the batch job runner and tests against
+a stand-in DB module.
+"""
+import os
+import re
+
+import autocrop
+import framecache
+import frameplan
+import logsink
+import tracing
+
+MAX_PIXEL_SIZE = 15000  # Revit API hard limit: 1..15000 px per side (see Autodesk forums)
+
+# Draft preview: cheapest export settings offered in the dialog
+PREVIEW_DPI = 72
+PREVIEW_PIXEL_SIZE = 1024
+PREVIEW_FOLDER = '_preview'
+
+
+def frame_file(folder, idx):
+    return os.path.join(folder, 'frame_{:03d}.png'.format(idx))
+
+
+def preview_export():
+    return {'dpi': PREVIEW_DPI, 'pixel_size': PREVIEW_PIXEL_SIZE, 'scale': 1.0}
+
+
+def preview_indices(frames, step):
+    """Every ``step``-th frame index, always ending on the last frame"""
+    indices = list(range(0, frames, max(1, step)))
+    if indices[-1] != frames - 1:
+        indices.append(frames - 1)
+    return indices
+
+
+def export_pixel_size(resolution_dpi, pixel_size, scale_factor):
+    """Requested image width before clamping; DPI above 600 is simulated by size"""
+    scaled_pixel_size = int(pixel_size * scale_factor)
+    if resolution_dpi > 600:
+        return int(scaled_pixel_size * (resolution_dpi / 600.0))
+    return scaled_pixel_size
+
+
+def export_frame(db, doc, view, folder, idx, resolution_dpi=600, pixel_size=2048, scale_factor=1.0,
+                 log=None, tracer=tracing.NULL_TRACER):
+    opts = db.ImageExportOptions()
+    opts.FilePath = frame_file(folder, idx)
+    if view is None or view.Id == doc.ActiveView.Id:
+        opts.ExportRange = db.ExportRange.VisibleRegionOfCurrentView
+    else:
+        opts.ExportRange = db.ExportRange.SetOfViews
+        opts.SetViewsAndSheets(_id_list(db, [view.Id]))
+
+    # 1️⃣ Correct enum-DPI mapping
+    dpi_enum = {
+        72  : db.ImageResolution.DPI_72,
+        150 : db.ImageResolution.DPI_150,
+        300 : db.ImageResolution.DPI_300,
+        600 : db.ImageResolution.DPI_600,
+    }.get(resolution_dpi, db.ImageResolution.DPI_600)  # ≥600 → DPI_600
+    opts.ImageResolution = dpi_enum
+
+    # 2️⃣ Apply scale factor (and simulated DPI) to pixel size
+    final_pixel_size = export_pixel_size(resolution_dpi, pixel_size, scale_factor)
+
+    # 3️⃣ Clamp to Revit's hard limit
+    if final_pixel_size > MAX_PIXEL_SIZE:
+        if log:
+            log("Requested pixel size {} exceeds Revit's limit {}. Clamping.".format(
+                final_pixel_size, MAX_PIXEL_SIZE), logsink.WARNING)
+        final_pixel_size = MAX_PIXEL_SIZE
+
+    opts.PixelSize = final_pixel_size
+    opts.FitDirection = db.FitDirectionType.Horizontal
+    opts.ShadowViewsFileType = db.ImageFileType.PNG
+    clear_exported_frame(opts.FilePath)
+    with tracer.span('export', frame=idx):
+        doc.ExportImage(opts)
+    return find_exported_frame(opts.FilePath)
+
+
+def _exported_names(path):
+    """Files in the frame's folder Revit may have written for ``path``"""
+    folder, name = os.path.split(path)
+    stem = os.path.splitext(name)[0]
+    return [f for f in os.listdir(folder)
+            if f.lower().endswith('.png') and (f.startswith(stem + ' ') or f.startswith(stem + '.'))]
+
+
+def clear_exported_frame(path):
+    """Remove earlier output for this frame so a failed export cannot leave a stale file"""
+    folder = os.path.dirname(path)
+    for name in _exported_names(path):
+        os.remove(os.path.join(folder, name))
+
+
+def find_exported_frame(path):
+    """Path Revit actually wrote, renamed to ``path``; Revit may append the view name"""
+    if os.path.exists(path):
+        return path
+    folder = os.path.dirname(path)
+    matches = _exported_names(path)
+    if not matches:
+        raise IOError('Exported frame not found: {}'.format(path))
+    written = max(matches, key=lambda f: os.path.getmtime(os.path.join(folder, f)))
+    os.rename(os.path.join(folder, written), path)
+    return path
+
+
+def _id_list(db, ids):
+    try:
+        from System.Collections.Generic import List
+        return List[db.ElementId](ids)
+    except ImportError:  # stand-in DB outside Revit
+        return list(ids)
+
+
+class DbTransaction(object):
+    """Context manager around db.Transaction: commits, or rolls back on error"""
+
+    def __init__(self, db, doc, name):
+        self.db = db
+        self.doc = doc
+        self.name = name
+        self._t = None
+
+    def __enter__(self):
+        self._t = self.db.Transaction(self.doc, self.name)
+        self._t.Start()
+        return self._t
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._t.Commit()
+        else:
+            self._t.RollBack()
+        return False
+
+
+class DbTransactionGroup(object):
+    """Context manager around db.TransactionGroup: rolls the grouped
+    transactions back, or assimilates them into one undo entry"""
+
+    def __init__(self, db, doc, name, assimilate=False):
+        self.db = db
+        self.doc = doc
+        self.name = name
+        self.assimilate = assimilate
+        self._g = None
+
+    def __enter__(self):
+        self._g = self.db.TransactionGroup(self.doc, self.name)
+        self._g.Start()
+        return self._g
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.assimilate:
+            self._g.Assimilate()
+        else:
+            self._g.RollBack()
+        return False
+
+
+class AnimationResult(object):
+    """Outcome of one run_animation call; ``sequences`` holds one
+    (view name, folder, frame paths) per view, frame_paths the first's"""
+
+    def __init__(self, plan, frame_paths, exported, reused, sequences=None):
+        self.plan = plan
+        self.frame_paths = frame_paths
+        self.exported = exported
+        self.reused = reused
+        self.sequences = sequences or []
+
+
+def view_folder(folder, view):
+    """Per-view frame folder of a multi-view run: view name and element id,
+    since views of different types may share a name"""
+    view_id = frameplan.element_id_value(view.Id)
+    name = re.sub(r'[\\/:*?"<>|]', '_', view.Name).strip()
+    return os.path.join(folder, '{} ({})'.format(name, view_id) if name else str(view_id))
+
+
+class _ViewOutput(object):
+    """Frame folder, cache and export options of one view in a run"""
+
+    def __init__(self, doc, view, folder, export):
+        self.view = view
+        self.folder = folder
+        self.export = export
+        self.cache = framecache.FrameCache(folder)
+        self.view_id = frameplan.element_id_value(view.Id)
+        self.is_active = view.Id == doc.ActiveView.Id
+        self.paths = []
+        self.run_keys = set()  # frame keys exported or copied in this run
+
+
+def run_animation(db, doc, view, instance, is_instance, param_settings, frames, folder, export,
+                  transaction=None, log=None, progress=None, on_frame=None, reuse_frames=True,
+                  positions=None, tracer=None, auto_crop=False, keep_changes=False):
+    """Exports one PNG per frame into ``folder`` and returns an AnimationResult.
+
+    ``export`` holds 'dpi', 'pixel_size' and 'scale'. ``transaction(name)``
+    returns a context manager wrapping the parameter writes (a plain
+    db.Transaction by default). ``log(message, level)``, ``progress(done,
+    total)`` and ``on_frame(path)`` are optional callbacks; exceptions
+    propagate to the caller. ``positions`` (e.g. from adaptive sampling)
+    replaces the ``frames`` evenly spaced frames. ``tracer`` (tracing.Tracer)
+    records transaction, refresh and export spans per frame. ``auto_crop``
+    limits the export to the region the element sweeps through (see
+    autocrop.py); the view's crop box is restored afterwards. All writes
+    run inside one transaction group that is rolled back at the end, so
+    the model keeps its original values; ``keep_changes`` assimilates the
+    group instead (one undo entry, last frame's values kept). Only
+    parameters whose value changes are Set; a frame whose state was already
+    rendered in this run copies that PNG, whatever ``reuse_frames`` says.
+
+    ``view`` may be a list: each frame's parameters are then written once
+    and exported to every view, into <folder>/<view name>/ (on_frame gets
+    the first view's frames).
+    """
+    log = log or _no_log
+    tracer = tracer or tracing.NULL_TRACER
+    views = view if isinstance(view, (list, tuple)) else [view]
+    views = [v if v is not None else doc.ActiveView for v in views]
+    if transaction is None:
+        transaction = lambda name: DbTransaction(db, doc, name)
+    # --- Plan: resolve element, parameters and unit conversion once ---
+    plan = frameplan.build_plan(db, doc, instance, is_instance, param_settings, frames, log=log,
+                                positions=positions)
+    frames = plan.frames
+    plan.save(os.path.join(folder, 'frame_plan.json'))
+    # --- Frame cache: skip frames already exported with identical inputs ---
+    outputs = []
+    for v in views:
+        out = view_folder(folder, v) if len(views) > 1 else folder
+        if not os.path.isdir(out):
+            os.makedirs(out)
+        outputs.append(_ViewOutput(doc, v, out, export))
+    log('Frame cache: {} entries, reuse={}'.format(sum(len(o.cache) for o in outputs), reuse_frames))
+    if len(views) > 1:
+        log('Multi-view: {} views, one transaction per frame'.format(len(views)))
+    crops = []
+    exported = reused = 0
+    signature = plan.signature()
+    # Per-frame transactions are grouped: rolled back at the end (model and
+    # undo history as before the run) or assimilated into one undo entry
+    with DbTransactionGroup(db, doc, 'Animate parameters', assimilate=keep_changes):
+        try:
+            if auto_crop:
+                for o in outputs:
+                    crops.append(autocrop.AutoCrop(db, o.view, transaction, log))
+                    with tracer.span('auto_crop'):
+                        o.export = crops[-1].apply(plan, frameplan.as_targets(instance), export)
+            for i in range(frames):
+                log('Processing frame {}/{}: {}'.format(i+1, frames, plan.describe(i)))
+                pending = []
+                for o in outputs:
+                    key = framecache.frame_key(signature, plan.values[i], o.view_id, o.export)
+                    target = frame_file(o.folder, i)
+                    # a state already rendered in this run is always reused
+                    if (reuse_frames or key in o.run_keys) and o.cache.fetch(key, target):
+                        log('Frame {} unchanged, reusing {}'.format(i, os.path.basename(target)))
+                        reused += 1
+                        o.paths.append(target)
+                        o.run_keys.add(key)
+                    else:
+                        pending.append((o, key))
+                if pending and not plan.changed(plan.values[i]):
+                    log('Frame {}: parameters already hold these values, no regeneration'.format(i),
+                        logsink.DEBUG)
+                elif pending:
+                    # One transaction (and regeneration) per frame, however many views;
+                    # only parameters whose value changes are Set
+                    with tracer.span('transaction', frame=i):
+                        with transaction('Animate params'):
+                            plan.apply(i)
+                    if any(o.is_active for o, _ in pending):
+                        try:
+                            with tracer.span('refresh', frame=i):
+                                doc.RefreshActiveView()
+                            log('View refreshed', logsink.DEBUG)
+                        except Exception:
+                            log('Skipping view refresh', logsink.WARNING)
+                for o, key in pending:
+                    dpi, pixel_size, scale = o.export['dpi'], o.export['pixel_size'], o.export['scale']
+                    effective_dpi = str(dpi) if dpi <= 600 else '600 (simulated {})'.format(dpi)
+                    log('Exporting frame {} to folder {} with DPI={}, pixel_size={}, scale={}, final_size={}'.format(
+                        i, o.folder, effective_dpi, pixel_size, scale, export_pixel_size(dpi, pixel_size, scale)),
+                        logsink.DEBUG)
+                    frame_path = export_frame(db, doc, o.view, o.folder, i, dpi, pixel_size, scale, log=log,
+                                              tracer=tracer)
+                    o.cache.record(key, frame_path)
+                    o.paths.append(frame_path)
+                    o.run_keys.add(key)
+                    exported += 1
+                if on_frame is not None:
+                    on_frame(outputs[0].paths[-1])
+                if progress is not None:
+                    progress(i + 1, frames)
+        finally:
+            for crop in crops:
+                crop.restore()
+    log('Model {}'.format('changes kept as one undo entry' if keep_changes
+                          else 'restored to its original parameter values'))
+    log('Animation finished! Done! Frames created: {} ({} exported, {} reused from cache)'.format(
+        frames * len(outputs), exported, reused))
+    return AnimationResult(plan, outputs[0].paths, exported, reused,
+                           [(o.view.Name, o.folder, o.paths) for o in outputs])
+
+
+def _no_log(message, level=logsink.INFO):
+    pass
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Lossless APNG assembly straight from the exported PNG files.
+
+Exported frames are already deflated PNGs, so no pixel work is needed:
+the first frame's IDAT chunks become the default image and every later
+frame's IDAT payload is wrapped into fdAT chunks behind an fcTL carrying
+its delay. Cost is file I/O plus CRCs and colors stay exact. This only
+works when every frame has the same IHDR (size, bit depth, color type,
+interlace) and palette; otherwise the frames are decoded and re-encoded as
+8-bit RGB. With ``collapse`` frames whose compressed data are identical
+are merged into one frame with their delays added up (checked on the
+bytes, so still without decoding). With ``pingpong`` the return trip
+reads the forward frames again in reverse order, so only their digests
+stay in memory.
+"""
+import hashlib
+import os
+import struct
+
+import gifenc
+import pngio
+import tracing
+
+_FORMAT_CHUNKS = (b'IHDR', b'PLTE', b'tRNS')
+
+
+def read_layout(path):
+    """Returns (IHDR payload, [(type, data)] of the other chunks before the
+    image data in file order, [IDAT payloads]) of a PNG file"""
+    header = None
+    head = []
+    idat = []
+    with open(path, 'rb') as f:
+        if f.read(8) != pngio.PNG_SIGNATURE:
+            raise ValueError('Not a PNG file: {}'.format(path))
+        for ctype, data in pngio.iter_chunks(f):
+            if ctype == b'IHDR':
+                header = data
+            elif ctype == b'IDAT':
+                idat.append(data)
+            elif not idat and ctype != b'IEND':
+                head.append((ctype, data))
+    if header is None:
+        raise ValueError('PNG has no IHDR chunk: {}'.format(path))
+    return header, head, idat
+
+
+def read_format(path):
+    """IHDR, PLTE and tRNS payloads; stops at the image data without reading it"""
+    fmt = {}
+    with open(path, 'rb') as f:
+        if f.read(8) != pngio.PNG_SIGNATURE:
+            raise ValueError('Not a PNG file: {}'.format(path))
+        while True:
+            head = f.read(8)
+            if len(head) < 8:
+                break
+            length, ctype = struct.unpack('>I4s', head)
+            if ctype in (b'IDAT', b'IEND'):
+                break
+            data = f.read(length)
+            f.read(4)  # CRC
+            if ctype in _FORMAT_CHUNKS:
+                fmt[ctype] = data
+    if b'IHDR' not in fmt:
+        raise ValueError('PNG has no IHDR chunk: {}'.format(path))
+    return fmt
+
+
+def mismatch(paths):
+    """Why the frames' compressed data cannot be copied as-is, or None"""
+    first = read_format(paths[0])
+    for path in paths[1:]:
+        fmt = read_format(path)
+        for ctype in _FORMAT_CHUNKS:
+            if fmt.get(ctype) != first.get(ctype):
+                if ctype == b'IHDR':
+                    w, h, depth, color = struct.unpack('>IIBB', fmt[ctype][:10])
+                    return '{} is {}x{}, {}-bit, color type {} (first frame: {}x{}, {}-bit, color type {})'.format(
+                        os.path.basename(path), w, h, depth, color,
+                        *struct.unpack('>IIBB', first[ctype][:10]))
+                return '{} has a different {} chunk'.format(os.path.basename(path), ctype.decode('ascii'))
+    return None
+
+
+def _fctl(seq, width, height, delay_cs):
+    return struct.pack('>IIIIIHHBB', seq, width, height, 0, 0, delay_cs, 100, 0, 0)
+
+
+class ApngWriter(object):
+    """Writes APNG chunks to a seekable stream; frames arrive as IDAT payloads.
+
+    acTL is written with a zero frame count and patched on close(), so
+    frames can be merged without knowing the final count up front.
+    """
+
+    def __init__(self, stream, header, extra=(), plays=0, collapse=False):
+        self.stream = stream
+        self.width, self.height = struct.unpack('>II', header[:8])
+        self.plays = plays
+        self.collapse = collapse
+        self.frame_count = 0
+        self.merged = 0
+        self._seq = 0
+        self._last_digest = None
+        self._last_delay = 0
+        self._last_fctl = None
+        self._last_seq = 0
+        stream.write(pngio.PNG_SIGNATURE)
+        pngio.write_chunk(stream, b'IHDR', header)
+        self._actl_pos = stream.tell()
+        pngio.write_chunk(stream, b'acTL', struct.pack('>II', 0, plays))
+        for ctype, data in extra:
+            pngio.write_chunk(stream, ctype, data)
+
+    def add_frame(self, idat, delay_cs=gifenc.DEFAULT_DELAY_CS, digest=None):
+        """Appends one frame from its IDAT payloads (a list of byte strings)"""
+        delay_cs = max(0, min(gifenc.MAX_DELAY_CS, int(delay_cs)))
+        if (self.collapse and digest is not None and digest == self._last_digest and
+                self._last_delay + delay_cs <= gifenc.MAX_DELAY_CS):
+            self._last_delay += delay_cs
+            self._rewrite_fctl(self._last_fctl, self._last_seq, self._last_delay)
+            self.merged += 1
+            return
+        self._last_fctl = self.stream.tell()
+        self._last_seq = self._seq
+        self._last_digest = digest
+        self._last_delay = delay_cs
+        pngio.write_chunk(self.stream, b'fcTL', _fctl(self._seq, self.width, self.height, delay_cs))
+        self._seq += 1
+        for data in idat:
+            if self.frame_count == 0:
+                pngio.write_chunk(self.stream, b'IDAT', data)
+            else:
+                pngio.write_chunk(self.stream, b'fdAT', struct.pack('>I', self._seq) + data)
+                self._seq += 1
+        self.frame_count += 1
+
+    def _rewrite_fctl(self, pos, seq, delay_cs):
+        end = self.stream.tell()
+        self.stream.seek(pos)
+        pngio.write_chunk(self.stream, b'fcTL', _fctl(seq, self.width, self.height, delay_cs))
+        self.stream.seek(end)
+
+    def close(self):
+        pngio.write_chunk(self.stream, b'IEND', b'')
+        end = self.stream.tell()
+        self.stream.seek(self._actl_pos)
+        pngio.write_chunk(self.stream, b'acTL', struct.pack('>II', self.frame_count, self.plays))
+        self.stream.seek(end)
+
+
+def idat_digest(idat):
+    """SHA-1 of a frame's compressed image data"""
+    h = hashlib.sha1()
+    for data in idat:
+        h.update(data)
+    return h.digest()
+
+
+def write_apng(paths, out_path, delay_cs=gifenc.DEFAULT_DELAY_CS, plays=0, collapse=False,
+               load_frame=None, log=None, pingpong=False, tracer=tracing.NULL_TRACER):
+    """Builds out_path from PNG frames; returns the number of APNG frames.
+
+    ``delay_cs`` is one delay or a list per frame (see gifenc.frame_delays);
+    ``plays`` 0 = loop forever. Compressed data are copied when the frames
+    share their format, else ``load_frame`` (default pngio.read_png) decodes
+    them for an 8-bit RGB re-encode. ``pingpong`` plays the frames forward,
+    then back (see gifenc.pingpong_order) with ``delay_cs`` giving the forward delays.
+    """
+    log = log or (lambda message, level=None: None)
+    if not paths:
+        raise ValueError('No frames to write')
+    n = len(paths)
+    digests = None  # of the forward frames, reused on the return trip
+    if pingpong and n > 2:
+        digests = []
+        if isinstance(delay_cs, (list, tuple)):
+            delay_cs = gifenc.pingpong_delays(delay_cs)
+    reason = mismatch(paths)
+    if reason is None:
+        read_frames = lambda chosen, start: _copied_frames(chosen, tracer, start)
+        log('APNG: copying compressed data of {} frames (no decode)'.format(n))
+    else:
+        read_frames = lambda chosen, start: _reencoded_frames(chosen, load_frame or pngio.read_png,
+                                                              tracer, start)
+        log('APNG: {}; re-encoding frames as 8-bit RGB'.format(reason))
+    with open(out_path, 'wb') as f:
+        writer = None
+        for i, (header, extra, idat) in enumerate(read_frames(paths, 0)):
+            if writer is None:
+                writer = ApngWriter(f, header, extra, plays, collapse)
+            delay = delay_cs[i] if isinstance(delay_cs, (list, tuple)) else delay_cs
+            digest = idat_digest(idat) if collapse else None
+            with tracer.span('apng_append', frame=i):
+                writer.add_frame(idat, delay, digest)
+            if digests is not None:
+                digests.append(digest)
+        if digests:
+            back = list(range(n - 2, 0, -1))
+            frames = read_frames([paths[k] for k in back], n)
+            for i, k in enumerate(back, n):
+                idat = next(frames)[2]
+                delay = delay_cs[i] if isinstance(delay_cs, (list, tuple)) else delay_cs
+                with tracer.span('apng_append', frame=i):
+                    writer.add_frame(idat, delay, digests[k])
+        writer.close()
+    if writer.merged:
+        log('Merged {} repeated frames into longer delays'.format(writer.merged))
+    return writer.frame_count
+
+
+def _copied_frames(paths, tracer, start=0):
+    for i, path in enumerate(paths, start):
+        with tracer.span('read', frame=i):
+            layout = read_layout(path)
+        yield layout
+
+
+def _reencoded_frames(paths, load_frame, tracer, start=0):
+    size = None
+    for i, path in enumerate(paths, start):
+        with tracer.span('decode', frame=i):
+            frame = load_frame(path)
+        if size is None:
+            size = (frame.width, frame.height)
+        elif (frame.width, frame.height) != size:
+            raise ValueError('Frame size differs from the first frame ({}x{}): {}'.format(
+                size[0], size[1], path))
+        with tracer.span('encode', frame=i):
+            data = pngio.encode_rgb(frame.width, frame.height, frame.rgb_bytes())
+        yield pngio.rgb_header(frame.width, frame.height), [], [data]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Auto-crop: export only the region the animated elements sweep through.
+
+Before the frame loop the plan is applied at a few positions (both ends
+and evenly spaced ones in between). The union of the targets' bounding
+boxes over those states, plus padding, becomes the view's crop box for
+the run, and the pixel size shrinks by the same fraction of the view, so
+the model keeps its on-screen scale while render, PNG and GIF work follow
+the size of the animated object instead of the view. The view's crop
+settings are restored afterwards. Perspective views and views whose crop
+region is off are left alone: without an active crop the export shows the
+view's window, whose extents the crop box does not describe, so the pixel
+size could not keep the model's scale.
+"""
+import frameplan
+
+CROP_PADDING = 0.1    # fraction of the region's size added on each side
+CROP_SAMPLES = 9      # plan positions probed for the swept bounding box
+MIN_PIXEL_SIZE = 64
+
+
+def probe_positions(plan, samples=CROP_SAMPLES):
+    """The plan's own positions when there are few, else evenly spaced ones"""
+    if plan.frames <= samples:
+        return list(plan.positions)
+    return frameplan.linear_positions(samples)
+
+
+def _corners(box):
+    lo, hi = box.Min, box.Max
+    for x in (lo.X, hi.X):
+        for y in (lo.Y, hi.Y):
+            for z in (lo.Z, hi.Z):
+                yield x, y, z
+
+
+def swept_region(db, view, plan, targets, transaction, samples=CROP_SAMPLES):
+    """(xmin, ymin, xmax, ymax) in the view's crop-box coordinates covering
+    every target across the probed states, or None without bounding boxes"""
+    to_view = view.CropBox.Transform.Inverse
+    lo = [float('inf')] * 2
+    hi = [float('-inf')] * 2
+    for position in probe_positions(plan, samples):
+        with transaction('Auto-crop probe'):
+            plan.apply_values(plan.values_at(position))
+        for target in targets:
+            box = target.instance.get_BoundingBox(view)
+            if box is None:
+                continue
+            for x, y, z in _corners(box):
+                p = to_view.OfPoint(box.Transform.OfPoint(db.XYZ(x, y, z)))
+                lo = [min(lo[0], p.X), min(lo[1], p.Y)]
+                hi = [max(hi[0], p.X), max(hi[1], p.Y)]
+    if lo[0] > hi[0]:
+        return None
+    return lo[0], lo[1], hi[0], hi[1]
+
+
+class AutoCrop(object):
+    """Crops a view to the swept region for the duration of a run"""
+
+    def __init__(self, db, view, transaction, log):
+        self.db = db
+        self.view = view
+        self.transaction = transaction
+        self.log = log
+        self._saved = None
+
+    def apply(self, plan, targets, export, padding=CROP_PADDING):
+        """Sets the crop box; returns export options with the scaled pixel size
+        and the region (part of the frame cache key), or ``export`` unchanged"""
+        view = self.view
+        if getattr(view, 'IsPerspective', False):
+            self.log('Auto-crop skipped: perspective view')
+            return export
+        if not view.CropBoxActive:
+            self.log('Auto-crop skipped: the view\'s crop region is off, turn it on to auto-crop')
+            return export
+        region = swept_region(self.db, view, plan, targets, self.transaction)
+        if region is None:
+            self.log('Auto-crop skipped: no bounding box for the animated elements')
+            return export
+        crop = view.CropBox
+        view_w, view_h = crop.Max.X - crop.Min.X, crop.Max.Y - crop.Min.Y
+        xmin, ymin, xmax, ymax = region
+        pad_x, pad_y = padding * (xmax - xmin), padding * (ymax - ymin)
+        # stay inside the current crop box: it bounds what the full export shows
+        xmin, xmax = max(crop.Min.X, xmin - pad_x), min(crop.Max.X, xmax + pad_x)
+        ymin, ymax = max(crop.Min.Y, ymin - pad_y), min(crop.Max.Y, ymax + pad_y)
+        fraction = (xmax - xmin) / view_w if view_w > 0 else 1.0
+        if xmax <= xmin or ymax <= ymin or (fraction >= 1.0 and (ymax - ymin) >= view_h):
+            self.log('Auto-crop skipped: the animated elements fill the view')
+            return export
+        box = self.db.BoundingBoxXYZ()
+        box.Transform = crop.Transform
+        box.Min = self.db.XYZ(xmin, ymin, crop.Min.Z)
+        box.Max = self.db.XYZ(xmax, ymax, crop.Max.Z)
+        self._saved = (crop, view.CropBoxActive, view.CropBoxVisible)
+        with self.transaction('Auto-crop'):
+            view.CropBoxActive = True
+            view.CropBoxVisible = False
+            view.CropBox = box
+        pixel_size = max(MIN_PIXEL_SIZE, int(round(export['pixel_size'] * fraction)))
+        self.log('Auto-crop: {:.0%} x {:.0%} of the view, pixel size {} -> {}'.format(
+            fraction, (ymax - ymin) / view_h if view_h > 0 else 1.0, export['pixel_size'], pixel_size))
+        cropped = dict(export)
+        cropped['pixel_size'] = pixel_size
+        cropped['crop'] = [round(v, 6) for v in (xmin, ymin, xmax, ymax)]
+        return cropped
+
+    def restore(self):
+        """Puts the view's crop box and flags back as they were"""
+        if self._saved is None:
+            return
+        crop, active, visible = self._saved
+        self._saved = None
+        with self.transaction('Restore crop'):
+            self.view.CropBox = crop
+            self.view.CropBoxActive = active
+            self.view.CropBoxVisible = visible
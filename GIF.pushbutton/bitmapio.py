@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Frame decoding through GDI+ (System.Drawing) inside Revit.
+
+IronPython has no NumPy, so pngio.read_png and resample's pure Python
+path are slow at export sizes. Bitmap decodes the PNG natively and
+Graphics downsamples it to the GIF width before the pixels are copied
+out, so palette and encode stages only touch output-size frames. Used by
+both the dialog (script.py) and the batch runner (config.py).
+"""
+import clr
+clr.AddReference('System.Drawing')
+
+import System
+from System.Drawing import Bitmap, Graphics, GraphicsUnit, Rectangle
+from System.Drawing.Drawing2D import CompositingMode, InterpolationMode, PixelOffsetMode, WrapMode
+from System.Drawing.Imaging import ImageAttributes, ImageLockMode, PixelFormat
+from System.Runtime.InteropServices import Marshal
+
+import pngio
+import resample
+
+
+def scale_bitmap(bmp, width):
+    """GDI+ downscale to ``width`` px; the high-quality bilinear mode prefilters
+    the source, so every output pixel averages the area it covers"""
+    w, h = resample.target_size(bmp.Width, bmp.Height, width)
+    out = Bitmap(w, h, PixelFormat.Format24bppRgb)
+    g = Graphics.FromImage(out)
+    attrs = ImageAttributes()
+    try:
+        g.CompositingMode = CompositingMode.SourceCopy
+        g.InterpolationMode = InterpolationMode.HighQualityBilinear
+        g.PixelOffsetMode = PixelOffsetMode.HighQuality
+        attrs.SetWrapMode(WrapMode.TileFlipXY)  # no dark fringe at the edges
+        g.DrawImage(bmp, Rectangle(0, 0, w, h), 0, 0, bmp.Width, bmp.Height, GraphicsUnit.Pixel, attrs)
+    finally:
+        attrs.Dispose()
+        g.Dispose()
+    return out
+
+
+def load_frame_bitmap(path, width=None):
+    """Decodes a PNG through GDI+ (downscaled to ``width`` px if narrower)
+    and releases the bitmaps before returning"""
+    bmp = Bitmap(path)
+    try:
+        if width and width < bmp.Width:
+            src, bmp = bmp, scale_bitmap(bmp, width)
+            src.Dispose()
+        w, h = bmp.Width, bmp.Height
+        data = bmp.LockBits(Rectangle(0, 0, w, h), ImageLockMode.ReadOnly, PixelFormat.Format24bppRgb)
+        try:
+            stride = data.Stride
+            buf = System.Array.CreateInstance(System.Byte, stride * h)
+            Marshal.Copy(data.Scan0, buf, 0, stride * h)
+        finally:
+            bmp.UnlockBits(data)
+    finally:
+        bmp.Dispose()
+    return pngio.Frame.from_bgr(w, h, bytearray(buf), stride)
+
+
+def gif_frame_loader(width):
+    """load_frame for a GIF ``width`` px wide (None = export size)"""
+    if not width:
+        return load_frame_bitmap
+    return lambda path: load_frame_bitmap(path, width)
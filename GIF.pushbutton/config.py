@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Shift+Click: runs a JSON batch job file (see jobs.py) without the dialog."""
+import os, sys, inspect
+
+from pyrevit import revit, DB, forms, script
+
+SCRIPT_DIR = os.path.dirname(inspect.getfile(inspect.currentframe()))
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+
+import bitmapio
+import jobs
+import logsink
+
+
+def log(message, level=logsink.INFO):
+    if level >= logsink.INFO:
+        print(message)
+
+
+def run_batch():
+    path = forms.pick_file(file_ext='json', title='Select animation job file')
+    if not path:
+        return
+    try:
+        job_list = jobs.load_jobs(path)
+    except (IOError, ValueError) as e:
+        forms.alert('Invalid job file: {}'.format(e))
+        return
+    results = jobs.run_jobs(DB, revit.doc, job_list, transaction=revit.Transaction, log=log,
+                            load_frame=bitmapio.load_frame_bitmap,
+                            frame_loader=bitmapio.gif_frame_loader)
+    report = os.path.splitext(path)[0] + '_report.json'
+    jobs.write_report(report, results)
+    script.get_output().print_table(
+        [[r.name, r.status, '{:.1f}'.format(r.seconds), r.frames, r.exported, r.reused, r.error or '']
+         for r in results],
+        columns=['Job', 'Status', 'Seconds', 'Frames', 'Exported', 'Reused', 'Error'],
+        title='Animation jobs')
+    print('Report: {}'.format(report))
+
+
+if __name__ == '__main__':
+    run_batch()
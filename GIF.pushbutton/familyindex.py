@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Family -> type -> instance index behind the element picker.
+
+The index is built from family types only (one collector pass over
+FamilySymbol), so startup cost does not grow with the number of placed
+instances. Loaded but unused types are dropped when their family is
+first opened: one native FamilyInstanceFilter query per type that stops
+at the first instance found. Instance ids of a type are collected when
+the user drills down to it, through the same filter, and kept for the
+session. Search matches family and type names; a typed element id jumps
+straight to that instance.
+"""
+import frameplan
+
+
+def _name(db, element):
+    """Element name; FamilySymbol.Name is hidden in IronPython on some versions"""
+    try:
+        return element.Name
+    except AttributeError:
+        return db.Element.Name.GetValue(element)
+
+
+class FamilyIndex(object):
+    """Families and their types by name; instance ids loaded per type on demand"""
+
+    def __init__(self, db, doc):
+        self.db = db
+        self.doc = doc
+        self.types = {}  # family name -> [(type name, symbol id value)]
+        for symbol in db.FilteredElementCollector(doc).OfClass(db.FamilySymbol):
+            family = symbol.FamilyName
+            self.types.setdefault(family, []).append(
+                (_name(db, symbol), frameplan.element_id_value(symbol.Id)))
+        for entries in self.types.values():
+            entries.sort(key=lambda t: t[0].lower())
+        self.names = sorted(self.types, key=lambda n: n.lower())
+        self._instances = {}
+        self._pruned = set()  # families whose unused types were dropped
+
+    def search(self, text):
+        """Family names where every word of ``text`` occurs in the family
+        name or one of its type names (case-insensitive)"""
+        words = (text or '').lower().split()
+        if not words:
+            return self.names
+        found = []
+        for name in self.names:
+            haystack = ' '.join([name] + [t for t, _ in self.types[name]]).lower()
+            if all(w in haystack for w in words):
+                found.append(name)
+        return found
+
+    def type_entries(self, family):
+        """[(type name, symbol id value)] of a family's placed types; unused
+        types are dropped the first time the family is asked for"""
+        entries = self.types.get(family, [])
+        if entries and family not in self._pruned:
+            entries = self.types[family] = [t for t in entries if self._is_placed(t[1])]
+            self._pruned.add(family)
+        return entries
+
+    def _instance_collector(self, symbol_id):
+        db = self.db
+        return db.FilteredElementCollector(self.doc).OfClass(db.FamilyInstance).WherePasses(
+            db.FamilyInstanceFilter(self.doc, db.ElementId(symbol_id)))
+
+    def _is_placed(self, symbol_id):
+        """Whether the type has an instance; stops at the first one found"""
+        ids = self._instances.get(symbol_id)
+        if ids is not None:
+            return bool(ids)
+        return frameplan.element_id_value(self._instance_collector(symbol_id).FirstElementId()) != -1
+
+    def instance_ids(self, symbol_id):
+        """Sorted id values of the type's instances, collected on first use"""
+        ids = self._instances.get(symbol_id)
+        if ids is None:
+            ids = sorted(frameplan.element_id_value(i)
+                         for i in self._instance_collector(symbol_id).ToElementIds())
+            self._instances[symbol_id] = ids
+        return ids
+
+    def locate(self, text):
+        """(family, symbol id value, instance id value) for a typed element id, or None"""
+        text = (text or '').strip().lstrip('#')
+        if not text.isdigit():
+            return None
+        element = self.doc.GetElement(self.db.ElementId(int(text)))
+        symbol = getattr(element, 'Symbol', None)
+        if symbol is None or symbol.FamilyName not in self.types:
+            return None
+        return symbol.FamilyName, frameplan.element_id_value(symbol.Id), int(text)
+
+    def instance(self, instance_id):
+        """The FamilyInstance for an id value"""
+        return self.doc.GetElement(self.db.ElementId(instance_id))
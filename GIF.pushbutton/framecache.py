@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed cache of exported frames.
+
+Every exported PNG is recorded in an append-only journal in the output
+folder, keyed by a hash of everything that determines its pixels: the plan's
+elements and parameter names, parameter values, view and export options. A re-run (or a resumed run
+after a crash) reuses any frame whose key is already on disk as a valid
+PNG and only exports missing or stale ones. Changing a setting changes the
+keys, so stale frames are never reused.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import pngio
+
+MANIFEST_NAME = 'frames_manifest.jsonl'
+VALUE_DIGITS = 9  # parameter values are rounded before hashing
+
+
+def frame_key(signature, values, view_id, options):
+    """Stable hex digest for one frame's render inputs; ``signature`` is
+    FramePlan.signature(), so equal values of other parameters never match"""
+    payload = json.dumps({
+        'plan': signature,
+        'values': [round(float(v), VALUE_DIGITS) for v in values],
+        'view': view_id,
+        'options': options,
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def is_valid_png(path, size=None):
+    """Cheap integrity check: expected size, PNG signature and IEND trailer"""
+    try:
+        actual = os.path.getsize(path)
+        if actual < 20 or (size is not None and actual != size):
+            return False
+        with open(path, 'rb') as f:
+            if f.read(8) != pngio.PNG_SIGNATURE:
+                return False
+            f.seek(-12, 2)
+            return f.read(8)[4:] == b'IEND'
+    except (IOError, OSError):
+        return False
+
+
+class FrameCache(object):
+    """Journal of exported frames in ``folder``"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self._files = {}  # file name -> (key, size)
+        self._keys = {}   # key -> file name
+        self._load()
+
+    def __len__(self):
+        return len(self._files)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, 'r') as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                    self._set(entry['file'], entry['key'], entry['size'])
+                except (ValueError, KeyError):
+                    continue  # torn last line after a crash
+        self._drop_invalid()
+        if lines > 2 * len(self._files):
+            self.compact()
+
+    def _set(self, name, key, size):
+        old = self._files.get(name)
+        if old is not None and self._keys.get(old[0]) == name:
+            del self._keys[old[0]]
+        self._files[name] = (key, size)
+        self._keys[key] = name
+
+    def _drop_invalid(self):
+        for name, (key, size) in list(self._files.items()):
+            if not is_valid_png(os.path.join(self.folder, name), size):
+                del self._files[name]
+                if self._keys.get(key) == name:
+                    del self._keys[key]
+
+    def find(self, key):
+        """Path of a valid cached frame with this key, or None"""
+        name = self._keys.get(key)
+        if name is None:
+            return None
+        path = os.path.join(self.folder, name)
+        if not is_valid_png(path, self._files[name][1]):
+            return None
+        return path
+
+    def fetch(self, key, target):
+        """Makes ``target`` hold the frame for ``key`` if cached; returns True on a hit"""
+        found = self.find(key)
+        if found is None:
+            return False
+        if os.path.normcase(os.path.abspath(found)) != os.path.normcase(os.path.abspath(target)):
+            shutil.copyfile(found, target)
+            self.record(key, target)
+        return True
+
+    def record(self, key, path):
+        """Journals a freshly written frame; flushed at once so a crash keeps it"""
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        self._set(name, key, size)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'file': name, 'key': key, 'size': size}) + '\n')
+
+    def compact(self):
+        """Rewrites the journal with only the live entries"""
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for name in sorted(self._files):
+                key, size = self._files[name]
+                f.write(json.dumps({'file': name, 'key': key, 'size': size}) + '\n')
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp, self.path)
+
+    def clear(self):
+        """Forgets every entry (frames on disk are left alone)"""
+        self._files.clear()
+        self._keys.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Frame plan: everything run_animation needs, resolved once before the loop.
+
+build_plan looks up the target element and its Parameter handles, settles
+how display values convert to internal units, and precomputes a frames x
+parameters table of internal values, so the frame loop only calls Set().
+Frames sit at positions in [0, 1] along every parameter's range; evenly
+spaced unless a sampler (see adaptive.py) chooses them. A plan may drive
+several elements (Target: instance + phase offset); all of a frame's
+writes still go into one transaction, so a frame costs one regeneration
+and one export however many elements move. Display values are rounded
+to the document's display accuracy for each parameter, so frames that
+only differ below what Revit shows write, key and cache as equal. The
+plan remembers what it last wrote, so parameters already holding a
+frame's value are not Set again and a frame that changes nothing needs
+no transaction at all.
+The Revit API module is passed in (``db``), so plans can be built and
+checked against a stand-in DB outside Revit.
+"""
+import json
+
+STRATEGY_UNIT_TYPE_ID = 'unit_type_id'            # Revit 2021+: GetUnitTypeId()
+STRATEGY_DISPLAY_UNIT_TYPE = 'display_unit_type'  # older API: DisplayUnitType
+STRATEGY_RAW = 'raw'                              # no conversion
+
+VALUE_TOLERANCE = 1e-9  # internal units; closer values count as unchanged
+
+
+class Target(object):
+    """An element to animate; ``phase`` is the fraction of the timeline its
+    sweep lags behind (wrapping around), 0 = in step with the others"""
+
+    def __init__(self, instance, phase=0.0):
+        self.instance = instance
+        self.phase = float(phase)
+
+
+def as_targets(instance):
+    """Target list from one instance or a list of instances / Targets"""
+    items = instance if isinstance(instance, (list, tuple)) else [instance]
+    return [t if isinstance(t, Target) else Target(t) for t in items]
+
+
+class ParamTrack(object):
+    """One animated parameter: handle, range, unit conversion and display
+    accuracy (rounding step in display units, None = no rounding)"""
+
+    def __init__(self, name, param, min_value, max_value, strategy, to_internal,
+                 element_id=None, phase=0.0, accuracy=None):
+        self.name = name
+        self.param = param
+        self.min_value = min_value
+        self.max_value = max_value
+        self.strategy = strategy
+        self.to_internal = to_internal
+        self.element_id = element_id
+        self.phase = phase
+        self.accuracy = accuracy
+
+    def value_at(self, position):
+        """Display value at a position in [0, 1] of the range"""
+        if self.phase:
+            position = (position - self.phase) % 1.0
+        return round_to(self.min_value + position * (self.max_value - self.min_value), self.accuracy)
+
+    def to_dict(self):
+        return {'name': self.name, 'min': self.min_value, 'max': self.max_value,
+                'strategy': self.strategy, 'element_id': self.element_id, 'phase': self.phase,
+                'accuracy': self.accuracy}
+
+
+class FramePlan(object):
+    """Precomputed parameter values for every frame"""
+
+    def __init__(self, element_id, frames, tracks, positions=None, is_instance=True):
+        self.element_id = element_id
+        self.is_instance = is_instance
+        self.positions = list(positions) if positions is not None else linear_positions(frames)
+        self.frames = len(self.positions)
+        self.tracks = tracks
+        # display[i][j] / values[i][j]: frame i, parameter j
+        self.display = [[t.value_at(p) for t in tracks] for p in self.positions]
+        self.values = [[t.to_internal(v) for t, v in zip(tracks, row)] for row in self.display]
+        self._written = [None] * len(tracks)  # last value Set per track, None = not read yet
+
+    def signature(self):
+        """What the values belong to: element(s), instance/type mode and the
+        (element id, parameter name) of every track; part of frame cache keys"""
+        return {'element': self.element_id, 'instance': bool(self.is_instance),
+                'tracks': [[t.element_id, t.name] for t in self.tracks]}
+
+    def values_at(self, position):
+        """Internal values at any position in [0, 1], e.g. for probe renders"""
+        return [t.to_internal(t.value_at(position)) for t in self.tracks]
+
+    def apply(self, i):
+        """Writes frame i's values; must run inside a transaction"""
+        return self.apply_values(self.values[i])
+
+    def changed(self, values):
+        """Indices of the tracks whose parameter does not hold ``values`` yet"""
+        for j, track in enumerate(self.tracks):
+            if self._written[j] is None:
+                self._written[j] = track.param.AsDouble()
+        return [j for j, value in enumerate(values)
+                if abs(self._written[j] - value) > VALUE_TOLERANCE]
+
+    def apply_values(self, values):
+        """Sets only the parameters whose value changes; returns how many were Set"""
+        changed = self.changed(values)
+        for j in changed:
+            self.tracks[j].param.Set(values[j])
+            self._written[j] = values[j]
+        return len(changed)
+
+    def forget(self):
+        """Drops the remembered values (after the model was changed elsewhere)"""
+        self._written = [None] * len(self.tracks)
+
+    def describe(self, i):
+        multi = isinstance(self.element_id, list)
+        return ', '.join('{}{}={}'.format('#{} '.format(t.element_id) if multi else '', t.name, v)
+                         for t, v in zip(self.tracks, self.display[i]))
+
+    def to_dict(self):
+        return {'element_id': self.element_id, 'frames': self.frames,
+                'positions': self.positions, 'params': [t.to_dict() for t in self.tracks],
+                'display': self.display, 'values': self.values}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+
+def linear_positions(frames):
+    return [i / float(frames - 1) for i in range(frames)]
+
+
+def element_id_value(element_id):
+    """Integer value of an ElementId (Value in Revit 2024+, IntegerValue before)"""
+    value = getattr(element_id, 'Value', None)
+    if value is None:
+        value = element_id.IntegerValue
+    return int(value)
+
+
+def round_to(value, accuracy):
+    """``value`` rounded to a multiple of ``accuracy`` (unchanged when None)"""
+    if not accuracy:
+        return value
+    return round(value / accuracy) * accuracy
+
+
+def display_accuracy(doc, param):
+    """Rounding step of the parameter's display format in the document's
+    units (FormatOptions.Accuracy), or None when it can't be read"""
+    try:
+        units = doc.GetUnits()
+    except Exception:
+        return None
+    try:
+        options = units.GetFormatOptions(param.Definition.GetDataType())  # Revit 2022+: ForgeTypeId spec
+    except Exception:
+        try:
+            options = units.GetFormatOptions(param.Definition.UnitType)  # older API: UnitType
+        except Exception:
+            return None
+    try:
+        accuracy = float(options.Accuracy)
+    except Exception:
+        return None
+    return accuracy if accuracy > 0 else None
+
+
+def resolve_unit(db, param):
+    """Returns (strategy, unit) for a Parameter, probing the API once"""
+    try:
+        unit = param.GetUnitTypeId()
+        db.UnitUtils.ConvertToInternalUnits(1.0, unit)
+        return STRATEGY_UNIT_TYPE_ID, unit
+    except Exception:
+        pass
+    try:
+        unit = param.DisplayUnitType
+        db.UnitUtils.ConvertToInternalUnits(1.0, unit)
+        return STRATEGY_DISPLAY_UNIT_TYPE, unit
+    except Exception:
+        return STRATEGY_RAW, None
+
+
+def converter(db, strategy, unit):
+    """Display -> internal value function for a resolved (strategy, unit)"""
+    if strategy == STRATEGY_RAW:
+        return lambda v: v
+    return lambda v: db.UnitUtils.ConvertToInternalUnits(v, unit)
+
+
+def resolve_conversion(db, param):
+    """Returns (strategy, to_internal) for a Parameter, probing the API once"""
+    strategy, unit = resolve_unit(db, param)
+    return strategy, converter(db, strategy, unit)
+
+
+def build_plan(db, doc, instance, is_instance, param_settings, frames, log=None, positions=None):
+    """Resolves the target elements and parameters and precomputes all frames.
+
+    ``instance`` is one FamilyInstance or a list of instances / Targets; the
+    plan's element_id is then the list of target ids (cache keys include it).
+    ``param_settings`` items need Name, MinValue and MaxValue (as in ParamSetting);
+    a cached ``Descriptor`` (paramschema.ParamDescriptor) skips the unit probe
+    on targets of the family type it was read from.
+    Parameters that can't be found on the element are skipped with a log line;
+    raises ValueError when none is found at all.
+    ``positions`` replaces the ``frames`` evenly spaced frame positions.
+    """
+    targets = as_targets(instance)
+    element_ids = []
+    tracks = []
+    for target in targets:
+        target_id = target.instance.Id if is_instance else target.instance.Symbol.Id
+        element_id = element_id_value(target_id)
+        if element_id in element_ids:
+            if log:
+                log('Element {} is already animated (shared type), skipping'.format(element_id))
+            continue
+        element_ids.append(element_id)
+        elem = doc.GetElement(target_id)
+        symbol_id = element_id_value(target.instance.Symbol.Id)
+        for setting in param_settings:
+            param = elem.LookupParameter(setting.Name)
+            if param is None:
+                if log:
+                    log('Parameter {} not found on element {}, skipping'.format(setting.Name, element_id))
+                continue
+            # a descriptor's unit is only valid on the type it was read from
+            descriptor = getattr(setting, 'Descriptor', None)
+            if descriptor is not None and descriptor.symbol_id == symbol_id:
+                strategy, to_internal = descriptor.strategy, converter(db, descriptor.strategy, descriptor.unit)
+            else:
+                strategy, to_internal = resolve_conversion(db, param)
+            # raw values are internal units; the display accuracy doesn't apply to them
+            accuracy = display_accuracy(doc, param) if strategy != STRATEGY_RAW else None
+            tracks.append(ParamTrack(setting.Name, param, float(setting.MinValue),
+                                     float(setting.MaxValue), strategy, to_internal,
+                                     element_id, target.phase, accuracy))
+            if log:
+                log('Parameter {}: {} -> {} ({}{}){}'.format(
+                    setting.Name, setting.MinValue, setting.MaxValue, strategy,
+                    ', accuracy {:g}'.format(accuracy) if accuracy else '',
+                    ' on {} (phase {})'.format(element_id, target.phase) if len(targets) > 1 else ''))
+    if not tracks:
+        raise ValueError('None of the parameters {} was found on element {}'.format(
+            ', '.join(s.Name for s in param_settings), ', '.join(str(i) for i in element_ids)))
+    if len(targets) > 1 and log:
+        log('Multi-target plan: {} elements, {} parameter tracks, one transaction per frame'.format(
+            len(element_ids), len(tracks)))
+    return FramePlan(element_ids[0] if len(targets) == 1 else element_ids, frames, tracks, positions,
+                     is_instance)
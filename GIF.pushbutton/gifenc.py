@@ -0,0 +1,773 @@
+# -*- coding: utf-8 -*-
+"""Streaming GIF89a encoder.
+
+Frames are read, quantized, LZW-compressed and written one at a time, so
+peak memory stays at roughly one decoded frame however long the animation
+is. Pure Python with an optional NumPy fast path; no System.Drawing needed.
+Runs of identical frames can be collapsed into one image whose delay is the
+sum of theirs. The NETSCAPE2.0 loop block is written with the header.
+"""
+import hashlib
+import io
+import os
+import struct
+import threading
+from collections import deque
+from operator import add
+
+import pngio
+import quantize
+import tracing
+
+np = pngio.np
+
+DEFAULT_DELAY_CS = 10  # 1/100 s per frame when no timing is given
+MIN_DELAY_CS = 2  # browsers replace shorter delays with 10
+MAX_DELAY_CS = 0xFFFF
+TRANSPARENT_INDEX = 255  # palette slot kept free for delta frames
+PARALLEL_MEMORY = 1 << 30  # bytes of decoded frames the worker pool may hold at once
+
+# GIF disposal methods
+DISPOSE_NONE = 0
+DISPOSE_KEEP = 1
+
+
+# ------------------------------ palette ------------------------------
+def websafe_palette():
+    """6x6x6 RGB cube (216 colors) as a flat list of RGB byte values"""
+    levels = [0, 51, 102, 153, 204, 255]
+    pal = bytearray()
+    for r in levels:
+        for g in levels:
+            for b in levels:
+                pal += bytearray((r, g, b))
+    return pal
+
+
+_CUBE_LUT = [((v * 6) >> 8) for v in range(256)]  # channel value -> 0..5
+
+
+def quantize_websafe(frame):
+    """Maps a Frame onto websafe_palette(); returns one index byte per pixel"""
+    if np is not None and not isinstance(frame.pixels, bytearray):
+        lut = np.array(_CUBE_LUT, dtype=np.uint8)
+        px = frame.pixels
+        idx = lut[px[:, :, 0]] * 36 + lut[px[:, :, 1]] * 6 + lut[px[:, :, 2]]
+        return bytearray(idx.astype(np.uint8).tobytes())
+    rgb = frame.rgb_bytes()
+    r = rgb[0::3].translate(bytes(bytearray(36 * v for v in _CUBE_LUT)))
+    g = rgb[1::3].translate(bytes(bytearray(6 * v for v in _CUBE_LUT)))
+    b = rgb[2::3].translate(bytes(bytearray(_CUBE_LUT)))
+    return bytearray(map(add, map(add, bytearray(r), bytearray(g)), bytearray(b)))
+
+
+# -------------------------------- LZW --------------------------------
+def lzw_encode(indices, min_code_size=8):
+    """GIF-flavoured variable-length LZW; returns the packed code stream"""
+    clear = 1 << min_code_size
+    eoi = clear + 1
+    out = bytearray()
+    bitbuf = 0
+    nbits = 0
+    code_size = min_code_size + 1
+    next_code = eoi + 1
+    table = {}
+
+    # emit clear code first
+    bitbuf |= clear << nbits
+    nbits += code_size
+
+    n = len(indices)
+    if n == 0:
+        prefix = None
+    else:
+        prefix = indices[0]
+    i = 1
+    while i < n:
+        c = indices[i]
+        i += 1
+        key = (prefix << 8) | c
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        bitbuf |= prefix << nbits
+        nbits += code_size
+        while nbits >= 8:
+            out.append(bitbuf & 0xFF)
+            bitbuf >>= 8
+            nbits -= 8
+        if next_code < 4096:
+            if next_code == (1 << code_size):
+                code_size += 1
+            table[key] = next_code
+            next_code += 1
+        else:
+            bitbuf |= clear << nbits
+            nbits += code_size
+            table = {}
+            next_code = eoi + 1
+            code_size = min_code_size + 1
+        prefix = c
+
+    if prefix is not None:
+        bitbuf |= prefix << nbits
+        nbits += code_size
+        # the decoder adds an entry after this code, which may widen codes
+        if next_code < 4096 and next_code == (1 << code_size):
+            code_size += 1
+    bitbuf |= eoi << nbits
+    nbits += code_size
+    while nbits > 0:
+        out.append(bitbuf & 0xFF)
+        bitbuf >>= 8
+        nbits -= 8
+    return out
+
+
+def _write_sub_blocks(f, data):
+    for pos in range(0, len(data), 255):
+        chunk = data[pos:pos + 255]
+        f.write(bytearray((len(chunk),)))
+        f.write(chunk)
+    f.write(b'\x00')
+
+
+# ------------------------------ writer -------------------------------
+class GifWriter(object):
+    """Writes a GIF89a file frame by frame to an open binary stream"""
+
+    def __init__(self, stream, width, height, palette=None, collapse=False, loop_count=None,
+                 transparent=False):
+        self.stream = stream
+        self.width = width
+        self.height = height
+        # delta frames use TRANSPARENT_INDEX, which must lie inside the color table
+        self.palette = _pad_palette(palette if palette is not None else websafe_palette(),
+                                    TRANSPARENT_INDEX + 1 if transparent else 2)
+        self.collapse = collapse
+        self.loop_count = loop_count  # None = play once, 0 = forever
+        self.frame_count = 0
+        self.merged = 0
+        self.block_spans = []  # (stream offset, length) of every frame block written
+        self._pending = None  # block held back while its delay may still grow
+        self._pending_delay = 0
+        self._pending_digest = None
+        self._write_header()
+
+    def _write_header(self):
+        f = self.stream
+        f.write(b'GIF89a')
+        size_bits = _table_size_bits(self.palette)
+        # global color table present, 8 bits color resolution
+        packed = 0x80 | (7 << 4) | size_bits
+        f.write(struct.pack('<HHBBB', self.width, self.height, packed, 0, 0))
+        f.write(self.palette)
+        if self.loop_count is not None:
+            f.write(loop_extension(self.loop_count))
+
+    def add_frame(self, indices, delay_cs=DEFAULT_DELAY_CS, rect=None,
+                  transparent=None, disposal=DISPOSE_NONE):
+        """Appends one frame given as palette index bytes (see encode_frame)"""
+        self.add_block(encode_frame(indices, (self.width, self.height), delay_cs,
+                                    rect, transparent, disposal))
+
+    def add_block(self, block, digest=None):
+        """Appends a frame already encoded by encode_frame.
+
+        With ``collapse``, a block whose ``digest`` (see frame_digest) equals
+        the previous one is dropped and its delay added to the held-back
+        previous frame instead. Either way the frame's image ends up in
+        block ``frame_count - 1`` (see read_block).
+        """
+        if not self.collapse:
+            self._write_block(block)
+            self.frame_count += 1
+            return
+        delay = block_delay(block)
+        if (digest is not None and digest == self._pending_digest and
+                self._pending_delay + delay <= MAX_DELAY_CS):
+            self._pending_delay += delay
+            self.merged += 1
+            return
+        self._flush_pending()
+        self._pending = block
+        self._pending_delay = delay
+        self._pending_digest = digest
+        self.frame_count += 1
+
+    def _flush_pending(self):
+        if self._pending is not None:
+            self._write_block(with_delay(self._pending, self._pending_delay))
+            self._pending = None
+
+    def _write_block(self, block):
+        self.block_spans.append((self.stream.tell(), len(block)))
+        self.stream.write(block)
+
+    def read_block(self, index):
+        """Frame block ``index`` as written (the stream must be readable and
+        seekable), so frames can be repeated without keeping them in memory"""
+        if index == len(self.block_spans) and self._pending is not None:
+            return self._pending
+        offset, length = self.block_spans[index]
+        end = self.stream.tell()
+        self.stream.seek(offset)
+        block = self.stream.read(length)
+        self.stream.seek(end)
+        return block
+
+    def close(self):
+        self._flush_pending()
+        self.stream.write(b'\x3B')
+
+
+def encode_frame(indices, canvas_size, delay_cs=DEFAULT_DELAY_CS, rect=None,
+                 transparent=None, disposal=DISPOSE_NONE):
+    """Graphic control extension, image descriptor and LZW data of one frame.
+
+    ``rect`` is (left, top, width, height) for a sub-image; the full
+    canvas is used when omitted.
+    """
+    f = io.BytesIO()
+    left, top, width, height = rect or (0, 0) + tuple(canvas_size)
+    packed = (disposal << 2) | (1 if transparent is not None else 0)
+    f.write(struct.pack('<BBBBHBB', 0x21, 0xF9, 4, packed, int(delay_cs),
+                        transparent or 0, 0))
+    f.write(struct.pack('<BHHHHB', 0x2C, left, top, width, height, 0))
+    f.write(b'\x08')
+    _write_sub_blocks(f, lzw_encode(indices, 8))
+    return f.getvalue()
+
+
+def block_delay(block):
+    """Delay in 1/100 s stored in an encoded frame's graphic control extension"""
+    return struct.unpack('<H', bytes(block[4:6]))[0]
+
+
+def with_delay(block, delay_cs):
+    """Copy of an encoded frame with its delay replaced"""
+    return block[:4] + struct.pack('<H', int(delay_cs)) + block[6:]
+
+
+def frame_digest(indices):
+    """Hash of a frame's full palette indices, used to spot repeated frames"""
+    return hashlib.sha1(bytes(indices)).digest()
+
+
+def frame_delays(count, fps=None, times=None):
+    """Per-frame delays in 1/100 s for ``count`` frames played at ``fps``.
+
+    GIF delays are whole centiseconds, so they are rounded cumulatively
+    (e.g. 30 fps gives 3, 4, 3, 3, 4, 3...) and the total stays on time;
+    above 50 fps delays are held at MIN_DELAY_CS, which browsers respect.
+    Without fps every frame lasts DEFAULT_DELAY_CS. ``times`` gives each
+    frame's start in frame steps (e.g. 0, 1, 4.5, 5) for unevenly sampled
+    frames; the last frame lasts one step.
+    """
+    step = 100.0 / fps if fps else float(DEFAULT_DELAY_CS)
+    if times is None:
+        times = range(count + 1)
+    else:
+        times = list(times)[:count]
+        times.append(times[-1] + 1 if times else 1)
+    stamps = [int(round(step * t)) for t in times]
+    return [max(MIN_DELAY_CS, b - a) for a, b in zip(stamps, stamps[1:])]
+
+
+def pingpong_order(items):
+    """Forward, then back without repeating the turning points: a b c d -> a b c d c b"""
+    items = list(items)
+    return items + items[-2:0:-1]
+
+
+def pingpong_delays(delays):
+    """Delays for pingpong_order(frames) from the forward delays: on the way back
+    frame k shows for the step between k - 1 and k, so both trips take as long"""
+    delays = list(delays)
+    if len(delays) < 3:
+        return delays
+    return delays[:-1] + [delays[-2]] + [delays[k - 1] for k in range(len(delays) - 2, 0, -1)]
+
+
+def _delay_at(delay_cs, i):
+    if isinstance(delay_cs, (list, tuple)):
+        return delay_cs[i] if i < len(delay_cs) else delay_cs[-1]
+    return delay_cs
+
+
+def changed_rect(prev, cur, width, height):
+    """Bounding box (left, top, width, height) of differing indices, or None"""
+    if np is not None:
+        diff = (np.frombuffer(prev, dtype=np.uint8) != np.frombuffer(cur, dtype=np.uint8))
+        diff = diff.reshape(height, width)
+        rows = np.flatnonzero(diff.any(axis=1))
+        if not rows.size:
+            return None
+        cols = np.flatnonzero(diff.any(axis=0))
+        return (int(cols[0]), int(rows[0]),
+                int(cols[-1] - cols[0] + 1), int(rows[-1] - rows[0] + 1))
+    # compare whole rows as slices, then bisect for the column extent
+    changed = [y for y in range(height)
+               if prev[y * width:(y + 1) * width] != cur[y * width:(y + 1) * width]]
+    if not changed:
+        return None
+    left, right = width, 0
+    for y in changed:
+        a = prev[y * width:(y + 1) * width]
+        b = cur[y * width:(y + 1) * width]
+        if a[:left] != b[:left]:
+            left = _bisect_mismatch(a, b, left)
+        if a[right:] != b[right:]:
+            right = width - _bisect_mismatch(a[::-1], b[::-1], width - right)
+    return left, changed[0], right - left, changed[-1] - changed[0] + 1
+
+
+def _bisect_mismatch(a, b, hi):
+    """Index of the first differing byte, known to lie below ``hi``"""
+    lo = 0
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if a[:mid + 1] == b[:mid + 1]:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def delta_indices(prev, cur, width, rect, transparent=TRANSPARENT_INDEX):
+    """Crops ``cur`` to rect, marking pixels equal to ``prev`` as transparent"""
+    left, top, w, h = rect
+    if np is not None:
+        a = np.frombuffer(prev, dtype=np.uint8).reshape(-1, width)[top:top + h, left:left + w]
+        b = np.frombuffer(cur, dtype=np.uint8).reshape(-1, width)[top:top + h, left:left + w]
+        return bytearray(np.where(a == b, np.uint8(transparent), b).astype(np.uint8).tobytes())
+    out = bytearray()
+    clear_row = bytearray((transparent,)) * w
+    for y in range(top, top + h):
+        a = prev[y * width + left:y * width + left + w]
+        b = cur[y * width + left:y * width + left + w]
+        if a == b:
+            out += clear_row
+        else:
+            out += bytearray(map(lambda p, c: transparent if p == c else c, a, b))
+    return out
+
+
+def _table_size_bits(palette):
+    entries = len(palette) // 3
+    bits = 0
+    while (2 << bits) < entries:
+        bits += 1
+    return bits
+
+
+def _pad_palette(palette, min_entries=2):
+    pal = bytearray(palette)
+    entries = max(min_entries, len(pal) // 3)
+    size = 2
+    while size < entries:
+        size *= 2
+    if size > 256:
+        raise ValueError('GIF palettes hold at most 256 colors')
+    return pal + bytearray(size * 3 - len(pal))
+
+
+# ---------------------------- loop extension ---------------------------
+def loop_extension(loop_count=0):
+    """NETSCAPE2.0 application extension; loop_count 0 means forever"""
+    return (b'\x21\xFF\x0BNETSCAPE2.0\x03\x01' +
+            struct.pack('<H', int(loop_count)) + b'\x00')
+
+
+# --------------------------- frame streaming --------------------------
+def build_global_palette(paths, load_frame=None, log=None):
+    """Samples every frame (one at a time) and median-cuts a shared palette"""
+    load_frame = load_frame or pngio.read_png
+    hist = quantize.ColorHistogram()
+    for path in paths:
+        hist.add(load_frame(path))
+    palette = quantize.median_cut(hist.cells(), quantize.MAX_COLORS)
+    if log:
+        log('Global palette: {} colors from {} frames'.format(len(palette) // 3, len(paths)))
+    return palette
+
+
+def parallel_workers(paths, workers, budget=PARALLEL_MEMORY):
+    """``workers`` capped so the frames in flight fit ``budget`` bytes.
+
+    Each of the 2 * workers queued jobs holds up to two decoded frames (RGB
+    plus palette indices) at the first PNG's size, before any downsampling.
+    Files whose size can't be read leave ``workers`` as is.
+    """
+    if workers <= 1 or not paths:
+        return workers
+    try:
+        width, height = pngio.read_header(paths[0])[:2]
+    except (IOError, OSError, ValueError):
+        return workers
+    return max(1, min(workers, budget // (2 * 2 * 4 * width * height)))
+
+
+def encode_gif(paths, out_path, delay_cs=DEFAULT_DELAY_CS, load_frame=None, log=None,
+               delta=False, palette=None, dither=None, workers=1, pool='process',
+               collapse=False, pingpong=False, loop_count=None, tracer=tracing.NULL_TRACER):
+    """Encodes image files into ``out_path`` holding one frame in memory at a time.
+
+    ``load_frame(path)`` must return a pngio.Frame; defaults to pngio.read_png.
+    With ``delta`` every frame after the first stores only the rectangle that
+    changed, with unchanged pixels transparent over the kept previous frame.
+    ``palette`` (at most 255 colors) is written once as the global color
+    table and frames are mapped to it with the given ``dither`` mode;
+    without it the fixed web-safe cube is used.
+    With ``workers`` > 1 frames are quantized and compressed in a ``pool``
+    ('process' or 'thread') and appended in order by this single writer;
+    the output is byte-identical to the serial path. Workers are capped so
+    the decoded frames in flight stay within PARALLEL_MEMORY (see
+    parallel_workers).
+    ``delay_cs`` is one delay for all frames or a per-frame list (see
+    frame_delays). With ``collapse`` consecutive identical frames become a
+    single image showing for their combined delay. ``tracer`` records
+    'decode', 'quantize' and 'compress' spans per frame, on the worker
+    threads (or one track per worker process) when workers run them, and
+    'gif_append' for the in-order write (with workers: wait and write).
+    With ``pingpong`` the frames play forward, then back (see pingpong_order);
+    ``delay_cs`` still lists the forward delays. The return trip reads the
+    forward blocks back from the output file and writes them again with new
+    delays, without decoding or compressing; delta frames differ on the way
+    back, so in delta mode the return trip is decoded and encoded again.
+    ``loop_count`` (0 = forever) writes the loop block with the header.
+    Returns the number of frames written. Raises ValueError on size mismatch.
+    """
+    kept = None  # (digest, block index) of the forward frames, for the return trip
+    if pingpong and len(paths) > 2:
+        if isinstance(delay_cs, (list, tuple)):
+            delay_cs = pingpong_delays(delay_cs)
+        if delta:
+            paths = pingpong_order(paths)
+            if log:
+                log('Ping-pong: delta frames are encoded again for the return trip')
+        else:
+            kept = []
+    if workers > 1 and len(paths) > 1:
+        capped = parallel_workers(paths, workers)
+        if capped < workers and log:
+            log('Encoder workers capped at {} so decoded frames fit in {} MB'.format(
+                capped, PARALLEL_MEMORY >> 20))
+        workers = capped
+    if workers > 1 and len(paths) > 1:
+        traced = not isinstance(tracer, tracing.NullTracer)
+        jobs = [(path, paths[i - 1] if delta and i else None, palette, dither, delta,
+                 _delay_at(delay_cs, i), load_frame, i, traced) for i, path in enumerate(paths)]
+        blocks = _parallel_blocks(jobs, workers, pool, tracer)
+    else:
+        blocks = _serial_blocks(paths, load_frame, palette, dither, delta, delay_cs, tracer)
+    mapper_palette = _get_mapper(palette, dither).palette if palette is not None else None
+    writer = None
+    with io.open(out_path, 'wb' if kept is None else 'w+b', buffering=1 << 20) as f:
+        for i, (size, digest, block) in enumerate(blocks):
+            if writer is None:
+                writer = GifWriter(f, size[0], size[1], mapper_palette, collapse, loop_count, delta)
+                if log:
+                    log('First image size: {}x{}'.format(size[0], size[1]))
+            elif size != (writer.width, writer.height):
+                raise ValueError('All frames must have the same size! {} is {}x{}'.format(
+                    paths[i], size[0], size[1]))
+            writer.add_block(block, digest)
+            if kept is not None:
+                kept.append((digest, writer.frame_count - 1))
+            if log and (i + 1) % 10 == 0:
+                log('Added frame {} to GIF'.format(i + 1))
+        if kept:
+            n = len(kept)
+            for k in range(n - 2, 0, -1):
+                digest, index = kept[k]
+                block = with_delay(writer.read_block(index), _delay_at(delay_cs, 2 * n - 2 - k))
+                writer.add_block(block, digest)
+            if log:
+                log('Ping-pong: {} return frames reuse the forward blocks'.format(n - 2))
+        if writer is not None:
+            writer.close()
+            if log and writer.merged:
+                log('Merged {} repeated frames into longer delays'.format(writer.merged))
+    return writer.frame_count if writer is not None else 0
+
+
+class GifStream(object):
+    """Appends frames to a GIF file as they become available.
+
+    Incremental counterpart of encode_gif for producers that deliver frames
+    over time. Without a palette, one is median-cut from the first frame.
+    """
+
+    def __init__(self, out_path, delay_cs=DEFAULT_DELAY_CS, delta=False, palette=None,
+                 dither=None, load_frame=None, collapse=False, loop_count=None,
+                 tracer=tracing.NULL_TRACER):
+        self.out_path = out_path
+        self.delay_cs = delay_cs
+        self.delta = delta
+        self.palette = palette
+        self.dither = dither
+        self.load_frame = load_frame or pngio.read_png
+        self.collapse = collapse
+        self.loop_count = loop_count
+        self.tracer = tracer
+        self.frames_added = 0
+        self._file = io.open(out_path, 'wb', buffering=1 << 20)
+        self._writer = None
+        self._mapper = None
+        self._prev = None
+
+    @property
+    def frame_count(self):
+        return self._writer.frame_count if self._writer is not None else 0
+
+    @property
+    def merged(self):
+        return self._writer.merged if self._writer is not None else 0
+
+    def add_path(self, path):
+        with self.tracer.span('decode', frame=self.frames_added):
+            frame = self.load_frame(path)
+        self.add_frame(frame, path)
+
+    def add_frame(self, frame, name=None):
+        size = (frame.width, frame.height)
+        if self._writer is None:
+            if self.palette is None:
+                self.palette = quantize.build_palette([frame])
+            self._mapper = _get_mapper(self.palette, self.dither)
+            self._writer = GifWriter(self._file, size[0], size[1], self._mapper.palette,
+                                     self.collapse, self.loop_count, self.delta)
+        elif size != (self._writer.width, self._writer.height):
+            raise ValueError('All frames must have the same size! {} is {}x{}'.format(
+                name or 'frame {}'.format(self.frame_count), size[0], size[1]))
+        i = self.frames_added
+        with self.tracer.span('gif_append', frame=i):
+            with self.tracer.span('quantize', frame=i):
+                indices = _quantize(frame, self._mapper)
+            del frame
+            with self.tracer.span('compress', frame=i):
+                block = _frame_block(self._prev, indices, size, self.delta, _delay_at(self.delay_cs, i))
+            self._writer.add_block(block, frame_digest(indices) if self.collapse else None)
+        self._prev = indices if self.delta else None
+        self.frames_added += 1
+
+    def close(self):
+        """Writes the trailer; returns the number of frames"""
+        if self._writer is not None:
+            self._writer.close()
+        self._file.close()
+        return self.frame_count
+
+    def discard(self):
+        """Closes and deletes a partially written file"""
+        self._file.close()
+        if os.path.exists(self.out_path):
+            os.remove(self.out_path)
+
+
+def _serial_blocks(paths, load_frame, palette, dither, delta, delay_cs, tracer=tracing.NULL_TRACER):
+    load_frame = load_frame or pngio.read_png
+    mapper = _get_mapper(palette, dither)
+    prev = None
+    for i, path in enumerate(paths):
+        with tracer.span('decode', frame=i):
+            frame = load_frame(path)
+        size = (frame.width, frame.height)
+        with tracer.span('gif_append', frame=i):
+            with tracer.span('quantize', frame=i):
+                indices = _quantize(frame, mapper)
+            del frame
+            with tracer.span('compress', frame=i):
+                block = _frame_block(prev, indices, size, delta, _delay_at(delay_cs, i))
+            digest = frame_digest(indices)
+        yield size, digest, block
+        prev = indices if delta else None
+        del indices
+
+
+def _encode_job(job):
+    """Worker entry point: decodes, quantizes and compresses one frame.
+
+    Returns (size, digest, block, spans); ``spans`` holds the worker's
+    (process id, events, threads) when the job is traced, else None.
+    """
+    path, prev_path, palette, dither, delta, delay_cs, load_frame, i, traced = job
+    tracer = tracing.Tracer() if traced else tracing.NULL_TRACER
+    load_frame = load_frame or pngio.read_png
+    mapper = _get_mapper(palette, dither)
+    with tracer.span('decode', frame=i):
+        frame = load_frame(path)
+    size = (frame.width, frame.height)
+    with tracer.span('quantize', frame=i):
+        indices = _quantize(frame, mapper)
+    del frame
+    prev = None
+    if prev_path is not None:
+        # delta frames need the previous frame's indices as well
+        with tracer.span('decode', frame=i - 1):
+            prev_frame = load_frame(prev_path)
+        if (prev_frame.width, prev_frame.height) != size:
+            raise ValueError('All frames must have the same size! {} is {}x{}'.format(
+                path, size[0], size[1]))
+        with tracer.span('quantize', frame=i - 1):
+            prev = _quantize(prev_frame, mapper)
+        del prev_frame
+    with tracer.span('compress', frame=i):
+        block = _frame_block(prev, indices, size, delta, delay_cs)
+    spans = (os.getpid(), tracer.events, tracer.threads) if traced else None
+    return size, frame_digest(indices), block, spans
+
+
+def _frame_block(prev, indices, size, delta, delay_cs):
+    if not delta:
+        return encode_frame(indices, size, delay_cs)
+    if prev is None:
+        return encode_frame(indices, size, delay_cs, disposal=DISPOSE_KEEP)
+    if len(prev) != len(indices):
+        raise ValueError('All frames must have the same size!')
+    rect = changed_rect(prev, indices, size[0], size[1])
+    if rect is None:
+        # nothing changed: a single transparent pixel keeps the timing
+        rect = (0, 0, 1, 1)
+        sub = bytearray((TRANSPARENT_INDEX,))
+    else:
+        sub = delta_indices(prev, indices, size[0], rect)
+    return encode_frame(sub, size, delay_cs, rect=rect, transparent=TRANSPARENT_INDEX,
+                        disposal=DISPOSE_KEEP)
+
+
+_MAPPERS = {}
+
+
+def _get_mapper(palette, dither):
+    """PaletteMapper shared per process, so workers build the lookup cube once"""
+    if palette is None:
+        return None
+    key = (bytes(palette), dither)
+    mapper = _MAPPERS.get(key)
+    if mapper is None:
+        if len(_MAPPERS) >= 4:
+            _MAPPERS.clear()
+        mapper = _MAPPERS[key] = quantize.PaletteMapper(palette, dither)
+    return mapper
+
+
+def _quantize(frame, mapper):
+    return mapper.map(frame) if mapper else quantize_websafe(frame)
+
+
+# ---------------------------- worker pools ----------------------------
+def _parallel_blocks(jobs, workers, pool, tracer=tracing.NULL_TRACER):
+    """Runs _encode_job over jobs, yielding results in order.
+
+    At most 2 * workers jobs are in flight, so memory stays bounded.
+    """
+    if pool == 'process':
+        import multiprocessing
+        executor = multiprocessing.Pool(workers)
+    else:
+        executor = ThreadPool(workers)
+    pending = deque()
+    done = [0]
+
+    def next_result():
+        with tracer.span('gif_append', frame=done[0]):
+            size, digest, block, spans = pending.popleft().get()
+        done[0] += 1
+        if spans is not None:
+            tracer.merge(*_worker_spans(spans, pool))
+        return size, digest, block
+    try:
+        for job in jobs:
+            pending.append(executor.apply_async(_encode_job, (job,)))
+            if len(pending) >= 2 * workers:
+                yield next_result()
+        while pending:
+            yield next_result()
+        executor.close()
+    finally:
+        executor.terminate()
+        executor.join()
+
+
+def _worker_spans(spans, pool):
+    """A job's (events, threads); events from worker processes go on one
+    track per process, as their thread ids may repeat the parent's"""
+    pid, events, threads = spans
+    if pool != 'process':
+        return events, threads
+    return ([(name, start, end, pid, args) for name, start, end, _, args in events],
+            {pid: 'encoder process {}'.format(pid)})
+
+
+class ThreadPool(object):
+    """Minimal apply_async pool on plain threads.
+
+    IronPython has no multiprocessing but also no GIL, so threads give real
+    parallelism inside Revit.
+    """
+
+    def __init__(self, workers):
+        self._tasks = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._run, name='gif encoder {}'.format(k + 1))
+                         for k in range(workers)]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    def apply_async(self, fn, args=()):
+        result = _AsyncResult()
+        with self._cond:
+            if self._closed:
+                raise ValueError('Pool is closed')
+            self._tasks.append((fn, args, result))
+            self._cond.notify()
+        return result
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._tasks and not self._closed:
+                    self._cond.wait()
+                if not self._tasks:
+                    return
+                fn, args, result = self._tasks.popleft()
+            try:
+                result._set(fn(*args), None)
+            except Exception as e:
+                result._set(None, e)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def terminate(self):
+        with self._cond:
+            self._tasks.clear()
+        self.close()
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+
+
+class _AsyncResult(object):
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def _set(self, value, error):
+        self._value, self._error = value, error
+        self._event.set()
+
+    def get(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
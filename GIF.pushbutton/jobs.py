@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""Batch job runner: many animations from one JSON job file, no dialog.
+
+A job file holds optional ``defaults`` merged into every entry of ``jobs``
+(or is just a list of jobs)::
+
+    {
+      "defaults": {"folder": "renders", "dpi": 300, "pixel_size": 2048,
+                   "gif": {"loop": 0, "delta": true}},
+      "jobs": [
+        {"name": "door-swing", "element_id": 123456, "view": "3D - Doors",
+         "frames": 24, "params": [{"name": "Swing", "min": 0, "max": 90}]},
+        {"name": "window", "element_id": 987654, "instance": false,
+         "duration": 2, "fps": 12,
+         "params": [{"name": "Height", "min": 900, "max": 1500}]}
+      ]
+    }
+
+``element_id`` may be a list to animate several elements in one pass
+(multi-target), with ``"phases": [...]`` (fractions of the timeline, one
+per element) or ``"phase_step": 0.1`` (element k lags k * step);
+``view`` is a view name or element id (default: the active view), or a
+list of them: each frame is then regenerated once and exported to every
+view, with frames and a GIF per view in <folder>/<view name> (<id>)/;
+``"adaptive": true`` treats the frame count as a budget (see adaptive.py);
+``"auto_crop": true`` exports only the region the elements sweep through;
+each job's parameter writes are rolled back when it ends (the model is
+left as it was), ``"keep_changes": true`` keeps them as one undo entry;
+``folder`` defaults to <defaults folder>/<job name>, relative paths are
+taken from the job file's folder; ``"gif": false`` skips the GIF and
+``"gif": {"width": 800}`` downsamples frames to that width before encoding
+(default: export size); ``"apng": true`` also writes a lossless
+animation.apng from the PNG data (see apng.py); ``"pingpong": true``
+plays GIF and APNG forward, then back, from the frames of one sweep. Jobs run
+back to back through animator.run_animation; a failing job is recorded
+and the queue moves on.
+"""
+import json
+import math
+import os
+import time
+
+import adaptive
+import animator
+import apng
+import frameplan
+import gifenc
+import logsink
+import quantize
+import resample
+import tracing
+
+STATUS_OK = 'ok'
+STATUS_FAILED = 'failed'
+
+DEFAULT_GIF = {'loop': 0, 'delta': True, 'dither': quantize.DITHER_NONE, 'workers': 1,
+               'collapse': True, 'width': None}
+
+
+class ParamRange(object):
+    """Parameter range with the attribute names frameplan expects (as in ParamSetting)"""
+
+    def __init__(self, name, min_value, max_value):
+        self.Name = name
+        self.MinValue = min_value
+        self.MaxValue = max_value
+
+
+class Job(object):
+    """One validated entry of a job file"""
+
+    def __init__(self, name, element_id, is_instance, view, frames, fps, params, folder,
+                 export, reuse_frames, gif, adaptive=False, apng=False, phases=None,
+                 auto_crop=False, keep_changes=False, pingpong=False):
+        self.name = name
+        self.element_id = element_id  # int, or a list for multi-target jobs
+        self.phases = phases
+        self.is_instance = is_instance
+        self.view = view
+        self.frames = frames
+        self.fps = fps
+        self.params = params
+        self.folder = folder
+        self.export = export
+        self.reuse_frames = reuse_frames
+        self.gif = gif
+        self.adaptive = adaptive
+        self.auto_crop = auto_crop
+        self.keep_changes = keep_changes
+        self.pingpong = pingpong
+        self.apng = apng
+
+    @classmethod
+    def from_dict(cls, spec, base_dir='', index=0):
+        """Builds a Job from a merged spec; raises ValueError on bad input"""
+        name = spec.get('name') or 'job_{:03d}'.format(index + 1)
+        try:
+            ids = spec['element_id']
+            element_id = [int(v) for v in ids] if isinstance(ids, list) else int(ids)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Job {}: element_id is required'.format(name))
+        if element_id == []:
+            raise ValueError('Job {}: element_id is required'.format(name))
+        phases = spec.get('phases')
+        if phases is None and 'phase_step' in spec:
+            step = _number(spec, 'phase_step', name)
+            phases = [(k * step) % 1.0 for k in range(len(element_id) if isinstance(element_id, list) else 1)]
+        if phases is not None:
+            try:
+                phases = [float(p) for p in phases]
+            except (TypeError, ValueError):
+                raise ValueError('Job {}: phases must be numbers'.format(name))
+            if len(phases) != (len(element_id) if isinstance(element_id, list) else 1):
+                raise ValueError('Job {}: phases need one value per element'.format(name))
+        fps = None
+        if 'duration' in spec or 'fps' in spec:
+            duration, fps = _number(spec, 'duration', name), _number(spec, 'fps', name)
+            if duration <= 0 or fps <= 0:
+                raise ValueError('Job {}: invalid duration or FPS'.format(name))
+            frames = int(math.ceil(duration * fps))
+        else:
+            frames = int(_number(spec, 'frames', name))
+        if frames < 2:
+            raise ValueError('Job {}: invalid number of frames'.format(name))
+        params = []
+        for p in spec.get('params') or []:
+            lo, hi = _number(p, 'min', name), _number(p, 'max', name)
+            if not p.get('name') or lo == hi:
+                raise ValueError('Job {}: invalid values for parameter {}'.format(name, p.get('name')))
+            params.append(ParamRange(p['name'], lo, hi))
+        if not params:
+            raise ValueError('Job {}: no parameters'.format(name))
+        folder = spec.get('job_folder') or os.path.join(spec.get('folder') or '', name)
+        export = {'dpi': int(spec.get('dpi', 300)), 'pixel_size': int(spec.get('pixel_size', 2048)),
+                  'scale': float(spec.get('scale', 1.0))}
+        gif = spec.get('gif', True)
+        if gif is not False:
+            gif = dict(DEFAULT_GIF, **(gif if isinstance(gif, dict) else {}))
+        return cls(name, element_id, bool(spec.get('instance', True)), spec.get('view'), frames,
+                   fps, params, os.path.join(base_dir, folder), export,
+                   bool(spec.get('reuse_frames', True)), gif, bool(spec.get('adaptive', False)),
+                   bool(spec.get('apng', False)), phases, bool(spec.get('auto_crop', False)),
+                   bool(spec.get('keep_changes', False)), bool(spec.get('pingpong', False)))
+
+
+class JobResult(object):
+    """Status and timing of one job"""
+
+    def __init__(self, name, status, seconds, frames=0, exported=0, reused=0, gif=None, error=None,
+                 apng=None):
+        self.name = name
+        self.status = status
+        self.seconds = seconds
+        self.frames = frames
+        self.exported = exported
+        self.reused = reused
+        self.gif = gif
+        self.apng = apng
+        self.error = error
+
+    def to_dict(self):
+        return {'name': self.name, 'status': self.status, 'seconds': round(self.seconds, 3),
+                'frames': self.frames, 'exported': self.exported, 'reused': self.reused,
+                'gif': self.gif, 'apng': self.apng, 'error': self.error}
+
+
+def _number(spec, key, name):
+    try:
+        return float(spec[key])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Job {}: {} must be a number'.format(name, key))
+
+
+def parse_jobs(data, base_dir=''):
+    """Job list from a decoded job file (dict with defaults/jobs, or a list)"""
+    if isinstance(data, list):
+        data = {'jobs': data}
+    defaults = data.get('defaults') or {}
+    jobs = []
+    for i, entry in enumerate(data.get('jobs') or []):
+        spec = dict(defaults, **entry)
+        if 'folder' in entry:
+            spec['job_folder'] = entry['folder']
+        if isinstance(defaults.get('gif'), dict) and isinstance(entry.get('gif'), dict):
+            spec['gif'] = dict(defaults['gif'], **entry['gif'])
+        jobs.append(Job.from_dict(spec, base_dir, i))
+    if not jobs:
+        raise ValueError('Job file lists no jobs')
+    return jobs
+
+
+def load_jobs(path):
+    """Reads and validates a JSON job file"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return parse_jobs(data, os.path.dirname(os.path.abspath(path)))
+
+
+def resolve_view(db, doc, view):
+    """View by element id or name; None means the active view.
+    A name shared by several views (e.g. a floor and a ceiling plan) is
+    rejected; those need the element id."""
+    if view is None:
+        return doc.ActiveView
+    if isinstance(view, int):
+        found = doc.GetElement(db.ElementId(view))
+    else:
+        named = [v for v in db.FilteredElementCollector(doc).OfClass(db.View)
+                 if v.Name == view and not v.IsTemplate]
+        if len(named) > 1:
+            raise ValueError('{} views are named {}, use the element id: {}'.format(
+                len(named), view, ', '.join(str(frameplan.element_id_value(v.Id)) for v in named)))
+        found = named[0] if named else None
+    if found is None:
+        raise ValueError('View not found: {}'.format(view))
+    return found
+
+
+def build_gif(paths, out_path, options, fps=None, load_frame=None, log=None, times=None,
+              tracer=tracing.NULL_TRACER, pingpong=False, frame_loader=None):
+    """Encodes frames into out_path with the job's GIF options; ``frame_loader(width)``
+    returns a load_frame that decodes at the GIF width (default: resample.scaled_loader)"""
+    if frame_loader is not None:
+        load_frame = frame_loader(options.get('width'))
+    else:
+        load_frame = resample.scaled_loader(options.get('width'), load_frame)
+    palette = gifenc.build_global_palette(paths, load_frame=load_frame, log=log)
+    count = gifenc.encode_gif(paths, out_path, delay_cs=gifenc.frame_delays(len(paths), fps, times),
+                              load_frame=load_frame, log=log, delta=options['delta'],
+                              palette=palette, dither=options['dither'],
+                              workers=int(options['workers']), pool='thread',
+                              collapse=options['collapse'], pingpong=pingpong,
+                              loop_count=None if options.get('loop') is None else int(options['loop']),
+                              tracer=tracer)
+    return count
+
+
+def run_job(db, doc, job, transaction=None, log=None, load_frame=None, frame_loader=None):
+    """Runs one job; returns a JobResult and lets errors propagate.
+
+    Stage spans are saved as trace.json in the job folder.
+    """
+    started = time.time()
+    tracer = tracing.Tracer()
+    ids = job.element_id if isinstance(job.element_id, list) else [job.element_id]
+    elements = []
+    for element_id in ids:
+        element = doc.GetElement(db.ElementId(element_id))
+        if element is None:
+            raise ValueError('Element {} not found'.format(element_id))
+        elements.append(element)
+    target = elements[0]
+    if job.phases is not None or len(elements) > 1:
+        target = [frameplan.Target(e, p) for e, p in zip(elements, job.phases or [0.0] * len(elements))]
+    if isinstance(job.view, list):
+        view = [resolve_view(db, doc, v) for v in job.view]
+    else:
+        view = resolve_view(db, doc, job.view)
+    if not os.path.isdir(job.folder):
+        os.makedirs(job.folder)
+    positions = times = None
+    if job.adaptive:
+        probe_view = view[0] if isinstance(view, list) else view
+        positions = adaptive.sample_positions(db, doc, probe_view, target, job.is_instance, job.params,
+                                              job.frames, job.folder, transaction=transaction,
+                                              log=log, load_frame=load_frame)
+        times = adaptive.frame_times(positions, job.frames)
+    result = animator.run_animation(db, doc, view, target, job.is_instance, job.params, job.frames,
+                                    job.folder, job.export, transaction=transaction, log=log,
+                                    reuse_frames=job.reuse_frames, positions=positions,
+                                    tracer=tracer, auto_crop=job.auto_crop,
+                                    keep_changes=job.keep_changes)
+    gif_paths = []
+    apng_paths = []
+    for _, folder, paths in result.sequences:
+        if job.gif is not False:
+            gif_paths.append(os.path.join(folder, 'animation.gif'))
+            build_gif(paths, gif_paths[-1], job.gif, job.fps, load_frame, log, times, tracer,
+                      pingpong=job.pingpong, frame_loader=frame_loader)
+        if job.apng:
+            apng_paths.append(os.path.join(folder, 'animation.apng'))
+            apng.write_apng(paths, apng_paths[-1],
+                            delay_cs=gifenc.frame_delays(len(paths), job.fps, times),
+                            collapse=True, load_frame=load_frame, log=log, pingpong=job.pingpong,
+                            tracer=tracer)
+    # one view: plain paths in the report, several views: lists
+    gif_path = gif_paths if len(result.sequences) > 1 else (gif_paths or [None])[0]
+    apng_path = apng_paths if len(result.sequences) > 1 else (apng_paths or [None])[0]
+    tracer.save(os.path.join(job.folder, tracing.TRACE_NAME))
+    if log:
+        for line in tracer.summary_lines():
+            log(line, logsink.DEBUG)
+    return JobResult(job.name, STATUS_OK, time.time() - started, len(result.frame_paths), result.exported,
+                     result.reused, gif_path, apng=apng_path)
+
+
+def run_jobs(db, doc, jobs, transaction=None, log=None, load_frame=None, frame_loader=None):
+    """Runs jobs in order, recording failures instead of stopping the queue.
+
+    Inside Revit pass bitmapio.load_frame_bitmap and bitmapio.gif_frame_loader:
+    the pure Python PNG decoder is far too slow at export sizes.
+    """
+    log = log or (lambda message, level=logsink.INFO: None)
+    results = []
+    for n, job in enumerate(jobs):
+        log('Job {}/{}: {} ({} frames) -> {}'.format(n + 1, len(jobs), job.name, job.frames, job.folder))
+        started = time.time()
+        try:
+            result = run_job(db, doc, job, transaction, log, load_frame, frame_loader)
+        except Exception as e:
+            import traceback
+            log('Job {} failed: {}'.format(job.name, e), logsink.ERROR)
+            log(traceback.format_exc(), logsink.DEBUG)
+            result = JobResult(job.name, STATUS_FAILED, time.time() - started, job.frames, error=str(e))
+        log('Job {} {} in {:.1f} s'.format(job.name, result.status, result.seconds))
+        results.append(result)
+    for line in summary_lines(results):
+        log(line)
+    return results
+
+
+def summary_lines(results):
+    """Fixed-width status table of a finished queue"""
+    lines = ['{:<24} {:<7} {:>9} {:>7} {:>9} {:>7}'.format(
+        'job', 'status', 'seconds', 'frames', 'exported', 'reused')]
+    for r in results:
+        lines.append('{:<24} {:<7} {:>9.1f} {:>7} {:>9} {:>7}'.format(
+            r.name[:24], r.status, r.seconds, r.frames, r.exported, r.reused))
+    failed = sum(1 for r in results if r.status != STATUS_OK)
+    lines.append('{} jobs, {} failed, {:.1f} s total'.format(
+        len(results), failed, sum(r.seconds for r in results)))
+    return lines
+
+
+def write_report(path, results):
+    with open(path, 'w') as f:
+        json.dump([r.to_dict() for r in results], f, indent=1)
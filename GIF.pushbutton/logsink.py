@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Buffered, thread-safe log sink.
+
+Messages are appended to a bounded ring buffer that the UI drains in batches
+at a fixed cadence, instead of one Dispatcher round-trip per message. An
+optional file sink receives every message at its own level.
+"""
+import io
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+DEFAULT_CAPACITY = 5000
+
+
+class LogSink(object):
+    """Collects log lines for batched display and an optional log file"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, level=INFO):
+        self.level = level
+        self.dropped = 0
+        self._pending = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_level = DEBUG
+
+    def write(self, message, level=INFO):
+        """Records a message; never blocks on the UI"""
+        with self._lock:
+            if level >= self.level:
+                if len(self._pending) == self._pending.maxlen:
+                    self.dropped += 1
+                self._pending.append(message)
+            if self._file is not None and level >= self._file_level:
+                self._file.write(u'{} {:<7} {}\n'.format(
+                    time.strftime('%H:%M:%S'), LEVEL_NAMES.get(level, level), _text(message)))
+
+    def drain(self):
+        """Returns and clears the buffered lines"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            if self.dropped:
+                lines.insert(0, '... {} older messages dropped'.format(self.dropped))
+                self.dropped = 0
+        return lines
+
+    def open_file(self, path, level=DEBUG):
+        """Starts copying messages at or above ``level`` to a UTF-8 file"""
+        self.close_file()
+        with self._lock:
+            self._file = io.open(path, 'a', encoding='utf-8')
+            self._file_level = level
+
+    def close_file(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _text(message):
+    try:
+        return unicode(message)  # IronPython 2.7 / CPython 2
+    except NameError:
+        return str(message)
+    except UnicodeDecodeError:
+        return message.decode('utf-8', 'replace')
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Cached numeric-parameter schema per family type.
+
+Instances of one family type expose the same parameters, so the list of
+writable Double parameters is worked out once per (symbol id, instance or
+type mode) instead of walking every Parameter on each selection change.
+Each descriptor also keeps the unit resolved by frameplan.resolve_unit,
+so building a frame plan skips the unit probe. document_changed() drops
+entries of modified or deleted types (all of them when project parameters
+change); at most ``capacity`` entries are kept, least recently used first
+out.
+"""
+from collections import OrderedDict
+
+import frameplan
+
+CAPACITY = 256
+
+
+class ParamDescriptor(object):
+    """Name and unit of one writable numeric parameter of a family type
+    (``symbol_id``: the type's id value the unit was resolved on)"""
+    __slots__ = ('name', 'strategy', 'unit', 'symbol_id')
+
+    def __init__(self, name, strategy, unit, symbol_id=None):
+        self.name = name
+        self.strategy = strategy
+        self.unit = unit
+        self.symbol_id = symbol_id
+
+
+def numeric_params(db, elem):
+    """Writable Double parameters of an element"""
+    return [p for p in elem.Parameters
+            if p.StorageType == db.StorageType.Double and not p.IsReadOnly]
+
+
+class SchemaCache(object):
+    """Parameter descriptors keyed by (symbol id value, is_instance)"""
+
+    def __init__(self, db, capacity=CAPACITY):
+        self.db = db
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def descriptors(self, instance, is_instance):
+        """[ParamDescriptor] for the instance's (or its type's) numeric parameters"""
+        key = (frameplan.element_id_value(instance.Symbol.Id), bool(is_instance))
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            elem = instance if is_instance else instance.Symbol
+            entry = [ParamDescriptor(p.Definition.Name, *frameplan.resolve_unit(self.db, p),
+                                     symbol_id=key[0])
+                     for p in numeric_params(self.db, elem)]
+            while len(self._entries) >= self.capacity:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+        self._entries[key] = entry
+        return entry
+
+    def invalidate(self, symbol_ids=None):
+        """Drops the entries of the given symbol id values (default: all)"""
+        if symbol_ids is None:
+            self._entries.clear()
+            return
+        for key in list(self._entries):
+            if key[0] in symbol_ids:
+                del self._entries[key]
+
+    def document_changed(self, doc, args):
+        """DocumentChanged handler body (``args`` is DocumentChangedEventArgs)"""
+        for element_id in args.GetAddedElementIds():
+            if isinstance(doc.GetElement(element_id), self.db.ParameterElement):
+                self.invalidate()
+                return
+        changed = set(frameplan.element_id_value(i) for i in args.GetModifiedElementIds())
+        changed.update(frameplan.element_id_value(i) for i in args.GetDeletedElementIds())
+        if changed:
+            self.invalidate(changed)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Background GIF encoding that overlaps with frame export.
+
+The export loop hands every finished PNG to BackgroundGifEncoder, whose
+worker thread decodes it and appends it to the GIF while Revit renders the
+next frame. The hand-off queue is bounded, so a slow encoder throttles the
+exporter instead of piling up decoded frames.
+"""
+import threading
+from collections import deque
+
+try:
+    from Queue import Queue, Empty, Full
+except ImportError:
+    from queue import Queue, Empty, Full
+
+import gifenc
+
+DEFAULT_QUEUE_SIZE = 4
+_POLL = 0.1  # seconds between checks for abort / consumer failure
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class BackgroundGifEncoder(object):
+    """Appends frames to a GIF on a worker thread as they are exported.
+
+    Messages from the worker are queued and replayed through ``log`` on the
+    caller's thread (submit/finish), never from the worker itself: the UI
+    thread is busy in the export loop and a cross-thread Dispatcher.Invoke
+    would deadlock.
+    """
+
+    def __init__(self, out_path, log=None, maxsize=DEFAULT_QUEUE_SIZE, **options):
+        self.stream = gifenc.GifStream(out_path, **options)
+        self.log = log
+        self.error = None
+        self._messages = deque()
+        self._queue = Queue(maxsize)
+        self._aborted = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, path):
+        """Queues an exported frame; blocks while the queue is full"""
+        self._flush_log()
+        while True:
+            self._check()
+            try:
+                self._queue.put(path, timeout=_POLL)
+                return
+            except Full:
+                continue
+
+    def finish(self):
+        """Waits for the queue to drain, closes the GIF and returns its frame count"""
+        while True:
+            self._check()
+            try:
+                self._queue.put(_DONE, timeout=_POLL)
+                break
+            except Full:
+                self._flush_log()
+        while self._thread.is_alive():
+            self._thread.join(_POLL)
+            self._flush_log()
+        self._flush_log()
+        self._check()
+        return self.stream.frame_count
+
+    def abort(self):
+        """Stops the worker and deletes the partial GIF"""
+        self._aborted = True
+        self._thread.join()
+        self._flush_log()
+        self.stream.discard()
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+        if self._aborted:
+            raise PipelineAborted('GIF pipeline was aborted')
+
+    def _run(self):
+        try:
+            while not self._aborted:
+                try:
+                    item = self._queue.get(timeout=_POLL)
+                except Empty:
+                    continue
+                if item is _DONE:
+                    self.stream.close()
+                    self._messages.append('GIF frames written: {}'.format(self.stream.frame_count))
+                    if self.stream.merged:
+                        self._messages.append('Merged {} repeated frames into longer delays'.format(
+                            self.stream.merged))
+                    return
+                self.stream.add_path(item)
+                count = self.stream.frames_added
+                if count % 10 == 0:
+                    self._messages.append('Added frame {} to GIF'.format(count))
+        except Exception as e:
+            self.error = e
+            self._messages.append('GIF pipeline error: {}'.format(e))
+            try:
+                self.stream.discard()
+            except Exception:
+                pass
+
+    def _flush_log(self):
+        while self._messages:
+            msg = self._messages.popleft()
+            if self.log:
+                self.log(msg)
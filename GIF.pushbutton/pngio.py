@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""Minimal PNG reading/writing for the GIF builder.
+
+Pure Python (zlib + struct) so frames can be decoded without System.Drawing,
+with an optional NumPy fast path for unfiltering and pixel conversion.
+Works under IronPython 2.7 as well as CPython 3.
+"""
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# samples per pixel for each PNG color type
+_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+class Frame(object):
+    """Decoded RGB image.
+
+    ``pixels`` is a packed RGB ``bytearray`` (row-major, no padding), or an
+    ``(height, width, 3)`` uint8 array when NumPy is available.
+    """
+    __slots__ = ('width', 'height', 'pixels')
+
+    def __init__(self, width, height, pixels):
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+
+    def rgb_bytes(self):
+        """Packed RGB bytes regardless of the backing representation"""
+        if np is not None and isinstance(self.pixels, np.ndarray):
+            return bytearray(self.pixels.tobytes())
+        return self.pixels
+
+    @classmethod
+    def from_rgb(cls, width, height, data):
+        """Wraps packed RGB bytes, converting to an array when NumPy is present"""
+        if np is not None:
+            arr = np.frombuffer(bytes(data), dtype=np.uint8)
+            return cls(width, height, arr.reshape(height, width, 3))
+        return cls(width, height, bytearray(data))
+
+    @classmethod
+    def from_bgr(cls, width, height, data, stride=None):
+        """Wraps BGR rows as produced by GDI+ LockBits (Format24bppRgb)"""
+        row = width * 3
+        stride = stride or row
+        if np is not None:
+            arr = np.frombuffer(bytes(data), dtype=np.uint8)
+            arr = arr.reshape(height, stride)[:, :row].reshape(height, width, 3)
+            return cls(width, height, np.ascontiguousarray(arr[:, :, ::-1]))
+        data = bytearray(data)
+        if stride != row:
+            packed = bytearray()
+            for y in range(height):
+                packed += data[y * stride:y * stride + row]
+            data = packed
+        data[0::3], data[2::3] = data[2::3], data[0::3]
+        return cls(width, height, data)
+
+
+def iter_chunks(f):
+    """Yields (type, data) for every chunk after the PNG signature"""
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        length, ctype = struct.unpack('>I4s', head)
+        data = f.read(length)
+        f.read(4)  # CRC
+        yield ctype, data
+        if ctype == b'IEND':
+            return
+
+
+def read_header(path):
+    """Returns (width, height, bit_depth, color_type, interlace) from IHDR"""
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError('Not a PNG file: {}'.format(path))
+        for ctype, data in iter_chunks(f):
+            if ctype == b'IHDR':
+                w, h, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', data)
+                return w, h, depth, color, interlace
+    raise ValueError('PNG has no IHDR chunk: {}'.format(path))
+
+
+def read_png(path):
+    """Decodes a non-interlaced 8/16-bit PNG into an RGB Frame"""
+    header = None
+    palette = None
+    inflater = zlib.decompressobj()
+    raw = bytearray()
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError('Not a PNG file: {}'.format(path))
+        for ctype, data in iter_chunks(f):
+            if ctype == b'IHDR':
+                header = struct.unpack('>IIBBBBB', data)
+            elif ctype == b'PLTE':
+                palette = bytearray(data)
+            elif ctype == b'IDAT':
+                raw += inflater.decompress(data)
+    if header is None:
+        raise ValueError('PNG has no IHDR chunk: {}'.format(path))
+    raw += inflater.flush()
+    width, height, depth, color, _, _, interlace = header
+    if interlace:
+        raise ValueError('Interlaced PNG is not supported: {}'.format(path))
+    if depth not in (8, 16) or color not in _CHANNELS:
+        raise ValueError('Unsupported PNG format (depth={}, color={}): {}'.format(depth, color, path))
+    channels = _CHANNELS[color]
+    bpp = channels * depth // 8
+    rows = _unfilter(raw, width, height, bpp)
+    del raw
+    return _to_rgb(rows, width, height, depth, color, channels, palette)
+
+
+def rgb_header(width, height):
+    """IHDR payload for 8-bit RGB, non-interlaced"""
+    return struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+
+def encode_rgb(width, height, rgb, level=6):
+    """Deflated image data for packed 8-bit RGB (filter type 0 on every row)"""
+    data = bytes(rgb) if not (np is not None and isinstance(rgb, np.ndarray)) else rgb.tobytes()
+    row = width * 3
+    deflater = zlib.compressobj(level)
+    compressed = []
+    for y in range(height):
+        compressed.append(deflater.compress(b'\x00' + data[y * row:(y + 1) * row]))
+    compressed.append(deflater.flush())
+    return b''.join(compressed)
+
+
+def write_png(path, width, height, rgb, level=6):
+    """Writes packed 8-bit RGB data as a PNG"""
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        write_chunk(f, b'IHDR', rgb_header(width, height))
+        write_chunk(f, b'IDAT', encode_rgb(width, height, rgb, level))
+        write_chunk(f, b'IEND', b'')
+
+
+def write_chunk(f, ctype, data):
+    f.write(struct.pack('>I', len(data)))
+    f.write(ctype)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(ctype + data) & 0xFFFFFFFF))
+
+
+def _unfilter(raw, width, height, bpp):
+    stride = width * bpp
+    if len(raw) < (stride + 1) * height:
+        raise ValueError('Truncated PNG image data')
+    if np is not None:
+        return _unfilter_np(raw, stride, height, bpp)
+    out = bytearray(stride * height)
+    prev = bytearray(stride)
+    pos = 0
+    for y in range(height):
+        ftype = raw[pos]
+        line = raw[pos + 1:pos + 1 + stride]
+        pos += stride + 1
+        if ftype == 1:
+            for i in range(bpp, stride):
+                line[i] = (line[i] + line[i - bpp]) & 0xFF
+        elif ftype == 2:
+            line = bytearray((a + b) & 0xFF for a, b in zip(line, prev))
+        elif ftype == 3:
+            for i in range(stride):
+                left = line[i - bpp] if i >= bpp else 0
+                line[i] = (line[i] + ((left + prev[i]) >> 1)) & 0xFF
+        elif ftype == 4:
+            _paeth(line, prev, bpp, stride)
+        elif ftype != 0:
+            raise ValueError('Bad PNG filter type {}'.format(ftype))
+        out[y * stride:(y + 1) * stride] = line
+        prev = line
+    return out
+
+
+def _paeth(line, prev, bpp, stride):
+    for i in range(stride):
+        if i >= bpp:
+            a = line[i - bpp]
+            c = prev[i - bpp]
+        else:
+            a = c = 0
+        b = prev[i]
+        p = a + b - c
+        pa = abs(p - a)
+        pb = abs(p - b)
+        pc = abs(p - c)
+        if pa <= pb and pa <= pc:
+            pred = a
+        elif pb <= pc:
+            pred = b
+        else:
+            pred = c
+        line[i] = (line[i] + pred) & 0xFF
+
+
+def _unfilter_np(raw, stride, height, bpp):
+    data = np.frombuffer(bytes(raw[:(stride + 1) * height]), dtype=np.uint8).reshape(height, stride + 1)
+    ftypes = data[:, 0]
+    out = np.array(data[:, 1:])
+    if not ftypes.any():
+        return out
+    for y in range(height):
+        ftype = ftypes[y]
+        if ftype == 0:
+            continue
+        line = out[y]
+        prev = out[y - 1] if y else np.zeros(stride, dtype=np.uint8)
+        if ftype == 1:
+            px = line.reshape(-1, bpp)
+            line[:] = np.cumsum(px, axis=0, dtype=np.uint8).reshape(-1)
+        elif ftype == 2:
+            line += prev
+        elif ftype in (3, 4):
+            row = bytearray(line.tobytes())
+            prev_row = bytearray(prev.tobytes())
+            if ftype == 3:
+                for i in range(stride):
+                    left = row[i - bpp] if i >= bpp else 0
+                    row[i] = (row[i] + ((left + prev_row[i]) >> 1)) & 0xFF
+            else:
+                _paeth(row, prev_row, bpp, stride)
+            line[:] = np.frombuffer(bytes(row), dtype=np.uint8)
+        else:
+            raise ValueError('Bad PNG filter type {}'.format(ftype))
+    return out
+
+
+def _to_rgb(rows, width, height, depth, color, channels, palette):
+    if np is not None:
+        arr = np.asarray(rows, dtype=np.uint8).reshape(height, -1)
+        if depth == 16:
+            arr = arr[:, 0::2]
+        arr = arr.reshape(height, width, channels)
+        if color == 3:
+            if palette is None:
+                raise ValueError('Palette PNG without PLTE chunk')
+            lut = np.zeros((256, 3), dtype=np.uint8)
+            pal = np.frombuffer(bytes(palette), dtype=np.uint8).reshape(-1, 3)
+            lut[:len(pal)] = pal
+            arr = lut[arr[:, :, 0]]
+        elif color in (0, 4):
+            arr = np.repeat(arr[:, :, :1], 3, axis=2)
+        else:
+            arr = arr[:, :, :3]
+        return Frame(width, height, np.ascontiguousarray(arr))
+    if depth == 16:
+        rows = rows[0::2]
+    if color == 2:
+        rgb = rows
+    elif color == 6:
+        rgb = bytearray(width * height * 3)
+        rgb[0::3] = rows[0::4]
+        rgb[1::3] = rows[1::4]
+        rgb[2::3] = rows[2::4]
+    elif color in (0, 4):
+        gray = rows[0::channels]
+        rgb = bytearray(width * height * 3)
+        rgb[0::3] = gray
+        rgb[1::3] = gray
+        rgb[2::3] = gray
+    else:
+        if palette is None:
+            raise ValueError('Palette PNG without PLTE chunk')
+        pal = palette + bytearray(768 - len(palette))
+        rgb = bytearray(width * height * 3)
+        rgb[0::3] = rows.translate(bytes(pal[0::3]))
+        rgb[1::3] = rows.translate(bytes(pal[1::3]))
+        rgb[2::3] = rows.translate(bytes(pal[2::3]))
+    return Frame(width, height, rgb)
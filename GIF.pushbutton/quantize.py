@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Global palette construction and fast palette mapping.
+
+One palette is built per animation from pixels sampled across every frame
+(median cut over a 6-bit-per-channel color histogram). Frames are mapped
+through a precomputed 5-bit RGB cube lookup table, optionally with ordered
+(Bayer) or Floyd-Steinberg dithering. The pure Python and NumPy paths give
+identical results.
+"""
+from operator import add
+
+import pngio
+
+np = pngio.np
+
+MAX_COLORS = 255            # index 255 stays free for transparency
+SAMPLES_PER_FRAME = 16384   # pixels sampled from each frame for the histogram
+HIST_BITS = 6               # histogram resolution per channel
+LUT_BITS = 5                # lookup cube resolution per channel
+
+DITHER_NONE = 'none'
+DITHER_ORDERED = 'ordered'
+DITHER_DIFFUSION = 'diffusion'
+
+_BAYER4 = [[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]]
+_ORDERED_STRENGTH = 32
+
+
+# ----------------------------- histogram -----------------------------
+class ColorHistogram(object):
+    """Accumulates sampled pixel colors of many frames into coarse cells"""
+
+    def __init__(self, samples_per_frame=SAMPLES_PER_FRAME):
+        self.samples_per_frame = samples_per_frame
+        size = 1 << (3 * HIST_BITS)
+        if np is not None:
+            self._np = [np.zeros(size, dtype=np.int64) for _ in range(4)]
+        else:
+            self._cells = {}
+
+    def add(self, frame):
+        """Samples every n-th pixel of a Frame"""
+        step = max(1, (frame.width * frame.height) // self.samples_per_frame)
+        shift = 8 - HIST_BITS
+        if np is not None:
+            px = frame.pixels
+            if isinstance(px, bytearray):  # pure Python frame, e.g. from a bytearray resample
+                px = np.frombuffer(bytes(px), dtype=np.uint8)
+            px = px.reshape(-1, 3)[::step].astype(np.int64)
+            keys = ((px[:, 0] >> shift) << (2 * HIST_BITS)) | \
+                   ((px[:, 1] >> shift) << HIST_BITS) | (px[:, 2] >> shift)
+            size = 1 << (3 * HIST_BITS)
+            self._np[0] += np.bincount(keys, minlength=size)
+            for ch in range(3):
+                self._np[ch + 1] += np.bincount(keys, weights=px[:, ch], minlength=size).astype(np.int64)
+            return
+        rgb = frame.rgb_bytes()
+        cells = self._cells
+        r = rgb[0::3][::step]
+        g = rgb[1::3][::step]
+        b = rgb[2::3][::step]
+        for rv, gv, bv in zip(bytearray(r), bytearray(g), bytearray(b)):
+            key = ((rv >> shift) << (2 * HIST_BITS)) | ((gv >> shift) << HIST_BITS) | (bv >> shift)
+            cell = cells.get(key)
+            if cell is None:
+                cells[key] = [1, rv, gv, bv]
+            else:
+                cell[0] += 1
+                cell[1] += rv
+                cell[2] += gv
+                cell[3] += bv
+
+    def cells(self):
+        """Non-empty cells as (count, rsum, gsum, bsum) sorted by cell key"""
+        if np is not None:
+            counts = self._np[0]
+            keys = np.flatnonzero(counts)
+            return [(int(counts[k]), int(self._np[1][k]), int(self._np[2][k]), int(self._np[3][k]))
+                    for k in keys]
+        return [tuple(self._cells[k]) for k in sorted(self._cells)]
+
+
+# ----------------------------- median cut ----------------------------
+def median_cut(cells, colors=MAX_COLORS):
+    """Reduces histogram cells to at most ``colors`` RGB entries"""
+    # each item: (mean r, mean g, mean b, count, rsum, gsum, bsum)
+    items = [(rs // n, gs // n, bs // n, n, rs, gs, bs) for n, rs, gs, bs in cells if n]
+    if not items:
+        return bytearray(3)
+    boxes = [_make_box(items)]
+    while len(boxes) < colors:
+        best = max(range(len(boxes)), key=lambda i: boxes[i][0])
+        score, ch, box = boxes[best]
+        if score <= 0:
+            break
+        box.sort(key=lambda c: (c[ch], c[0], c[1], c[2]))
+        half = sum(c[3] for c in box) / 2.0
+        acc = 0
+        split = 1
+        for i, c in enumerate(box):
+            acc += c[3]
+            if acc >= half:
+                split = i + 1
+                break
+        split = min(max(split, 1), len(box) - 1)
+        boxes[best] = _make_box(box[:split])
+        boxes.append(_make_box(box[split:]))
+    palette = bytearray()
+    for _, _, box in boxes:
+        n = sum(c[3] for c in box)
+        for ch in (4, 5, 6):
+            total = sum(c[ch] for c in box)
+            palette.append((2 * total + n) // (2 * n))
+    return palette
+
+
+def _make_box(box):
+    if len(box) < 2:
+        return (0, 0, box)
+    ranges = [max(c[ch] for c in box) - min(c[ch] for c in box) for ch in range(3)]
+    ch = ranges.index(max(ranges))
+    return (ranges[ch] * sum(c[3] for c in box), ch, box)
+
+
+def build_palette(frames, colors=MAX_COLORS):
+    """Samples an iterable of Frames and returns a shared palette"""
+    hist = ColorHistogram()
+    for frame in frames:
+        hist.add(frame)
+    return median_cut(hist.cells(), colors)
+
+
+# ------------------------------ mapping ------------------------------
+class PaletteMapper(object):
+    """Maps frames to palette indices through a precomputed RGB cube"""
+
+    def __init__(self, palette, dither=DITHER_NONE):
+        self.palette = bytearray(palette)
+        self.dither = dither or DITHER_NONE
+        if self.dither not in (DITHER_NONE, DITHER_ORDERED, DITHER_DIFFUSION):
+            raise ValueError('Unknown dither mode: {}'.format(dither))
+        self.lut = _build_lut(self.palette)
+
+    def map(self, frame):
+        """Returns one palette index byte per pixel"""
+        if self.dither == DITHER_DIFFUSION:
+            return self._map_diffusion(frame)
+        if np is not None and not isinstance(frame.pixels, bytearray):
+            return self._map_np(frame)
+        rgb = frame.rgb_bytes()
+        w, h = frame.width, frame.height
+        channels = [bytearray(rgb[ch::3]) for ch in range(3)]
+        if self.dither == DITHER_ORDERED:
+            tables = _ordered_tables()
+            for ch in channels:
+                for y in range(h):
+                    row = ch[y * w:(y + 1) * w]
+                    for k in range(4):
+                        row[k::4] = row[k::4].translate(tables[y % 4][k])
+                    ch[y * w:(y + 1) * w] = row
+        shift = 8 - LUT_BITS
+        rk = [(v >> shift) << (2 * LUT_BITS) for v in range(256)]
+        gk = [(v >> shift) << LUT_BITS for v in range(256)]
+        bk = [v >> shift for v in range(256)]
+        keys = map(add, map(add, map(rk.__getitem__, channels[0]), map(gk.__getitem__, channels[1])),
+                   map(bk.__getitem__, channels[2]))
+        return bytearray(map(self.lut.__getitem__, keys))
+
+    def _map_np(self, frame):
+        px = frame.pixels.astype(np.int16)
+        if self.dither == DITHER_ORDERED:
+            offsets = np.array([[_ordered_offset(b) for b in row] for row in _BAYER4], dtype=np.int16)
+            reps = (frame.height // 4 + 1, frame.width // 4 + 1)
+            px = np.clip(px + np.tile(offsets, reps)[:frame.height, :frame.width, None], 0, 255)
+        shift = 8 - LUT_BITS
+        keys = ((px[:, :, 0] >> shift) << (2 * LUT_BITS)) | \
+               ((px[:, :, 1] >> shift) << LUT_BITS) | (px[:, :, 2] >> shift)
+        lut = np.array(self.lut, dtype=np.uint8)
+        return bytearray(lut[keys].tobytes())
+
+    def _map_diffusion(self, frame):
+        # Floyd-Steinberg with errors kept in 1/16 units; inherently sequential
+        rgb = bytearray(frame.rgb_bytes())
+        w, h = frame.width, frame.height
+        pal = self.palette
+        lut = self.lut
+        shift = 8 - LUT_BITS
+        out = bytearray(w * h)
+        err = [0] * ((w + 2) * 3)
+        for y in range(h):
+            nxt = [0] * ((w + 2) * 3)
+            o = y * w * 3
+            for x in range(w):
+                e = (x + 1) * 3
+                r = min(255, max(0, rgb[o] + (err[e] + 8) // 16))
+                g = min(255, max(0, rgb[o + 1] + (err[e + 1] + 8) // 16))
+                b = min(255, max(0, rgb[o + 2] + (err[e + 2] + 8) // 16))
+                idx = lut[((r >> shift) << (2 * LUT_BITS)) | ((g >> shift) << LUT_BITS) | (b >> shift)]
+                out[y * w + x] = idx
+                for ch, v in ((0, r), (1, g), (2, b)):
+                    d = v - pal[idx * 3 + ch]
+                    err[e + 3 + ch] += d * 7
+                    nxt[e - 3 + ch] += d * 3
+                    nxt[e + ch] += d * 5
+                    nxt[e + 3 + ch] += d
+                o += 3
+            err = nxt
+        return out
+
+
+def _ordered_offset(b):
+    return ((2 * b + 1) * _ORDERED_STRENGTH) // 32 - _ORDERED_STRENGTH // 2
+
+
+def _ordered_tables():
+    return [[bytes(bytearray(min(255, max(0, v + _ordered_offset(b))) for v in range(256)))
+             for b in row] for row in _BAYER4]
+
+
+def _build_lut(palette):
+    """Nearest palette index for the center of every LUT cube cell"""
+    entries = len(palette) // 3
+    size = 1 << LUT_BITS
+    step = 256 // size
+    centers = [v * step + step // 2 for v in range(size)]
+    if np is not None:
+        c = np.array(centers, dtype=np.int64)
+        grid = np.stack(np.meshgrid(c, c, c, indexing='ij'), axis=-1).reshape(-1, 3)
+        pal = np.frombuffer(bytes(palette[:entries * 3]), dtype=np.uint8).reshape(-1, 3).astype(np.int64)
+        lut = np.empty(len(grid), dtype=np.int64)
+        for start in range(0, len(grid), 4096):
+            chunk = grid[start:start + 4096]
+            d = ((chunk[:, None, :] - pal[None, :, :]) ** 2).sum(axis=2)
+            lut[start:start + 4096] = d.argmin(axis=1)
+        return [int(v) for v in lut]
+    # distances encoded as d * 256 + index so a plain min() keeps the argmin
+    cr = [r for r in range(size) for _ in range(size * size)]
+    cg = [g for _ in range(size) for g in range(size) for _ in range(size)]
+    cb = [b for _ in range(size * size) for b in range(size)]
+    best = None
+    for i in range(entries):
+        pr, pg, pb = palette[i * 3], palette[i * 3 + 1], palette[i * 3 + 2]
+        dr = [((v - pr) ** 2) << 8 for v in centers]
+        dg = [((v - pg) ** 2) << 8 for v in centers]
+        db = [(((v - pb) ** 2) << 8) + i for v in centers]
+        d = map(add, map(add, map(dr.__getitem__, cr), map(dg.__getitem__, cg)), map(db.__getitem__, cb))
+        best = list(d) if best is None else list(map(min, best, d))
+    return [v & 0xFF for v in best]
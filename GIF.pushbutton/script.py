@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
-import os, inspect, clr
+import os, sys, inspect, clr
 import math
+import time
 clr.AddReference('PresentationFramework')
 clr.AddReference('PresentationCore')
 clr.AddReference('WindowsBase')
@@ -12,68 +13,62 @@ DEBUG_PRINT = False
 from System.Collections.Generic import List
 from System.IO import Directory
 from System.Windows import Window, Visibility, GridLength
-from System.Windows.Threading import DispatcherPriority
-from System import Action
+from System.Windows.Threading import DispatcherPriority, DispatcherTimer
+from System import Action, TimeSpan
 from System.Threading import Thread, ThreadStart
 
 from pyrevit.framework import wpf
 from pyrevit import revit, DB, forms
 
 import System
-from System.Drawing import Image, Imaging
-from System.Drawing.Imaging import EncoderValue
 
 SCRIPT_DIR = os.path.dirname(inspect.getfile(inspect.currentframe()))
 XAML_PATH  = os.path.join(SCRIPT_DIR, 'ui.xaml')
-
-MAX_PIXEL_SIZE = 15000  # Revit API hard limit: 1..15000 px per side (see Autodesk forums)
+if SCRIPT_DIR not in sys.path:
+    sys.path.append(SCRIPT_DIR)
+
+import adaptive
+import animator
+import apng
+import bitmapio
+import familyindex
+import frameplan
+import gifenc
+import logsink
+import paramschema
+import pipeline
+import quantize
+import tracing
+
+MAX_PIXEL_SIZE = animator.MAX_PIXEL_SIZE
+LOG_FLUSH_INTERVAL = 0.25  # seconds between batched console updates
 
 # --------------------- helpers ---------------------
 class ParamSetting:
-    def __init__(self, name, param_obj, min_val=0, max_val=100):
+    def __init__(self, name, descriptor, min_val=0, max_val=100):
         self.Name = name
-        self.ParamObj = param_obj
+        self.Descriptor = descriptor  # paramschema.ParamDescriptor
         self.MinValue = str(min_val)
         self.MaxValue = str(max_val)
 
-def get_all_family_instances():
-    return list(DB.FilteredElementCollector(revit.doc).OfClass(DB.FamilyInstance))
-
-def get_numeric_params(elem):
-    return [p for p in elem.Parameters
-            if p.StorageType == DB.StorageType.Double and not p.IsReadOnly]
-
-def export_frame(doc, view, folder, idx, resolution_dpi=600, pixel_size=2048, scale_factor=1.0):
-    opts = DB.ImageExportOptions()
-    opts.ExportRange = DB.ExportRange.VisibleRegionOfCurrentView
-    opts.FilePath = os.path.join(folder, 'frame_{:03d}.png'.format(idx))
-    
-    # 1️⃣ Correct enum-DPI mapping
-    dpi_enum = {
-        72  : DB.ImageResolution.DPI_72,
-        150 : DB.ImageResolution.DPI_150,
-        300 : DB.ImageResolution.DPI_300,
-        600 : DB.ImageResolution.DPI_600,
-    }.get(resolution_dpi, DB.ImageResolution.DPI_600)  # ≥600 → DPI_600
-    opts.ImageResolution = dpi_enum
-    
-    # 2️⃣ Apply scale factor to pixel size
-    scaled_pixel_size = int(pixel_size * scale_factor)
-    
-    # 3️⃣ Clamp to Revit's hard limit
-    if resolution_dpi > 600:
-        final_pixel_size = int(scaled_pixel_size * (resolution_dpi / 600.0))
-    else:
-        final_pixel_size = scaled_pixel_size
-    
-    if final_pixel_size > MAX_PIXEL_SIZE:
-        print("WARNING: Requested pixel size {} exceeds Revit's limit {}. Clamping.".format(final_pixel_size, MAX_PIXEL_SIZE))
-        final_pixel_size = MAX_PIXEL_SIZE
-    
-    opts.PixelSize = final_pixel_size
-    opts.FitDirection = DB.FitDirectionType.Horizontal
-    opts.ShadowViewsFileType = DB.ImageFileType.PNG
-    doc.ExportImage(opts)
+def get_selected_instances():
+    """FamilyInstances selected in Revit, in element id order"""
+    doc = revit.doc
+    elems = [doc.GetElement(i) for i in revit.uidoc.Selection.GetElementIds()]
+    return sorted([e for e in elems if isinstance(e, DB.FamilyInstance)],
+                  key=lambda e: frameplan.element_id_value(e.Id))
+
+def get_export_views():
+    """Printable non-template views other than the active one, by name"""
+    doc = revit.doc
+    active = frameplan.element_id_value(doc.ActiveView.Id)
+    views = [v for v in DB.FilteredElementCollector(doc).OfClass(DB.View)
+             if not v.IsTemplate and v.CanBePrinted and frameplan.element_id_value(v.Id) != active]
+    return sorted(views, key=lambda v: v.Name.lower())
+
+def view_label(view):
+    """List entry of a view; type and id tell apart views sharing a name"""
+    return '{} ({}, {})'.format(view.Name, view.ViewType, frameplan.element_id_value(view.Id))
 
 def _safe(txt, fn):
     try: return fn(txt)
@@ -82,11 +77,27 @@ def _safe(txt, fn):
 # ----------------------- UI ------------------------
 class ParamUI(Window):
     def __init__(self):
+        # Log sink first: XAML event handlers may log while loading
+        self.log_sink = logsink.LogSink()
+        self._last_flush = 0.0
         wpf.LoadComponent(self, XAML_PATH)
-        self.instances = get_all_family_instances()
-        self.familyBox.ItemsSource = [
-            "{} #{}".format(i.Symbol.Family.Name, i.Id) for i in self.instances
-        ]
+        # Family -> type index only; instances are collected per type on demand
+        self.family_index = familyindex.FamilyIndex(DB, revit.doc)
+        self.type_entries = []
+        self.instance_ids = []
+        self.familyBox.ItemsSource = self.family_index.names
+        # Numeric parameters per family type, dropped when the model changes
+        self.param_schema = paramschema.SchemaCache(DB)
+        self.app = revit.doc.Application
+        self.app.DocumentChanged += self.OnDocumentChanged
+        # Multi-target mode animates the elements selected before opening
+        self.selected_targets = get_selected_instances()
+        if self.selected_targets:
+            self.multiTargetCheckBox.IsEnabled = True
+            self.multiTargetCheckBox.Content = 'Animate all {} selected elements'.format(len(self.selected_targets))
+        # Extra views exported after the same regeneration as the active view
+        self.export_views = get_export_views()
+        self.extraViewsList.ItemsSource = [view_label(v) for v in self.export_views]
         self.param_settings = []  # List of parameter settings
         self.paramSettingsList.ItemsSource = self.param_settings
         
@@ -110,12 +121,23 @@ class ParamUI(Window):
         self.durationFpsRadio.Checked += self.OnFramesModeChanged
         self.OnFramesModeChanged(None, None)
         
+        # Encoder threads: 1 by default, each one holds decoded frames inside Revit's
+        # memory (encode_gif also caps them by frame size)
+        self.encoderWorkersBox.Text = '1'
+        
         # Bind events for GIF creation
         self.createGifCheckBox.Checked += self.OnCreateGifCheckChanged
         self.createGifCheckBox.Unchecked += self.OnCreateGifCheckChanged
         
         # Initial scale limiting
         self.limit_scale_options()
+        
+        # Console flush for messages logged while the UI thread is idle
+        self.log_timer = DispatcherTimer()
+        self.log_timer.Interval = TimeSpan.FromSeconds(LOG_FLUSH_INTERVAL)
+        self.log_timer.Tick += self.flush_log
+        self.log_timer.Start()
+        self.Closed += self.OnWindowClosed
 
     def get_max_scale(self):
         dpi_values = [72, 150, 300, 600, 1200]
@@ -187,20 +209,36 @@ class ParamUI(Window):
             # Ignore invalid input while typing
             pass
 
-    def log(self, message):
-        """Adds a message to the log"""
+    def log(self, message, level=logsink.INFO):
+        """Adds a message to the log; the console is updated in batches"""
         if DEBUG_PRINT:
             print(message)
+        self.log_sink.write(message, level)
+        if time.time() - self._last_flush >= LOG_FLUSH_INTERVAL:
+            self.flush_log()
+
+    def flush_log(self, *_):
+        """Appends all buffered messages to the console in one UI update"""
+        self._last_flush = time.time()
+        lines = self.log_sink.drain()
         # Write only if console is visible
-        if self.show_console and self.console_visible:
-            def update_console():
-                self.consoleBox.AppendText(message + "\n")
-                self.consoleBox.ScrollToEnd()
-                # Force through Dispatcher with delay
-                def delayed_scroll():
-                    self.consoleBox.ScrollToEnd()
-                self.Dispatcher.BeginInvoke(DispatcherPriority.Background, Action(delayed_scroll))
-            self.Dispatcher.Invoke(Action(update_console), DispatcherPriority.Background)
+        if not lines or not (getattr(self, 'show_console', False) and self.console_visible):
+            return
+        text = '\n'.join(lines) + '\n'
+        def update_console():
+            self.consoleBox.AppendText(text)
+            self.consoleBox.ScrollToEnd()
+        if self.Dispatcher.CheckAccess():
+            update_console()
+            # The export loop runs on the UI thread: let WPF render this batch
+            self.Dispatcher.Invoke(Action(lambda: None), DispatcherPriority.Background)
+        else:
+            self.Dispatcher.BeginInvoke(DispatcherPriority.Background, Action(update_console))
+
+    def OnWindowClosed(self, *_):
+        self.log_timer.Stop()
+        self.app.DocumentChanged -= self.OnDocumentChanged
+        self.log_sink.close_file()
 
     def OnShowLogsChanged(self, sender, args):
         """Show/hide console by checkbox"""
@@ -220,24 +258,64 @@ class ParamUI(Window):
             self.consoleBox.Text = ""
         self.Dispatcher.Invoke(Action(clear_console), DispatcherPriority.Background)
 
+    def OnFamilySearch(self, *_):
+        """Filters families as the user types; an element id jumps to that instance"""
+        text = self.familySearchBox.Text
+        found = self.family_index.locate(text)
+        if found is not None:
+            family, symbol_id, instance_id = found
+            self.familyBox.ItemsSource = [family]
+            self.familyBox.SelectedIndex = 0
+            self.typeBox.SelectedIndex = [s for _, s in self.type_entries].index(symbol_id)
+            self.elementBox.SelectedIndex = self.instance_ids.index(instance_id)
+            return
+        names = self.family_index.search(text)
+        self.familyBox.ItemsSource = names
+        if len(names) == 1:
+            self.familyBox.SelectedIndex = 0
+
     def OnFamilyChanged(self, *_):
-        if self.familyBox.SelectedIndex < 0: return
+        family = self.familyBox.SelectedItem
+        self.type_entries = self.family_index.type_entries(family) if family else []
+        self.typeBox.ItemsSource = [name for name, _ in self.type_entries]
+        if self.type_entries:
+            self.typeBox.SelectedIndex = 0
+
+    def OnTypeChanged(self, *_):
+        idx = self.typeBox.SelectedIndex
+        self.instance_ids = self.family_index.instance_ids(self.type_entries[idx][1]) if idx >= 0 else []
+        # Plain strings in a virtualized list: no element is touched until one is picked
+        self.elementBox.ItemsSource = ['#{}'.format(i) for i in self.instance_ids]
+        if self.instance_ids:
+            self.elementBox.SelectedIndex = 0
+        else:
+            self.par_descriptors = []
+            self.paramComboBox.ItemsSource = []
+
+    def OnElementChanged(self, *_):
         self.update_params()
 
     def OnInstanceToggle(self, *_):
         self.update_params()
 
+    def OnDocumentChanged(self, sender, args):
+        if args.GetDocument().Equals(revit.doc):
+            self.param_schema.document_changed(revit.doc, args)
+
+    def selected_instance(self):
+        """The picked FamilyInstance, or None"""
+        idx = self.elementBox.SelectedIndex
+        if idx < 0 or idx >= len(self.instance_ids):
+            return None
+        return self.family_index.instance(self.instance_ids[idx])
+
     def update_params(self):
-        idx = self.familyBox.SelectedIndex
-        if idx < 0: return
-        inst = self.instances[idx]
-        if self.instanceBox.IsChecked:
-            self.par_objs = get_numeric_params(inst)
-        else:
-            self.par_objs = get_numeric_params(inst.Symbol)
+        inst = self.selected_instance()
+        if inst is None: return
+        self.par_descriptors = self.param_schema.descriptors(inst, bool(self.instanceBox.IsChecked))
         
         # Update parameter dropdown list
-        param_names = [p.Definition.Name for p in self.par_objs]
+        param_names = [d.name for d in self.par_descriptors]
         self.paramComboBox.ItemsSource = param_names
         if param_names:
             self.paramComboBox.SelectedIndex = 0
@@ -249,7 +327,7 @@ class ParamUI(Window):
             return
         
         param_name = self.paramComboBox.SelectedItem
-        param_obj = self.par_objs[self.paramComboBox.SelectedIndex]
+        descriptor = self.par_descriptors[self.paramComboBox.SelectedIndex]
         
         # Check if this parameter is already added
         for setting in self.param_settings:
@@ -260,7 +338,7 @@ class ParamUI(Window):
         # Add new parameter
         param_setting = ParamSetting(
             name=param_name,
-            param_obj=param_obj,
+            descriptor=descriptor,
             min_val=0,
             max_val=100
         )
@@ -317,7 +395,10 @@ class ParamUI(Window):
     def OnCancel(self, *_):
         self.Close()
 
-    def OnProceed(self, *_):
+    def OnPreview(self, *_):
+        self.OnProceed(preview=True)
+
+    def OnProceed(self, sender=None, args=None, preview=False):
         try:
             if not self.console_visible:
                 self.consoleBorder.Visibility = Visibility.Visible
@@ -326,11 +407,12 @@ class ParamUI(Window):
             self.show_console = True
             self.progressBar.Value = 0
             self.progressBar.Visibility = Visibility.Visible
-            self.log('Proceed clicked')
+            self.log('Preview clicked' if preview else 'Proceed clicked')
             self.log('Starting checks...')
-            self.log('Checking family selection: SelectedIndex = {}'.format(self.familyBox.SelectedIndex))
-            if self.familyBox.SelectedIndex < 0:
-                self.log('Error: No family selected')
+            sel_inst = self.selected_instance()
+            self.log('Checking family selection: {}'.format(sel_inst.Id if sel_inst is not None else None))
+            if sel_inst is None:
+                self.log('Error: No family instance selected')
                 return
             self.log('Family selected ✓')
             self.log('Checking parameter selection...')
@@ -377,10 +459,22 @@ class ParamUI(Window):
                     return
             self.log('Parameter settings are correct ✓')
             self.log('All checks passed, starting animation...')
-            self.sel_inst = self.instances[self.familyBox.SelectedIndex]
+            self.sel_inst = sel_inst
+            if bool(getattr(self.multiTargetCheckBox, 'IsChecked', False)):
+                phase_step = _safe(self.phaseStepBox.Text, float) or 0.0
+                self.sel_inst = [frameplan.Target(e, (k * phase_step) % 1.0)
+                                 for k, e in enumerate(self.selected_targets)]
+                self.log('Multi-target: {} elements, phase step {}'.format(len(self.sel_inst), phase_step))
             self.is_instance = bool(getattr(self.instanceBox, 'IsChecked', False))
             self.sel_param_settings = self.param_settings
             self.frames, self.folder = frames, folder
+            self.adaptive = bool(getattr(self.adaptiveCheckBox, 'IsChecked', False))
+            self.auto_crop = bool(getattr(self.autoCropCheckBox, 'IsChecked', False))
+            self.keep_changes = bool(getattr(self.keepChangesCheckBox, 'IsChecked', False))
+            picked = set(self.extraViewsList.SelectedItems)
+            self.extra_views = [v for v in self.export_views if view_label(v) in picked]
+            if self.adaptive:
+                self.log('Adaptive sampling: {} frames is the budget'.format(frames))
             dpi_values = [72, 150, 300, 600, 1200]
             pixel_size_values = [1024, 2048, 4096, 8192]
             dpi_index = self.dpiComboBox.SelectedIndex
@@ -394,14 +488,25 @@ class ParamUI(Window):
             self.log('Выбрано: DPI = {}, Pixel size = {}'.format(self.resolution_dpi, self.pixel_size))
             self.scale_factor = float(self.customScaleBox.Text) if self.customScaleBox.Text else 1.0
             self.log('Data saved: instance={}, params={}, frames={}, folder={}, dpi={}, pixel_size={}, scale={}'.format(
-                self.sel_inst.Id, len(self.sel_param_settings), self.frames, self.folder, self.resolution_dpi, self.pixel_size, self.scale_factor))
-            run_animation(self)
+                sel_inst.Id, len(self.sel_param_settings), self.frames, self.folder, self.resolution_dpi, self.pixel_size, self.scale_factor))
+            if not preview:
+                run_animation(self)
+                return
+            self.preview_step = _safe(self.previewStepBox.Text, int)
+            if self.preview_step is None or self.preview_step < 1:
+                self.preview_step = 1
+            preview_gif = run_preview(self)
+            if preview_gif and forms.alert('Draft preview ready:\n{}\n\nRun the full export with the same plan?'.format(
+                    preview_gif), yes=True, no=True):
+                self.log('Preview confirmed, starting full pass...')
+                run_animation(self)
         except Exception as e:
             self.log('CRITICAL ERROR in OnProceed: {}'.format(e))
             import traceback
             self.log('Traceback:')
             self.log(traceback.format_exc())
         finally:
+            self.flush_log()
             self.progressBar.Visibility = Visibility.Collapsed
 
     def OnFramesModeChanged(self, sender, args):
@@ -424,199 +529,138 @@ class ParamUI(Window):
             
             if create_gif_checked:
                 self.loopGifCheckBox.IsEnabled = True
+                self.loopCountBox.IsEnabled = True
+                self.deltaGifCheckBox.IsEnabled = True
+                self.ditherComboBox.IsEnabled = True
+                self.encoderWorkersBox.IsEnabled = True
+                self.pipelineGifCheckBox.IsEnabled = True
+                self.collapseGifCheckBox.IsEnabled = True
+                self.gifWidthBox.IsEnabled = True
                 self.log('Loop checkbox enabled')
             else:
                 self.loopGifCheckBox.IsEnabled = False
                 self.loopGifCheckBox.IsChecked = False
+                self.loopCountBox.IsEnabled = False
+                self.deltaGifCheckBox.IsEnabled = False
+                self.ditherComboBox.IsEnabled = False
+                self.encoderWorkersBox.IsEnabled = False
+                self.pipelineGifCheckBox.IsEnabled = False
+                self.collapseGifCheckBox.IsEnabled = False
+                self.gifWidthBox.IsEnabled = False
                 self.log('Loop checkbox disabled and unchecked')
         except Exception as e:
             self.log('Error in OnCreateGifCheckChanged: {}'.format(e))
 
-    def create_gif_from_frames(self, folder, out_gif, loop_inf=True):
-        import System
-        from System.Drawing import Image, Imaging
-        from System.Drawing.Imaging import EncoderValue
-        import os
+    def create_gif_from_frames(self, folder, out_gif, loop_count=None, delta=False, dither=None,
+                               workers=1, paths=None, fps=None, collapse=False, times=None,
+                               width=None, pingpong=False, tracer=tracing.NULL_TRACER):
+        """Builds out_gif from the given frames (default: the folder's PNGs);
+        loop_count None = play once, 0 = forever; width None = export size"""
+        self.log('Starting GIF creation with loop_count={}, delta={}, dither={}, workers={}, fps={}, width={}, pingpong={}'.format(
+            loop_count, delta, dither, workers, fps, width, pingpong))
         
-        self.log('Starting GIF creation with loop_inf={}'.format(loop_inf))
-        
-        files = sorted([f for f in os.listdir(folder) if f.lower().endswith('.png')])
-        if not files:
+        if paths is None:
+            files = sorted([f for f in os.listdir(folder) if f.lower().endswith('.png')])
+            paths = [os.path.join(folder, f) for f in files]
+        if not paths:
             self.log("No PNG frames found in folder.")
             return
         
-        self.log('Found {} PNG files'.format(len(files)))
+        self.log('Found {} PNG files'.format(len(paths)))
+        if times is not None and len(times) != len(paths):
+            times = None  # frame times belong to another run
         
         try:
-            images = [Image.FromFile(os.path.join(folder, f)) for f in files]
-            w, h = images[0].Width, images[0].Height
-            self.log('First image size: {}x{}'.format(w, h))
-            
-            for img in images:
-                if img.Width != w or img.Height != h:
-                    self.log('All frames must have the same size!')
-                    for im in images:
-                        im.Dispose()
-                    return
-            
-            encoder = Imaging.Encoder.SaveFlag
-            enc = Imaging.EncoderParameters(1)
-            
-            # Find GIF codec
-            gif_codec = None
-            for c in Imaging.ImageCodecInfo.GetImageEncoders():
-                try:
-                    if c.FormatID.Equals(Imaging.ImageFormat.Gif.Guid):
-                        gif_codec = c
-                        break
-                except Exception as e:
-                    self.log('Error comparing codec GUID: {}'.format(e))
-                    continue
-            
-            if gif_codec is None:
-                self.log('GIF codec not found!')
-                for im in images:
-                    im.Dispose()
-                return
-            
-            self.log('GIF codec found: {}'.format(gif_codec.CodecName))
-            
-            # --- Netscape loop extension ---
-            if loop_inf:
-                self.log('Creating GIF with infinite loop...')
-                
-                def patch_gif_loop(gif_path):
-                    try:
-                        # Read file content
-                        with open(gif_path, 'rb') as f:
-                            content = bytearray(f.read())
-                        
-                        header = b'\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00'
-                        
-                        # Check if header already exists
-                        header_exists = False
-                        for i in range(len(content) - len(header) + 1):
-                            if content[i:i+len(header)] == header:
-                                header_exists = True
-                                break
-                        
-                        if not header_exists:
-                            # Find position to insert header (after GIF header and color table)
-                            pos = 13
-                            if len(content) > 10 and (content[10] & 0x80) != 0:
-                                gct_size = 3 * (2 ** ((content[10] & 0x07) + 1))
-                                pos += gct_size
-                            
-                            # Insert header at position
-                            new_content = content[:pos] + header + content[pos:]
-                            
-                            # Write back to file
-                            with open(gif_path, 'wb') as f:
-                                f.write(new_content)
-                            
-                            self.log('GIF loop extension added successfully at position {}'.format(pos))
-                        else:
-                            self.log('GIF loop extension already exists')
-                            
-                    except Exception as e:
-                        self.log('Error adding loop extension: {}'.format(e))
-                        import traceback
-                        self.log('Loop extension traceback: {}'.format(traceback.format_exc()))
-                
-
-                
-                # Alternative method: Try to create GIF with loop using different approach
-                try:
-                    # Method 1: Standard .NET approach
-                    enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.MultiFrame))
-                    images[0].Save(out_gif, gif_codec, enc)
-                    
-                    enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.FrameDimensionTime))
-                    for i, img in enumerate(images[1:], 1):
-                        img2 = img.Clone()
-                        images[0].SaveAdd(img2, enc)
-                        img2.Dispose()
-                        if i % 10 == 0:
-                            self.log('Added frame {} to GIF'.format(i))
-                    
-                    enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.Flush))
-                    images[0].SaveAdd(enc)
-                    images[0].Dispose()
-                    
-                    for img in images[1:]:
-                        img.Dispose()
-                    
-                    # Try to add loop extension
-                    patch_gif_loop(out_gif)
-                    self.log('GIF created with infinite loop: {}'.format(out_gif))
-                    
-                except Exception as e:
-                    self.log('Error with standard GIF creation: {}'.format(e))
-                    # Fallback: Create without loop extension
-                    self.log('Falling back to GIF without loop extension...')
-                    
-                    # Clean up any existing images
-                    try:
-                        for img in images:
-                            img.Dispose()
-                    except:
-                        pass
-                    
-                    # Recreate images
-                    images = [Image.FromFile(os.path.join(folder, f)) for f in files]
-                    
-                    enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.MultiFrame))
-                    images[0].Save(out_gif, gif_codec, enc)
-                    
-                    enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.FrameDimensionTime))
-                    for i, img in enumerate(images[1:], 1):
-                        img2 = img.Clone()
-                        images[0].SaveAdd(img2, enc)
-                        img2.Dispose()
-                        if i % 10 == 0:
-                            self.log('Added frame {} to GIF (fallback)'.format(i))
-                    
-                    enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.Flush))
-                    images[0].SaveAdd(enc)
-                    images[0].Dispose()
-                    
-                    for img in images[1:]:
-                        img.Dispose()
-                    
-                    self.log('GIF created without loop extension (fallback): {}'.format(out_gif))
-            else:
-                self.log('Creating GIF without loop...')
-                
-                enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.MultiFrame))
-                images[0].Save(out_gif, gif_codec, enc)
-                
-                enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.FrameDimensionTime))
-                for i, img in enumerate(images[1:], 1):
-                    img2 = img.Clone()
-                    images[0].SaveAdd(img2, enc)
-                    img2.Dispose()
-                    if i % 10 == 0:
-                        self.log('Added frame {} to GIF'.format(i))
-                
-                enc.Param[0] = Imaging.EncoderParameter(encoder, int(EncoderValue.Flush))
-                images[0].SaveAdd(enc)
-                images[0].Dispose()
-                
-                for img in images[1:]:
-                    img.Dispose()
-                
-                self.log('GIF created (no loop extension): {}'.format(out_gif))
+            # Streaming encoder: one decoded frame in memory at a time
+            # Frames are downscaled on load, so palette and encode work at GIF size
+            load_frame = bitmapio.gif_frame_loader(width)
+            self.log('Sampling frames for the global palette...')
+            palette = gifenc.build_global_palette(paths, load_frame=load_frame, log=self.log)
+            count = gifenc.encode_gif(paths, out_gif, delay_cs=gifenc.frame_delays(len(paths), fps, times),
+                                      load_frame=load_frame, log=self.log,
+                                      delta=delta, palette=palette, dither=dither,
+                                      workers=workers, pool='thread', collapse=collapse,
+                                      pingpong=pingpong, loop_count=loop_count, tracer=tracer)
+            self.log('GIF frames written: {}'.format(count))
+            self.log_gif_loop(out_gif, loop_count)
                 
         except Exception as e:
             self.log('Error in create_gif_from_frames: {}'.format(e))
             import traceback
             self.log('Traceback: {}'.format(traceback.format_exc()))
-            # Clean up images if they exist
+
+    def log_gif_loop(self, out_gif, loop_count):
+        # --- Netscape loop extension (written by the encoder with the header) ---
+        if loop_count is not None:
+            self.log('GIF created with loop count {} (0 = infinite): {}'.format(loop_count, out_gif))
+        else:
+            self.log('GIF created (no loop extension): {}'.format(out_gif))
+
+    def read_gif_settings(self):
+        """Reads the GIF options from the UI into a dict"""
+        loop_count = None
+        if hasattr(self, 'loopGifCheckBox') and self.loopGifCheckBox is not None:
             try:
-                for img in images:
-                    img.Dispose()
-            except:
-                pass
+                if bool(getattr(self.loopGifCheckBox, 'IsChecked', False)):
+                    loop_count = _safe(self.loopCountBox.Text, int)
+                    if loop_count is None or loop_count < 0 or loop_count > 65535:
+                        self.log('Invalid loop count "{}", looping infinitely'.format(self.loopCountBox.Text))
+                        loop_count = 0
+                self.log('Loop checkbox state: {}, loop count: {}'.format(loop_count is not None, loop_count))
+            except Exception as e:
+                self.log('Error reading loop checkbox: {}'.format(e))
+                loop_count = None
+        else:
+            self.log('Loop checkbox not found')
+        
+        delta = bool(getattr(self.deltaGifCheckBox, 'IsChecked', False))
+        self.log('Delta frames: {}'.format(delta))
+        dither_modes = [quantize.DITHER_NONE, quantize.DITHER_ORDERED, quantize.DITHER_DIFFUSION]
+        dither_index = self.ditherComboBox.SelectedIndex
+        dither = dither_modes[dither_index] if dither_index >= 0 else quantize.DITHER_NONE
+        self.log('Dithering: {}'.format(dither))
+        workers = _safe(self.encoderWorkersBox.Text, int)
+        if workers is None or workers < 1:
+            workers = 1
+        self.log('Encoder workers: {}'.format(workers))
+        pipelined = bool(getattr(self.pipelineGifCheckBox, 'IsChecked', False))
+        collapse = bool(getattr(self.collapseGifCheckBox, 'IsChecked', False))
+        self.log('Merge repeated frames: {}'.format(collapse))
+        width = _safe(self.gifWidthBox.Text, int)
+        if width is not None and width <= 0:
+            width = None
+        self.log('GIF width: {}'.format('{} px'.format(width) if width else 'export size'))
+        fps = self.read_fps()
+        self.log('Frame timing: {}'.format('{} fps'.format(fps) if fps else
+                                          '{} cs per frame'.format(gifenc.DEFAULT_DELAY_CS)))
+        pingpong = bool(getattr(self.pingpongCheckBox, 'IsChecked', False))
+        self.log('Ping-pong: {}'.format(pingpong))
+        return dict(loop_count=loop_count, delta=delta, dither=dither, workers=workers,
+                    pipelined=pipelined, collapse=collapse, fps=fps, width=width, pingpong=pingpong)
+
+    def read_fps(self):
+        """Frame rate in duration/FPS mode, else None (fixed delay per frame)"""
+        if not bool(getattr(self.durationFpsRadio, 'IsChecked', False)):
+            return None
+        fps = _safe(self.fpsBox.Text, float)
+        return fps if fps is not None and fps > 0 else None
+
+    def start_gif_pipeline(self, folder, settings, frames, times=None):
+        """Starts encoding animation.gif in the background while frames are exported"""
+        out_gif = os.path.join(folder, 'animation.gif')
+        self.log('Encoding GIF while exporting: {}'.format(out_gif))
+        return pipeline.BackgroundGifEncoder(out_gif, log=self.log, delta=settings['delta'],
+                                             dither=settings['dither'],
+                                             delay_cs=gifenc.frame_delays(frames, settings['fps'], times),
+                                             collapse=settings['collapse'],
+                                             loop_count=settings['loop_count'],
+                                             load_frame=bitmapio.gif_frame_loader(settings['width']),
+                                             tracer=getattr(self, 'tracer', None) or tracing.NULL_TRACER)
+
+    def finish_gif_pipeline(self, encoder, settings):
+        count = encoder.finish()
+        self.log('GIF frames written: {}'.format(count))
+        self.log_gif_loop(encoder.stream.out_path, settings['loop_count'])
 
     def OnCreateGif(self, sender, args):
         try:
@@ -635,19 +679,16 @@ class ParamUI(Window):
             out_gif = os.path.join(folder, 'animation.gif')
             self.log('Output GIF path: {}'.format(out_gif))
             
-            loop_inf = False
-            if hasattr(self, 'loopGifCheckBox') and self.loopGifCheckBox is not None:
-                try:
-                    loop_inf = bool(getattr(self.loopGifCheckBox, 'IsChecked', False))
-                    self.log('Loop checkbox state: {}'.format(loop_inf))
-                except Exception as e:
-                    self.log('Error reading loop checkbox: {}'.format(e))
-                    loop_inf = False
-            else:
-                self.log('Loop checkbox not found')
-            
-            self.log('Calling create_gif_from_frames with loop_inf={}'.format(loop_inf))
-            self.create_gif_from_frames(folder, out_gif, loop_inf=loop_inf)
+            settings = self.read_gif_settings()
+            self.log('Calling create_gif_from_frames with loop_count={}'.format(settings['loop_count']))
+            self.create_gif_from_frames(folder, out_gif, loop_count=settings['loop_count'],
+                                        delta=settings['delta'], dither=settings['dither'],
+                                        workers=settings['workers'],
+                                        paths=getattr(self, 'frame_paths', None),
+                                        fps=settings['fps'], collapse=settings['collapse'],
+                                        times=getattr(self, 'frame_times', None),
+                                        width=settings['width'], pingpong=settings['pingpong'],
+                                        tracer=getattr(self, 'tracer', None) or tracing.NULL_TRACER)
             
         except Exception as e:
             self.log('Error creating GIF: {}'.format(e))
@@ -655,78 +696,168 @@ class ParamUI(Window):
             self.log('Traceback: {}'.format(traceback.format_exc()))
 
 # --------------------- main ------------------------
+def run_preview(ui):
+    """Draft pass of the same plan: cheapest export settings, every Nth frame,
+    into <folder>/_preview; returns the preview GIF path or None"""
+    try:
+        folder = os.path.join(ui.folder, animator.PREVIEW_FOLDER)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        indices = animator.preview_indices(ui.frames, ui.preview_step)
+        linear = frameplan.linear_positions(ui.frames)
+        ui.log('Draft preview: {} of {} frames at {} DPI, {} px'.format(
+            len(indices), ui.frames, animator.PREVIEW_DPI, animator.PREVIEW_PIXEL_SIZE))
+        if ui.adaptive:
+            ui.log('Adaptive sampling is skipped in the preview (even spacing)')
+        ui.progressBar.Minimum = 0
+        ui.progressBar.Maximum = len(indices)
+        ui.progressBar.Value = 0
+        doc = revit.doc
+        result = animator.run_animation(
+            DB, doc, doc.ActiveView, ui.sel_inst, ui.is_instance, ui.sel_param_settings, ui.frames, folder,
+            animator.preview_export(), transaction=revit.Transaction, log=ui.log,
+            progress=lambda done, total: setattr(ui.progressBar, 'Value', done),
+            positions=[linear[i] for i in indices], auto_crop=ui.auto_crop)
+        settings = ui.read_gif_settings()
+        out_gif = os.path.join(folder, 'preview.gif')
+        ui.create_gif_from_frames(folder, out_gif, loop_count=0, delta=True, workers=settings['workers'],
+                                  paths=result.frame_paths, fps=settings['fps'], collapse=True,
+                                  times=indices, width=settings['width'], pingpong=settings['pingpong'])
+        if not os.path.exists(out_gif):
+            return None
+        try:
+            System.Diagnostics.Process.Start(out_gif)
+        except Exception as e:
+            ui.log('Could not open preview: {}'.format(e), logsink.WARNING)
+        return out_gif
+    except Exception as e:
+        ui.log('Error in draft preview: {}'.format(e), logsink.ERROR)
+        import traceback
+        ui.log(traceback.format_exc(), logsink.ERROR)
+        return None
+    finally:
+        ui.flush_log()
+
+def write_trace(ui, tracer):
+    """Saves trace.json next to the frames and logs mean/p95 per stage"""
+    if not tracer.events:
+        return
+    try:
+        path = os.path.join(ui.folder, tracing.TRACE_NAME)
+        tracer.save(path)
+        ui.log('Stage timings (Chrome trace: {}):'.format(path))
+        for line in tracer.summary_lines():
+            ui.log(line)
+    except Exception as e:
+        ui.log('Could not write trace: {}'.format(e), logsink.WARNING)
+
+def create_apng(ui, paths, tracer, folder=None):
+    """Assembles <folder>/animation.apng from the exported PNGs, copying
+    their compressed data when the formats match (lossless, no re-encode)"""
+    try:
+        out_path = os.path.join(folder or ui.folder, 'animation.apng')
+        times = ui.frame_times
+        if times is not None and len(times) != len(paths):
+            times = None
+        count = apng.write_apng(paths, out_path,
+                                delay_cs=gifenc.frame_delays(len(paths), ui.read_fps(), times),
+                                plays=0, collapse=True, load_frame=bitmapio.load_frame_bitmap, log=ui.log,
+                                pingpong=bool(getattr(ui.pingpongCheckBox, 'IsChecked', False)),
+                                tracer=tracer)
+        ui.log('APNG frames written: {} ({})'.format(count, out_path))
+    except Exception as e:
+        ui.log('Error creating APNG: {}'.format(e), logsink.ERROR)
+
 def run_animation(ui):
+    gif_pipeline = None
+    tracer = ui.tracer = tracing.Tracer()
     try:
         ui.progressBar.Visibility = Visibility.Visible
         ui.progressBar.Minimum = 0
         ui.progressBar.Maximum = ui.frames
         ui.progressBar.Value = 0
+        if bool(getattr(ui.logFileCheckBox, 'IsChecked', False)):
+            ui.log_sink.open_file(os.path.join(ui.folder, 'animation.log'))
         ui.log('Dialog confirmed, starting animation...')
         doc, view = revit.doc, revit.doc.ActiveView
+        views = [view] + list(getattr(ui, 'extra_views', None) or [])
+        if len(views) > 1:
+            ui.log('Exporting {} views per frame: {}'.format(len(views), ', '.join(v.Name for v in views)))
         ui.log('Animation parameters: frames={}, params={}, dpi={}, pixel_size={}, scale={}'.format(
             ui.frames, len(ui.sel_param_settings), ui.resolution_dpi, ui.pixel_size, ui.scale_factor))
-        for i in range(ui.frames):
-            ui.log('Processing frame {}/{}'.format(i+1, ui.frames))
-            with revit.Transaction('Animate params'):
-                if ui.is_instance:
-                    elem = doc.GetElement(ui.sel_inst.Id)
-                else:
-                    elem = doc.GetElement(ui.sel_inst.Symbol.Id)
-                for param_setting in ui.sel_param_settings:
-                    min_val = float(param_setting.MinValue)
-                    max_val = float(param_setting.MaxValue)
-                    step = (max_val - min_val) / float(ui.frames - 1)
-                    val = min_val + i * step
-                    ui.log('Setting parameter {} to value: {}'.format(param_setting.Name, val))
-                    pp = elem.LookupParameter(param_setting.Name)
-                    if pp:
-                        try:
-                            pp.Set(DB.UnitUtils.ConvertToInternalUnits(val, pp.GetUnitTypeId()))
-                            ui.log('Parameter {} set to {} (new API)'.format(param_setting.Name, val))
-                        except:
-                            try:
-                                pp.Set(DB.UnitUtils.ConvertToInternalUnits(val, pp.DisplayUnitType))
-                                ui.log('Parameter {} set to {} (old API)'.format(param_setting.Name, val))
-                            except Exception as e:
-                                pp.Set(val)
-                                ui.log('Parameter {} set to {} (direct)'.format(param_setting.Name, val))
-            try:
-                doc.RefreshActiveView()
-                ui.log('View refreshed')
-            except:
-                ui.log('Skipping view refresh')
-            # Calculate final pixel size for logging
-            scaled_pixel_size = int(ui.pixel_size * ui.scale_factor)
-            if ui.resolution_dpi > 600:
-                final_pixel_size = int(scaled_pixel_size * (ui.resolution_dpi / 600.0))
-                effective_dpi = "600 (simulated {})".format(ui.resolution_dpi)
-            else:
-                final_pixel_size = scaled_pixel_size
-                effective_dpi = str(ui.resolution_dpi)
-            
-            ui.log('Exporting frame {} to folder {} with DPI={}, pixel_size={}, scale={}, final_size={}'.format(
-                i, ui.folder, effective_dpi, ui.pixel_size, ui.scale_factor, final_pixel_size))
-            export_frame(doc, view, ui.folder, i, ui.resolution_dpi, ui.pixel_size, ui.scale_factor)
-            ui.progressBar.Value = i + 1
-        ui.log('Animation finished! Done! Frames created: {}'.format(ui.frames))
+        create_gif_checked = bool(getattr(ui.createGifCheckBox, 'IsChecked', False))
+        gif_settings = ui.read_gif_settings() if create_gif_checked else None
+        # --- Adaptive sampling: probe renders decide where frames go ---
+        positions = ui.frame_times = None
+        if ui.adaptive:
+            ui.log('Adaptive sampling: rendering low-res probes for a budget of {} frames...'.format(ui.frames))
+            positions = adaptive.sample_positions(
+                DB, doc, view, ui.sel_inst, ui.is_instance, ui.sel_param_settings, ui.frames, ui.folder,
+                transaction=revit.Transaction, log=ui.log, load_frame=bitmapio.load_frame_bitmap)
+            ui.frame_times = adaptive.frame_times(positions, ui.frames)
+            ui.progressBar.Maximum = len(positions)
+        if gif_settings and gif_settings['pipelined'] and len(views) > 1:
+            ui.log('Pipelined GIF encoding is off for multi-view runs; GIFs are built after export')
+        elif gif_settings and gif_settings['pipelined'] and gif_settings['pingpong']:
+            ui.log('Pipelined GIF encoding is off in ping-pong mode; the GIF is built after export')
+        elif gif_settings and gif_settings['pipelined']:
+            gif_pipeline = ui.start_gif_pipeline(ui.folder, gif_settings,
+                                                 len(positions) if positions else ui.frames,
+                                                 ui.frame_times)
+        ui.frame_paths = None
+        export_options = {'dpi': ui.resolution_dpi, 'pixel_size': ui.pixel_size,
+                          'scale': ui.scale_factor}
+        result = animator.run_animation(
+            DB, doc, views if len(views) > 1 else view, ui.sel_inst, ui.is_instance, ui.sel_param_settings,
+            ui.frames, ui.folder, export_options, transaction=revit.Transaction, log=ui.log, tracer=tracer,
+            progress=lambda done, total: setattr(ui.progressBar, 'Value', done),
+            on_frame=gif_pipeline.submit if gif_pipeline is not None else None,
+            reuse_frames=bool(getattr(ui.reuseFramesCheckBox, 'IsChecked', False)),
+            positions=positions, auto_crop=ui.auto_crop, keep_changes=ui.keep_changes)
+        ui.frame_paths = result.frame_paths
         # --- Create GIF if checkbox is checked ---
         try:
-            create_gif_checked = bool(getattr(ui.createGifCheckBox, 'IsChecked', False))
             ui.log('Create GIF checkbox state: {}'.format(create_gif_checked))
             
-            if create_gif_checked:
+            if gif_pipeline is not None:
+                ui.log('Finishing GIF encoded during export...')
+                ui.finish_gif_pipeline(gif_pipeline, gif_settings)
+                gif_pipeline = None
+            elif create_gif_checked and len(views) > 1:
+                for name, seq_folder, seq_paths in result.sequences:
+                    ui.log('Creating GIF for view "{}"...'.format(name))
+                    ui.create_gif_from_frames(seq_folder, os.path.join(seq_folder, 'animation.gif'),
+                                              loop_count=gif_settings['loop_count'], delta=gif_settings['delta'],
+                                              dither=gif_settings['dither'], workers=gif_settings['workers'],
+                                              paths=seq_paths, fps=gif_settings['fps'],
+                                              collapse=gif_settings['collapse'], times=ui.frame_times,
+                                              width=gif_settings['width'],
+                                              pingpong=gif_settings['pingpong'], tracer=tracer)
+            elif create_gif_checked:
                 ui.log('Creating GIF as requested...')
                 ui.OnCreateGif(None, None)
             else:
                 ui.log('Create GIF checkbox not checked, skipping GIF creation')
         except Exception as e:
-            ui.log('Error checking create GIF checkbox: {}'.format(e))
+            ui.log('Error creating GIF: {}'.format(e))
+        if bool(getattr(ui.apngCheckBox, 'IsChecked', False)):
+            if len(views) > 1:
+                for _, seq_folder, seq_paths in result.sequences:
+                    create_apng(ui, seq_paths, tracer, seq_folder)
+            else:
+                create_apng(ui, result.frame_paths, tracer)
     except Exception as e:
-        ui.log('CRITICAL ERROR in animation: {}'.format(e))
+        ui.log('CRITICAL ERROR in animation: {}'.format(e), logsink.ERROR)
         import traceback
-        ui.log('Traceback:')
-        ui.log(traceback.format_exc())
+        ui.log('Traceback:', logsink.ERROR)
+        ui.log(traceback.format_exc(), logsink.ERROR)
     finally:
+        if gif_pipeline is not None:
+            ui.log('Aborting background GIF encoding', logsink.WARNING)
+            gif_pipeline.abort()
+        ui.tracer = None
+        write_trace(ui, tracer)
+        ui.log_sink.close_file()
         ui.progressBar.Visibility = Visibility.Collapsed
 
 def animate():
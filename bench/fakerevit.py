@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Stand-in for the parts of the Revit API the animator touches.
+
+Pass this module as ``db`` and a FakeDoc as the document to
+animator.run_animation, adaptive.sample_positions or jobs.run_jobs.
+ExportImage writes synthetic PNG frames (a white sheet with a grid and a
+block whose width follows the animated parameter) at the requested pixel
+size. A few variants per size are rendered once and copied afterwards,
+so benchmarks time the pipeline, not the stand-in. Views carry an
+axis-aligned crop box and the instance a bounding box that follows
+'Width', enough for autocrop. Rolling back a TransactionGroup restores
+the instance's parameter values.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GIF.pushbutton'))
+
+import pngio  # noqa: E402
+
+VARIANTS = 16       # distinct synthetic images per size
+ASPECT = (4, 3)     # width : height of exported images
+GRID = 64           # px between grid lines
+PARAM_MAX = 1000.0  # parameter value that fills the block across the sheet
+SHEET_WIDTH = 40.0  # view extent in model units (feet), matching ASPECT
+SHEET_HEIGHT = 30.0
+
+
+class _Enum(object):
+    """Enum stand-in: any member is its own name"""
+
+    def __getattr__(self, name):
+        return name
+
+
+ExportRange = _Enum()
+ImageResolution = _Enum()
+FitDirectionType = _Enum()
+ImageFileType = _Enum()
+
+
+class ElementId(object):
+    def __init__(self, value):
+        self.Value = int(value)
+
+    def __eq__(self, other):
+        return isinstance(other, ElementId) and other.Value == self.Value
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.Value)
+
+
+class XYZ(object):
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.X, self.Y, self.Z = x, y, z
+
+
+class Transform(object):
+    """Identity transform (views and boxes are axis-aligned here)"""
+
+    @property
+    def Inverse(self):
+        return self
+
+    def OfPoint(self, point):
+        return XYZ(point.X, point.Y, point.Z)
+
+
+class BoundingBoxXYZ(object):
+    def __init__(self, lo=None, hi=None):
+        self.Min = lo or XYZ()
+        self.Max = hi or XYZ()
+        self.Transform = Transform()
+
+
+class UnitUtils(object):
+    @staticmethod
+    def ConvertToInternalUnits(value, unit):
+        return value / 304.8 if unit == 'mm' else value
+
+
+class ImageExportOptions(object):
+    def __init__(self):
+        self.FilePath = None
+        self.PixelSize = 0
+        self.ExportRange = None
+
+    def SetViewsAndSheets(self, ids):
+        self.view_ids = list(ids)
+
+
+class Transaction(object):
+    def __init__(self, doc, name):
+        self.doc = doc
+        self.name = name
+
+    def Start(self):
+        self.doc.transactions += 1
+
+    def Commit(self):
+        pass
+
+    def RollBack(self):
+        self.doc.rollbacks += 1
+
+
+class TransactionGroup(object):
+    def __init__(self, doc, name):
+        self.doc = doc
+        self.name = name
+        self._saved = None
+
+    def Start(self):
+        self._saved = dict((name, p.value) for name, p in self.doc.instance.params.items())
+
+    def Assimilate(self):
+        self.doc.assimilated += 1
+
+    def RollBack(self):
+        for name, value in self._saved.items():
+            self.doc.instance.params[name].value = value
+        self.doc.group_rollbacks += 1
+
+
+class FilteredElementCollector(object):
+    def __init__(self, doc):
+        self.doc = doc
+
+    def OfClass(self, cls):
+        return list(self.doc.views)
+
+
+class FormatOptions(object):
+    def __init__(self, accuracy):
+        self.Accuracy = accuracy
+
+
+class Units(object):
+    """Display formats: lengths to whole millimetres"""
+
+    def GetFormatOptions(self, spec):
+        return FormatOptions(1.0 if spec == 'length' else 0.01)
+
+
+class _Definition(object):
+    def __init__(self, name):
+        self.Name = name
+
+    def GetDataType(self):
+        return 'length'
+
+
+class Parameter(object):
+    def __init__(self, value=0.0, unit='mm', name=None):
+        self.value = value
+        self.unit = unit
+        self.Definition = _Definition(name)
+
+    def GetUnitTypeId(self):
+        return self.unit
+
+    def AsDouble(self):
+        return self.value
+
+    def Set(self, value):
+        self.value = value
+
+
+class _Symbol(object):
+    def __init__(self, element_id):
+        self.Id = element_id
+
+
+class FamilyInstance(object):
+    def __init__(self, element_id, params):
+        self.Id = ElementId(element_id)
+        self.Symbol = _Symbol(self.Id)
+        self.params = params
+
+    def LookupParameter(self, name):
+        return self.params.get(name)
+
+    def get_BoundingBox(self, view):
+        """Block on the sheet: x from 1/8 of the view, width follows 'Width' (feet)"""
+        fill = self.params['Width'].value * 304.8 / PARAM_MAX
+        left = SHEET_WIDTH / 8.0
+        return BoundingBoxXYZ(XYZ(left, SHEET_HEIGHT / 3.0, 0.0),
+                              XYZ(left + max(fill, 0.01) * SHEET_WIDTH * 0.75, 2 * SHEET_HEIGHT / 3.0, 1.0))
+
+
+class View(object):
+    IsTemplate = False
+    IsPerspective = False
+
+    def __init__(self, element_id, name):
+        self.Id = ElementId(element_id)
+        self.Name = name
+        self.CropBox = BoundingBoxXYZ(XYZ(0.0, 0.0, -10.0), XYZ(SHEET_WIDTH, SHEET_HEIGHT, 10.0))
+        self.CropBoxActive = True  # exports cover the crop box
+        self.CropBoxVisible = True
+
+
+class FakeDoc(object):
+    """Document with one family instance whose 'Width' drives the image"""
+
+    def __init__(self, work_dir=None):
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='fakerevit_')
+        if not os.path.isdir(self.work_dir):
+            os.makedirs(self.work_dir)
+        self.instance = FamilyInstance(1000, {'Width': Parameter(name='Width'),
+                                              'Height': Parameter(name='Height')})
+        self.ActiveView = View(1, '3D View')
+        self.views = [self.ActiveView, View(2, 'Elevation')]
+        self.transactions = 0
+        self.rollbacks = 0
+        self.group_rollbacks = 0
+        self.assimilated = 0
+        self.refreshes = 0
+        self.exports = 0
+        self._variants = {}
+
+    def GetElement(self, element_id):
+        if element_id == self.instance.Id:
+            return self.instance
+        for view in self.views:
+            if view.Id == element_id:
+                return view
+        return None
+
+    def GetUnits(self):
+        return Units()
+
+    def RefreshActiveView(self):
+        self.refreshes += 1
+
+    def ExportImage(self, opts):
+        self.exports += 1
+        width = int(opts.PixelSize)
+        fill = self.instance.params['Width'].value * 304.8 / PARAM_MAX
+        variant = min(VARIANTS - 1, max(0, int(round(fill * (VARIANTS - 1)))))
+        shutil.copyfile(self._variant_path(width, variant), opts.FilePath)
+
+    def prepare(self, width):
+        """Renders every variant for a pixel size up front"""
+        for variant in range(VARIANTS):
+            self._variant_path(width, variant)
+
+    def _variant_path(self, width, variant):
+        key = (width, variant)
+        if key not in self._variants:
+            path = os.path.join(self.work_dir, 'variant_{}_{:02d}.png'.format(width, variant))
+            height = width * ASPECT[1] // ASPECT[0]
+            pngio.write_png(path, width, height, synthetic_frame(width, height, variant / float(VARIANTS - 1)))
+            self._variants[key] = path
+        return self._variants[key]
+
+    def cleanup(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def synthetic_frame(width, height, fill):
+    """Packed RGB: white sheet, grey grid, blue block covering ``fill`` of the width"""
+    white = bytearray(b'\xff\xff\xff')
+    grey = bytearray(b'\xc0\xc0\xc0')
+    blue = bytearray(b'\x30\x60\xc0')
+    line = white * width
+    for x in range(0, width, GRID):
+        line[x * 3:x * 3 + 3] = grey
+    grid_row = grey * width
+    left, right = width // 8, width // 8 + int(fill * width * 3 // 4)
+    top, bottom = height // 3, 2 * height // 3
+    block_row = line[:left * 3] + blue * (right - left) + line[right * 3:]
+    rows = []
+    for y in range(height):
+        if top <= y < bottom and right > left:
+            rows.append(block_row)
+        elif y % GRID == 0:
+            rows.append(grid_row)
+        else:
+            rows.append(line)
+    return b''.join(bytes(r) for r in rows)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the export and GIF stages against the fake Revit backend.
+
+    python bench/run_bench.py --frames 10,100 --sizes 1024,2048 --out bench.json
+    python bench/run_bench.py --frames 10 --sizes 1024 --compare bench.json
+
+Every (frame count, pixel size) case runs these stages in order: export
+(run_animation with a fresh cache), export_cached (a re-run that reuses
+every frame), decode, palette, encode and, with --workers > 1,
+encode_parallel. With --gif-width the palette and encode stages downsample
+frames to that width first (as the dialog's GIF width does). Times come from an untraced pass; peak memory comes from
+a second pass under tracemalloc (skip it with --no-memory) and covers this
+process only, not pool workers. Results are
+written as JSON so runs can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import fakerevit
+
+import animator
+import gifenc
+import jobs
+import pngio
+import resample
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2 / IronPython
+    tracemalloc = None
+
+DEFAULT_FRAMES = '10,100,500'
+DEFAULT_SIZES = '1024,2048,4096,8192'
+PARAMS = [jobs.ParamRange('Width', 0.0, fakerevit.PARAM_MAX)]
+
+
+def measure(fn, memory=True):
+    """Runs fn; returns (result, seconds, peak traced bytes or None)"""
+    start = time.time()
+    result = fn()
+    seconds = time.time() - start
+    peak = None
+    if memory and tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run_case(frames, size, workers=0, memory=True, log=None, gif_width=None):
+    """Benchmarks one frame count / pixel size; returns a list of stage dicts"""
+    work = tempfile.mkdtemp(prefix='gifbench_')
+    doc = fakerevit.FakeDoc(os.path.join(work, 'variants'))
+    folder = os.path.join(work, 'frames')
+    os.makedirs(folder)
+    export = {'dpi': 300, 'pixel_size': size, 'scale': 1.0}
+    height = size * fakerevit.ASPECT[1] // fakerevit.ASPECT[0]
+    rows = []
+
+    def record(stage, seconds, peak, output=None):
+        row = {'frames': frames, 'size': size, 'stage': stage, 'seconds': round(seconds, 4),
+               'ms_per_frame': round(1000.0 * seconds / frames, 3),
+               'frames_per_s': round(frames / seconds, 2) if seconds else None,
+               'mpix_per_s': round(frames * size * height / 1e6 / seconds, 2) if seconds else None,
+               'peak_mb': round(peak / 1048576.0, 2) if peak is not None else None,
+               'output_bytes': output}
+        rows.append(row)
+        if log:
+            log(row)
+
+    def animate(reuse):
+        return animator.run_animation(fakerevit, doc, None, doc.instance, True, PARAMS, frames,
+                                      folder, export, reuse_frames=reuse)
+
+    try:
+        doc.prepare(size)  # synthetic images are rendered outside the timings
+        result, seconds, peak = measure(lambda: animate(False), memory)
+        record('export', seconds, peak)
+        _, seconds, peak = measure(lambda: animate(True), memory)
+        record('export_cached', seconds, peak)
+        paths = result.frame_paths
+        load = resample.scaled_loader(gif_width)
+
+        def decode():
+            for path in paths:
+                pngio.read_png(path)
+        _, seconds, peak = measure(decode, memory)
+        record('decode', seconds, peak)
+        palette, seconds, peak = measure(lambda: gifenc.build_global_palette(paths, load_frame=load), memory)
+        record('palette', seconds, peak)
+        out_gif = os.path.join(work, 'animation.gif')
+        _, seconds, peak = measure(lambda: gifenc.encode_gif(
+            paths, out_gif, load_frame=load, delta=True, palette=palette, collapse=True), memory)
+        record('encode', seconds, peak, os.path.getsize(out_gif))
+        if workers > 1:
+            _, seconds, peak = measure(lambda: gifenc.encode_gif(
+                paths, out_gif, load_frame=load, delta=True, palette=palette, collapse=True,
+            workers=workers), memory)
+            record('encode_parallel', seconds, peak, os.path.getsize(out_gif))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return rows
+
+
+def environment():
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'platform': platform.platform(), 'numpy': pngio.np.__version__ if pngio.np else None,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(rows, baseline):
+    """Lines of per-stage speedups against a previous results file"""
+    old = dict(((r['frames'], r['size'], r['stage']), r) for r in baseline['results'])
+    lines = ['{:>6} {:>6} {:<16} {:>10} {:>10} {:>8}'.format(
+        'frames', 'size', 'stage', 'old s', 'new s', 'speedup')]
+    for r in rows:
+        o = old.get((r['frames'], r['size'], r['stage']))
+        if o is None or not r['seconds']:
+            continue
+        lines.append('{:>6} {:>6} {:<16} {:>10.3f} {:>10.3f} {:>7.2f}x'.format(
+            r['frames'], r['size'], r['stage'], o['seconds'], r['seconds'], o['seconds'] / r['seconds']))
+    return lines
+
+
+def _ints(text):
+    return [int(v) for v in text.split(',') if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--frames', default=DEFAULT_FRAMES, help='comma-separated frame counts')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated pixel sizes')
+    parser.add_argument('--workers', type=int, default=0, help='also time a process pool encode')
+    parser.add_argument('--gif-width', type=int, help='downsample frames to this width before encoding')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced peak-memory pass')
+    parser.add_argument('--out', help='write JSON results here (default: stdout)')
+    parser.add_argument('--compare', help='previous results file to print speedups against')
+    args = parser.parse_args(argv)
+
+    def log(row):
+        sys.stderr.write('{frames:>5} x {size:<5} {stage:<16} {seconds:>9.3f} s  '
+                         '{frames_per_s} frames/s  peak {peak_mb} MB\n'.format(**row))
+
+    rows = []
+    for size in _ints(args.sizes):
+        for frames in _ints(args.frames):
+            rows.extend(run_case(frames, size, args.workers, not args.no_memory, log,
+                                 args.gif_width))
+    report = {'environment': environment(), 'results': rows}
+    text = json.dumps(report, indent=1, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(rows, json.load(f)):
+                sys.stderr.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Adaptive frame placement from probe differences.
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import fakerevit  # noqa: E402  (puts GIF.pushbutton on sys.path)
+
+import adaptive  # noqa: E402
+import jobs  # noqa: E402
+
+
+def grid(count):
+    return [k / float(count - 1) for k in range(count)]
+
+
+class SelectPositionsTest(unittest.TestCase):
+
+    def assertPositions(self, actual, expected):
+        self.assertEqual(len(actual), len(expected))
+        for a, e in zip(actual, expected):
+            self.assertAlmostEqual(a, e)
+
+    def test_linear_change_gets_the_whole_budget_evenly_spaced(self):
+        probes = grid(9)
+        for budget in (30, 60):
+            positions = adaptive.select_positions(probes, [0.05] * 8, budget)
+            self.assertPositions(positions, grid(budget))
+
+    def test_static_stretch_costs_one_frame(self):
+        # nothing changes over the first half, steadily over the second
+        probes = grid(9)
+        positions = adaptive.select_positions(probes, [0.0] * 4 + [0.05] * 4, 11)
+        self.assertPositions(positions, [0.0] + [0.5 + k * 0.05 for k in range(1, 11)])
+
+    def test_frames_follow_the_size_of_the_change(self):
+        # the middle interval changes three times as much as each outer one
+        positions = adaptive.select_positions([0.0, 0.25, 0.75, 1.0], [0.1, 0.3, 0.1], 6)
+        self.assertPositions(positions, [0.0, 0.25, 5 / 12.0, 7 / 12.0, 0.75, 1.0])
+
+    def test_no_change_keeps_the_ends(self):
+        self.assertEqual(adaptive.select_positions(grid(5), [0.0, 0.001, 0.0, 0.0], 20), [0.0, 1.0])
+
+    def test_frame_times_keep_the_pace(self):
+        self.assertEqual(adaptive.frame_times([0.0, 0.5, 1.0], 11), [0.0, 5.0, 10.0])
+
+
+class SamplePositionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp(prefix='adaptive_test_')
+        self.doc = fakerevit.FakeDoc(os.path.join(self.work, 'fake'))
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def test_budget_is_spent_within_half_as_many_probes(self):
+        params = [jobs.ParamRange('Width', 0.0, fakerevit.PARAM_MAX)]
+        positions = adaptive.sample_positions(fakerevit, self.doc, None, self.doc.instance, True,
+                                              params, 30, self.work)
+        self.assertEqual(len(positions), 30)
+        self.assertEqual((positions[0], positions[-1]), (0.0, 1.0))
+        self.assertEqual(positions, sorted(positions))
+        self.assertTrue(self.doc.exports <= 15)
+        self.assertEqual(self.doc.group_rollbacks, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""run_animation against the fake Revit backend in bench/fakerevit.py.
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import fakerevit  # noqa: E402  (puts GIF.pushbutton on sys.path)
+
+import animator  # noqa: E402
+import jobs  # noqa: E402
+
+EXPORT = {'dpi': 72, 'pixel_size': 64, 'scale': 1.0}
+
+
+def frame_names(count):
+    return ['frame_{:03d}.png'.format(i) for i in range(count)]
+
+
+class RunAnimationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp(prefix='animator_test_')
+        self.doc = fakerevit.FakeDoc(os.path.join(self.work, 'fake'))
+        self.folder = os.path.join(self.work, 'frames')
+        os.makedirs(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def run_frames(self, name='Width', frames=5, **kwargs):
+        return animator.run_animation(fakerevit, self.doc, None, self.doc.instance, True,
+                                      [jobs.ParamRange(name, 0.0, fakerevit.PARAM_MAX)],
+                                      frames, self.folder, EXPORT, **kwargs)
+
+    def test_exports_every_frame_and_restores_the_model(self):
+        result = self.run_frames()
+        self.assertEqual((result.exported, result.reused), (5, 0))
+        self.assertEqual(self.doc.exports, 5)
+        self.assertEqual([os.path.basename(p) for p in result.frame_paths], frame_names(5))
+        for path in result.frame_paths:
+            self.assertTrue(os.path.getsize(path) > 0)
+        self.assertEqual(self.doc.group_rollbacks, 1)
+        self.assertEqual(self.doc.instance.params['Width'].value, 0.0)
+
+    def test_keep_changes_leaves_the_last_frame(self):
+        self.run_frames(keep_changes=True)
+        self.assertEqual((self.doc.assimilated, self.doc.group_rollbacks), (1, 0))
+        self.assertAlmostEqual(self.doc.instance.params['Width'].value, fakerevit.PARAM_MAX / 304.8)
+
+    def test_rerun_reuses_cached_frames(self):
+        self.run_frames()
+        result = self.run_frames()
+        self.assertEqual((result.exported, result.reused), (0, 5))
+        self.assertEqual(self.doc.exports, 5)
+
+    def test_cache_keys_include_parameter_names(self):
+        # same element, range and values: a Height run must not reuse Width frames
+        self.run_frames('Width')
+        result = self.run_frames('Height')
+        self.assertEqual((result.exported, result.reused), (5, 0))
+        self.assertEqual(self.doc.exports, 10)
+
+    def test_exported_file_with_view_name_is_renamed(self):
+        export_image = self.doc.ExportImage
+
+        def with_view_name(opts):
+            path = opts.FilePath
+            opts.FilePath = path[:-len('.png')] + ' - 3D View - {3D}.png'
+            export_image(opts)
+            opts.FilePath = path
+        self.doc.ExportImage = with_view_name
+        result = self.run_frames(frames=3)
+        self.assertEqual([os.path.basename(p) for p in result.frame_paths], frame_names(3))
+        self.assertEqual(sorted(f for f in os.listdir(self.folder) if f.endswith('.png')),
+                         frame_names(3))
+
+    def test_failed_export_does_not_return_a_stale_frame(self):
+        self.run_frames(frames=3)
+        stale = os.path.join(self.folder, 'frame_000 - 3D View.png')
+        shutil.copyfile(os.path.join(self.folder, 'frame_000.png'), stale)
+        self.doc.ExportImage = lambda opts: None
+        with self.assertRaises(IOError):
+            self.run_frames('Height', frames=3)
+        self.assertFalse(os.path.exists(stale))
+
+    def test_views_sharing_a_name_get_their_own_folders(self):
+        # e.g. a floor plan and a ceiling plan both called "Level 1"
+        twin = fakerevit.View(3, 'Elevation')
+        self.doc.views.append(twin)
+        views = [self.doc.views[1], twin]
+        result = animator.run_animation(fakerevit, self.doc, views, self.doc.instance, True,
+                                        [jobs.ParamRange('Width', 0.0, fakerevit.PARAM_MAX)],
+                                        3, self.folder, EXPORT)
+        folders = [folder for _, folder, _ in result.sequences]
+        self.assertEqual([os.path.basename(f) for f in folders], ['Elevation (2)', 'Elevation (3)'])
+        for folder in folders:
+            self.assertEqual(sorted(f for f in os.listdir(folder) if f.endswith('.png')), frame_names(3))
+        self.assertEqual(self.doc.exports, 6)
+        with self.assertRaises(ValueError):
+            jobs.resolve_view(fakerevit, self.doc, 'Elevation')
+        self.assertIs(jobs.resolve_view(fakerevit, self.doc, 3), twin)
+
+
+if __name__ == '__main__':
+    unittest.main()
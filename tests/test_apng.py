@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""APNG assembly from exported PNG frames.
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GIF.pushbutton'))
+
+import apng  # noqa: E402
+import gifenc  # noqa: E402
+import pngio  # noqa: E402
+
+WIDTH, HEIGHT = 8, 6
+RED, GREEN, BLUE, WHITE = (200, 0, 0), (0, 200, 0), (0, 0, 200), (255, 255, 255)
+
+
+def write_frames(folder, colors):
+    """One solid 8-bit RGB PNG per color; returns their paths"""
+    paths = []
+    for i, color in enumerate(colors):
+        path = os.path.join(folder, 'frame_{:03d}.png'.format(i))
+        pngio.write_png(path, WIDTH, HEIGHT, bytearray(color) * (WIDTH * HEIGHT))
+        paths.append(path)
+    return paths
+
+
+def write_gray(path, value):
+    """Solid 8-bit grayscale PNG (same size, different format)"""
+    rows = b''.join(b'\x00' + bytes(bytearray([value] * WIDTH)) for _ in range(HEIGHT))
+    with open(path, 'wb') as f:
+        f.write(pngio.PNG_SIGNATURE)
+        pngio.write_chunk(f, b'IHDR', struct.pack('>IIBBBBB', WIDTH, HEIGHT, 8, 0, 0, 0, 0))
+        pngio.write_chunk(f, b'IDAT', zlib.compress(rows))
+        pngio.write_chunk(f, b'IEND', b'')
+
+
+def read_apng(path):
+    """Returns (plays, [(delay_cs, first RGB pixel)]) and checks the chunk sequence"""
+    plays = None
+    frames = []
+    seq = 0
+    with open(path, 'rb') as f:
+        assert f.read(8) == pngio.PNG_SIGNATURE
+        for ctype, data in pngio.iter_chunks(f):
+            if ctype == b'acTL':
+                count, plays = struct.unpack('>II', data)
+            elif ctype == b'fcTL':
+                fields = struct.unpack('>IIIIIHHBB', data)
+                assert fields[0] == seq, 'fcTL sequence {} != {}'.format(fields[0], seq)
+                seq += 1
+                frames.append([fields[5], b''])
+            elif ctype == b'IDAT':
+                frames[-1][1] += data
+            elif ctype == b'fdAT':
+                assert struct.unpack('>I', data[:4])[0] == seq
+                seq += 1
+                frames[-1][1] += data[4:]
+    assert count == len(frames), 'acTL says {} frames, found {}'.format(count, len(frames))
+    rgb = [bytearray(zlib.decompress(data)) for _, data in frames]
+    return plays, [(delay, tuple(pixels[1:4])) for (delay, _), pixels in zip(frames, rgb)]
+
+
+class WriteApngTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp(prefix='apng_test_')
+        self.out = os.path.join(self.work, 'animation.png')
+        self.messages = []
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def log(self, message, level=None):
+        self.messages.append(message)
+
+    def test_matching_frames_are_copied(self):
+        paths = write_frames(self.work, [RED, GREEN, BLUE, WHITE])
+        count = apng.write_apng(paths, self.out, [5, 10, 15, 20], plays=2, log=self.log)
+        self.assertEqual(count, 4)
+        plays, frames = read_apng(self.out)
+        self.assertEqual(plays, 2)
+        self.assertEqual(frames, [(5, RED), (10, GREEN), (15, BLUE), (20, WHITE)])
+        self.assertIn('no decode', self.messages[0])
+        # the compressed data are the exported bytes
+        with open(self.out, 'rb') as f:
+            self.assertIn(apng.read_layout(paths[2])[2][0], f.read())
+
+    def test_mixed_formats_are_reencoded(self):
+        paths = write_frames(self.work, [RED, GREEN, BLUE])
+        write_gray(paths[1], 90)
+        self.assertIn('frame_001.png', apng.mismatch(paths))
+        self.assertEqual(apng.write_apng(paths, self.out, 7, log=self.log), 3)
+        self.assertEqual(read_apng(self.out)[1], [(7, RED), (7, (90, 90, 90)), (7, BLUE)])
+        self.assertIn('re-encoding', self.messages[0])
+
+    def test_frame_size_mismatch_is_an_error(self):
+        paths = write_frames(self.work, [RED, GREEN])
+        pngio.write_png(paths[1], WIDTH + 1, HEIGHT, bytearray(GREEN) * ((WIDTH + 1) * HEIGHT))
+        with self.assertRaises(ValueError):
+            apng.write_apng(paths, self.out)
+
+    def test_collapse_merges_repeated_frames(self):
+        paths = write_frames(self.work, [RED, RED, GREEN, GREEN, GREEN, RED])
+        self.assertEqual(apng.write_apng(paths, self.out, 10, collapse=True, log=self.log), 3)
+        self.assertEqual(read_apng(self.out)[1], [(20, RED), (30, GREEN), (10, RED)])
+        self.assertIn('Merged 3 repeated frames', self.messages[-1])
+
+    def test_collapse_respects_the_delay_limit(self):
+        paths = write_frames(self.work, [RED, RED])
+        apng.write_apng(paths, self.out, gifenc.MAX_DELAY_CS, collapse=True)
+        self.assertEqual(read_apng(self.out)[1], [(gifenc.MAX_DELAY_CS, RED)] * 2)
+
+    def test_pingpong_plays_forward_then_back(self):
+        colors = [RED, GREEN, BLUE, WHITE]
+        delays = [5, 10, 15, 20]
+        paths = write_frames(self.work, colors)
+        self.assertEqual(apng.write_apng(paths, self.out, delays, pingpong=True), 6)
+        frames = read_apng(self.out)[1]
+        self.assertEqual([color for _, color in frames], gifenc.pingpong_order(colors))
+        self.assertEqual([delay for delay, _ in frames], gifenc.pingpong_delays(delays))
+
+    def test_pingpong_turning_points_merge_with_collapse(self):
+        # the last forward frame repeats the one before, so the turn is one long frame
+        paths = write_frames(self.work, [RED, GREEN, GREEN])
+        self.assertEqual(apng.write_apng(paths, self.out, 10, collapse=True, pingpong=True), 2)
+        self.assertEqual(read_apng(self.out)[1], [(10, RED), (30, GREEN)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Auto-crop to the swept region against the fake Revit backend.
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import fakerevit  # noqa: E402  (puts GIF.pushbutton on sys.path)
+
+import animator  # noqa: E402
+import jobs  # noqa: E402
+import pngio  # noqa: E402
+
+EXPORT = {'dpi': 72, 'pixel_size': 400, 'scale': 1.0}
+
+
+class AutoCropTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp(prefix='autocrop_test_')
+        self.doc = fakerevit.FakeDoc(os.path.join(self.work, 'fake'))
+        self.folder = os.path.join(self.work, 'frames')
+        os.makedirs(self.folder)
+        self.view = self.doc.ActiveView
+        self.crop = self.view.CropBox
+        self.messages = []
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def log(self, message, level=None):
+        self.messages.append(message)
+
+    def run_frames(self, max_value=fakerevit.PARAM_MAX / 2):
+        # the block sweeps x 5..20 of the 40 x 30 view at y 10..20
+        return animator.run_animation(fakerevit, self.doc, None, self.doc.instance, True,
+                                      [jobs.ParamRange('Width', 0.0, max_value)], 4, self.folder,
+                                      EXPORT, log=self.log, auto_crop=True)
+
+    def assertViewRestored(self):
+        self.assertIs(self.view.CropBox, self.crop)
+        self.assertTrue(self.view.CropBoxVisible)
+
+    def test_export_shrinks_to_the_swept_region(self):
+        exported = []
+        export_image = self.doc.ExportImage
+
+        def record(opts):
+            box = self.view.CropBox
+            exported.append((opts.PixelSize, box.Min.X, box.Min.Y, box.Max.X, box.Max.Y))
+            export_image(opts)
+        self.doc.ExportImage = record
+        result = self.run_frames()
+        # padded by a tenth on each side: x 3.5..21.5 (45% of the width), y 9..21
+        self.assertEqual(len(exported), 4)
+        for pixel_size, xmin, ymin, xmax, ymax in exported:
+            self.assertEqual(pixel_size, 180)
+            for actual, expected in zip((xmin, ymin, xmax, ymax), (3.5, 9.0, 21.5, 21.0)):
+                self.assertAlmostEqual(actual, expected)
+        self.assertEqual(pngio.read_header(result.frame_paths[0])[0], 180)
+        self.assertViewRestored()
+
+    def test_crop_region_is_part_of_the_cache_key(self):
+        self.run_frames()
+        # frame 0 has the same values in both runs but a smaller crop region
+        self.assertEqual(self.run_frames(fakerevit.PARAM_MAX / 4).reused, 0)
+        self.doc.ExportImage = lambda opts: self.fail('cached frames must be reused')
+        self.assertEqual(self.run_frames(fakerevit.PARAM_MAX / 4).reused, 4)
+
+    def test_skipped_without_an_active_crop_region(self):
+        self.view.CropBoxActive = False
+        result = self.run_frames()
+        self.assertEqual(pngio.read_header(result.frame_paths[0])[0], 400)
+        self.assertTrue(any('crop region is off' in m for m in self.messages))
+        self.assertIs(self.view.CropBox, self.crop)
+        self.assertFalse(self.view.CropBoxActive)
+
+    def test_skipped_in_perspective_views(self):
+        self.view.IsPerspective = True
+        result = self.run_frames()
+        self.assertEqual(pngio.read_header(result.frame_paths[0])[0], 400)
+        self.assertTrue(any('perspective view' in m for m in self.messages))
+        self.assertViewRestored()
+
+    def test_skipped_when_the_elements_fill_the_view(self):
+        self.doc.instance.get_BoundingBox = lambda view: fakerevit.BoundingBoxXYZ(
+            fakerevit.XYZ(-5.0, -5.0, 0.0), fakerevit.XYZ(50.0, 40.0, 1.0))
+        result = self.run_frames()
+        self.assertEqual(pngio.read_header(result.frame_paths[0])[0], 400)
+        self.assertTrue(any('fill the view' in m for m in self.messages))
+        self.assertViewRestored()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""Family -> type -> instance index against a minimal stand-in DB.
+
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GIF.pushbutton'))
+
+import familyindex  # noqa: E402
+
+
+class ElementId(object):
+    def __init__(self, value):
+        self.Value = value
+
+
+class Symbol(object):
+    def __init__(self, value, family, name):
+        self.Id = ElementId(value)
+        self.FamilyName = family
+        self.Name = name
+
+
+class Instance(object):
+    def __init__(self, value, symbol):
+        self.Id = ElementId(value)
+        self.Symbol = symbol
+
+
+class FamilyInstanceFilter(object):
+    def __init__(self, doc, symbol_id):
+        self.symbol_id = symbol_id.Value
+
+
+class Doc(object):
+    def __init__(self, symbols, instances):
+        self.symbols = symbols
+        self.instances = instances
+        self.instance_queries = 0
+
+    def GetElement(self, element_id):
+        for element in self.instances + self.symbols:
+            if element.Id.Value == element_id.Value:
+                return element
+        return None
+
+
+class FilteredElementCollector(object):
+    def __init__(self, doc):
+        self.doc = doc
+        self.items = []
+
+    def OfClass(self, cls):
+        if cls is Instance:
+            self.doc.instance_queries += 1
+            self.items = list(self.doc.instances)
+        else:
+            self.items = list(self.doc.symbols)
+        return self
+
+    def WherePasses(self, element_filter):
+        self.items = [i for i in self.items if i.Symbol.Id.Value == element_filter.symbol_id]
+        return self
+
+    def FirstElementId(self):
+        return self.items[0].Id if self.items else ElementId(-1)
+
+    def ToElementIds(self):
+        return [i.Id for i in self.items]
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class db(object):
+    """Stand-in for the Revit DB module"""
+    ElementId = ElementId
+    FamilySymbol = Symbol
+    FamilyInstance = Instance
+    FamilyInstanceFilter = FamilyInstanceFilter
+    FilteredElementCollector = FilteredElementCollector
+
+
+class FamilyIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        door_a = Symbol(1, 'Door', '900x2100')
+        door_b = Symbol(2, 'Door', '800x2000')
+        window = Symbol(4, 'Window', 'W1')
+        # 'Spare' and the whole 'Railing' family are loaded but not placed
+        symbols = [door_a, door_b, Symbol(3, 'Door', 'Spare'), window, Symbol(5, 'Railing', 'R1')]
+        instances = [Instance(100, door_a), Instance(101, door_b), Instance(102, door_a),
+                     Instance(103, window)]
+        self.doc = Doc(symbols, instances)
+        self.index = familyindex.FamilyIndex(db, self.doc)
+
+    def test_startup_does_not_scan_instances(self):
+        self.assertEqual(self.index.names, ['Door', 'Railing', 'Window'])
+        self.assertEqual(self.doc.instance_queries, 0)
+
+    def test_unused_types_are_dropped_when_the_family_is_opened(self):
+        self.assertEqual(self.index.type_entries('Door'), [('800x2000', 2), ('900x2100', 1)])
+        self.assertEqual(self.index.type_entries('Railing'), [])
+        queries = self.doc.instance_queries
+        self.index.type_entries('Door')
+        self.assertEqual(self.doc.instance_queries, queries)
+
+    def test_instances_and_lookup(self):
+        self.assertEqual(self.index.instance_ids(1), [100, 102])
+        self.assertEqual(self.index.search('80 door'), ['Door'])
+        self.assertEqual(self.index.search('w1'), ['Window'])
+        self.assertEqual(self.index.locate('#103'), ('Window', 4, 103))
+        self.assertIsNone(self.index.locate('x'))
+
+
+if __name__ == '__main__':
+    unittest.main()
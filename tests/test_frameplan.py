@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Frame plans over one or several elements against the fake Revit backend.
+
+    python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import fakerevit  # noqa: E402  (puts GIF.pushbutton on sys.path)
+
+import animator  # noqa: E402
+import frameplan  # noqa: E402
+import jobs  # noqa: E402
+import paramschema  # noqa: E402
+
+
+def instance(element_id):
+    return fakerevit.FamilyInstance(element_id, {'Width': fakerevit.Parameter(name='Width'),
+                                                 'Height': fakerevit.Parameter(name='Height')})
+
+
+class BuildPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp(prefix='frameplan_test_')
+        self.doc = fakerevit.FakeDoc(os.path.join(self.work, 'fake'))
+        self.other = instance(2000)
+        elements = dict((e.Id.Value, e) for e in (self.doc.instance, self.other))
+        self.doc.GetElement = lambda element_id: elements.get(element_id.Value)
+        self.messages = []
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def log(self, message, level=None):
+        self.messages.append(message)
+
+    def build(self, targets, frames=5, is_instance=True, params=None, max_value=fakerevit.PARAM_MAX):
+        params = params or [jobs.ParamRange('Width', 0.0, max_value)]
+        return frameplan.build_plan(fakerevit, self.doc, targets, is_instance, params, frames, self.log)
+
+    def test_targets_sweep_with_their_phase(self):
+        plan = self.build([self.doc.instance, frameplan.Target(self.other, 0.5)])
+        self.assertEqual(plan.element_id, [1000, 2000])
+        self.assertEqual([t.element_id for t in plan.tracks], [1000, 2000])
+        self.assertEqual(plan.display, [[0.0, 500.0], [250.0, 750.0], [500.0, 0.0],
+                                        [750.0, 250.0], [1000.0, 500.0]])
+        self.assertAlmostEqual(plan.values[1][1], 750.0 / 304.8)
+        self.assertEqual(plan.describe(2), '#1000 Width=500.0, #2000 Width=0.0')
+        self.assertIn('one transaction per frame', self.messages[-1])
+
+    def test_single_target_keeps_a_plain_element_id(self):
+        plan = self.build(self.doc.instance)
+        self.assertEqual(plan.element_id, 1000)
+        self.assertEqual(plan.describe(1), 'Width=250.0')
+
+    def test_shared_type_is_animated_once(self):
+        twin = instance(2000)
+        twin.Symbol = self.doc.instance.Symbol
+        plan = self.build([self.doc.instance, twin], is_instance=False)
+        self.assertEqual(plan.element_id, [1000])
+        self.assertEqual(len(plan.tracks), 1)
+        self.assertTrue(any('shared type' in m for m in self.messages))
+
+    def test_missing_parameters(self):
+        params = [jobs.ParamRange('Width', 0.0, 1.0), jobs.ParamRange('Depth', 0.0, 1.0)]
+        plan = self.build(self.doc.instance, params=params)
+        self.assertEqual([t.name for t in plan.tracks], ['Width'])
+        self.assertTrue(any('Depth not found' in m for m in self.messages))
+        with self.assertRaises(ValueError):
+            self.build([self.doc.instance, self.other], params=[jobs.ParamRange('Depth', 0.0, 1.0)])
+
+    def test_descriptor_is_only_used_on_its_own_type(self):
+        setting = jobs.ParamRange('Width', 0.0, 100.0)
+        setting.Descriptor = paramschema.ParamDescriptor('Width', frameplan.STRATEGY_RAW, None,
+                                                         symbol_id=1000)
+        plan = self.build([self.doc.instance, self.other], params=[setting])
+        self.assertEqual([t.strategy for t in plan.tracks],
+                         [frameplan.STRATEGY_RAW, frameplan.STRATEGY_UNIT_TYPE_ID])
+        self.assertEqual(plan.values[-1][0], 100.0)
+        self.assertAlmostEqual(plan.values[-1][1], 100.0 / 304.8)
+
+    def test_values_are_rounded_to_the_display_accuracy(self):
+        plan = self.build(self.doc.instance, frames=4, max_value=10.0)
+        self.assertEqual(plan.tracks[0].accuracy, 1.0)
+        self.assertEqual([row[0] for row in plan.display], [0.0, 3.0, 7.0, 10.0])
+        # raw values are internal units and stay unrounded
+        setting = jobs.ParamRange('Width', 0.0, 10.0)
+        setting.Descriptor = paramschema.ParamDescriptor('Width', frameplan.STRATEGY_RAW, None, 1000)
+        plan = self.build(self.doc.instance, frames=4, params=[setting])
+        self.assertIsNone(plan.tracks[0].accuracy)
+        self.assertAlmostEqual(plan.display[1][0], 10.0 / 3)
+
+    def test_one_transaction_per_frame_for_all_targets(self):
+        folder = os.path.join(self.work, 'frames')
+        os.makedirs(folder)
+        result = animator.run_animation(fakerevit, self.doc, None,
+                                        [self.doc.instance, frameplan.Target(self.other, 0.5)], True,
+                                        [jobs.ParamRange('Width', 0.0, fakerevit.PARAM_MAX)], 5, folder,
+                                        {'dpi': 72, 'pixel_size': 64, 'scale': 1.0}, keep_changes=True)
+        self.assertEqual((result.exported, self.doc.transactions, self.doc.exports), (5, 5, 5))
+        self.assertAlmostEqual(self.doc.instance.params['Width'].value, fakerevit.PARAM_MAX / 304.8)
+        self.assertAlmostEqual(self.other.params['Width'].value, 500.0 / 304.8)
+
+
+if __name__ == '__main__':
+    unittest.main()
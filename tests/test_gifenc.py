@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""LZW round-trips and GIF encoder output.
+
+    python -m unittest discover -s tests
+"""
+import io
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GIF.pushbutton'))
+
+import gifenc  # noqa: E402
+import pngio  # noqa: E402
+import tracing  # noqa: E402
+
+
+def lzw_decode(data, min_code_size=8):
+    """Reference GIF LZW decoder (variable code width, clear and end codes)"""
+    clear = 1 << min_code_size
+    eoi = clear + 1
+    out = bytearray()
+    table = []
+    code_size = min_code_size + 1
+    prev = None
+    bitbuf = 0
+    nbits = 0
+    pos = 0
+    while True:
+        while nbits < code_size:
+            if pos >= len(data):
+                raise ValueError('Code stream ends before the end code')
+            bitbuf |= data[pos] << nbits
+            nbits += 8
+            pos += 1
+        code = bitbuf & ((1 << code_size) - 1)
+        bitbuf >>= code_size
+        nbits -= code_size
+        if code == clear:
+            table = [bytearray((i,)) for i in range(clear)] + [None, None]
+            code_size = min_code_size + 1
+            prev = None
+            continue
+        if code == eoi:
+            return out
+        if prev is None:
+            entry = table[code]
+        else:
+            if code < len(table):
+                entry = table[code]
+            elif code == len(table):
+                entry = prev + prev[:1]
+            else:
+                raise ValueError('Invalid code {} with {} table entries'.format(code, len(table)))
+            if len(table) < 4096:
+                table.append(prev + entry[:1])
+                if len(table) == (1 << code_size) and code_size < 12:
+                    code_size += 1
+        out += entry
+        prev = entry
+
+
+def write_frames(folder, count, width=32, height=24):
+    """PNG frames with a block moving across a gradient; returns their paths"""
+    paths = []
+    for i in range(count):
+        rgb = bytearray()
+        for y in range(height):
+            for x in range(width):
+                if i * 3 <= x < i * 3 + 8 and 4 <= y < 16:
+                    rgb += bytearray((200, 40, 40))
+                else:
+                    rgb += bytearray((x * 8 % 256, y * 10 % 256, 128))
+        path = os.path.join(folder, 'frame_{:03d}.png'.format(i))
+        pngio.write_png(path, width, height, rgb)
+        paths.append(path)
+    return paths
+
+
+def read_gif(path):
+    """[(delay, canvas indices)] per frame, composed as a viewer shows them"""
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    width, height, packed = struct.unpack('<HHB', bytes(data[6:11]))
+    pos = 13 + (3 * (2 << (packed & 7)) if packed & 0x80 else 0)
+    canvas = bytearray(width * height)
+    frames = []
+    delay = transparent = None
+    while data[pos] != 0x3B:
+        if data[pos] == 0x21:
+            if data[pos + 1] == 0xF9:
+                delay = struct.unpack('<H', bytes(data[pos + 4:pos + 6]))[0]
+                transparent = data[pos + 6] if data[pos + 3] & 1 else None
+            pos += 2
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+            continue
+        left, top, w, h = struct.unpack('<HHHH', bytes(data[pos + 1:pos + 9]))
+        min_code_size = data[pos + 10]
+        pos += 11
+        lzw = bytearray()
+        while data[pos]:
+            lzw += data[pos + 1:pos + 1 + data[pos]]
+            pos += data[pos] + 1
+        pos += 1
+        indices = lzw_decode(lzw, min_code_size)
+        for y in range(h):
+            for x in range(w):
+                if indices[y * w + x] != transparent:
+                    canvas[(top + y) * width + left + x] = indices[y * w + x]
+        frames.append((delay, bytes(canvas)))
+    return frames
+
+
+def merge_repeats(frames):
+    """What collapse makes of [(delay, image)]: repeats shown as one longer frame"""
+    merged = []
+    for delay, image in frames:
+        if merged and merged[-1][1] == image:
+            merged[-1] = (merged[-1][0] + delay, image)
+        else:
+            merged.append((delay, image))
+    return merged
+
+
+class LzwTest(unittest.TestCase):
+
+    def assertRoundTrip(self, indices):
+        self.assertEqual(lzw_decode(gifenc.lzw_encode(bytearray(indices))), bytearray(indices))
+
+    def test_empty(self):
+        self.assertRoundTrip([])
+
+    def test_single(self):
+        self.assertRoundTrip([7])
+
+    def test_long_run(self):
+        # one repeated index grows codes quickly and fills the table
+        self.assertRoundTrip([0] * 100000)
+
+    def test_random(self):
+        rng = random.Random(5)
+        self.assertRoundTrip([rng.randrange(256) for _ in range(60000)])
+
+    def test_few_colors(self):
+        # many table resets at every code width
+        rng = random.Random(7)
+        self.assertRoundTrip([rng.randrange(4) for _ in range(200000)])
+
+
+class ParallelEncodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='gifenc_test_')
+        self.paths = write_frames(self.folder, 7)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def encode(self, name, **kwargs):
+        out = os.path.join(self.folder, name)
+        gifenc.encode_gif(self.paths, out, **kwargs)
+        with open(out, 'rb') as f:
+            return f.read()
+
+    def assertSameOutput(self, **kwargs):
+        serial = self.encode('serial.gif', **kwargs)
+        self.assertEqual(self.encode('thread.gif', workers=3, pool='thread', **kwargs), serial)
+        self.assertEqual(self.encode('process.gif', workers=2, pool='process', **kwargs), serial)
+
+    def test_full_frames(self):
+        self.assertSameOutput()
+
+    def test_delta_frames(self):
+        self.assertSameOutput(delta=True)
+
+    def test_palette_pingpong_loop(self):
+        palette = bytearray(range(0, 256, 2)) * 3
+        self.assertSameOutput(palette=palette[:3 * 64], pingpong=True, loop_count=0)
+
+    def test_workers_capped_by_frame_memory(self):
+        per_worker = 2 * 2 * 4 * 32 * 24  # two queued jobs of two 32 x 24 frames each
+        self.assertEqual(gifenc.parallel_workers(self.paths, 8), 8)
+        self.assertEqual(gifenc.parallel_workers(self.paths, 8, budget=3 * per_worker), 3)
+        self.assertEqual(gifenc.parallel_workers(self.paths, 8, budget=per_worker // 2), 1)
+        self.assertEqual(gifenc.parallel_workers([os.path.join(self.folder, 'missing.png')], 4), 4)
+
+
+class DelayTest(unittest.TestCase):
+
+    def test_default_delay(self):
+        self.assertEqual(gifenc.frame_delays(3), [10, 10, 10])
+
+    def test_rounded_cumulatively(self):
+        delays = gifenc.frame_delays(6, fps=30)
+        self.assertEqual(delays, [3, 4, 3, 3, 4, 3])
+        self.assertEqual(sum(gifenc.frame_delays(90, fps=30)), 300)
+
+    def test_fast_rates_hold_the_minimum(self):
+        self.assertEqual(gifenc.frame_delays(4, fps=100), [gifenc.MIN_DELAY_CS] * 4)
+
+    def test_uneven_frame_times(self):
+        # frame k starts at times[k] frame steps; the last one lasts one step
+        self.assertEqual(gifenc.frame_delays(4, fps=10, times=[0, 1, 4.5, 5]), [10, 35, 5, 10])
+
+
+class CollapseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='gifenc_test_')
+        p0, p1, p2 = write_frames(self.folder, 3)
+        self.paths = [p0, p1, p1, p1, p2, p2]
+        self.delays = [10, 20, 30, 40, 50, 60]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def frames(self, name, **kwargs):
+        out = os.path.join(self.folder, name)
+        count = gifenc.encode_gif(self.paths, out, self.delays, **kwargs)
+        frames = read_gif(out)
+        self.assertEqual(count, len(frames))
+        return frames
+
+    def test_repeats_become_one_longer_frame(self):
+        for kwargs in ({}, {'delta': True}, {'workers': 2, 'pool': 'thread'}):
+            full = self.frames('full.gif', **kwargs)
+            collapsed = self.frames('collapsed.gif', collapse=True, **kwargs)
+            self.assertEqual(len(full), 6)
+            self.assertEqual(collapsed, merge_repeats(full))
+            self.assertEqual([delay for delay, _ in collapsed], [10, 90, 110])
+
+    def test_merged_delay_stays_within_the_gif_limit(self):
+        # delays are 16-bit: 30000 + 30000 still fits, a third 30000 does not
+        for delay, expected in ((40000, (3, 0)), (30000, (2, 1))):
+            writer = gifenc.GifWriter(io.BytesIO(), 4, 4, collapse=True)
+            block = gifenc.encode_frame(bytearray(16), (4, 4), delay)
+            for _ in range(3):
+                writer.add_block(block, b'same')
+            writer.close()
+            self.assertEqual((writer.frame_count, writer.merged), expected)
+
+
+class LoopExtensionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='gifenc_test_')
+        self.paths = write_frames(self.folder, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def head(self, path):
+        """Bytes right after the global color table"""
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+        return bytes(data[13 + 3 * (2 << (data[10] & 7)):][:19])
+
+    def test_written_with_the_header(self):
+        out = os.path.join(self.folder, 'loop.gif')
+        for loop_count in (0, 3):
+            gifenc.encode_gif(self.paths, out, loop_count=loop_count)
+            self.assertEqual(self.head(out), gifenc.loop_extension(loop_count))
+            gifenc.encode_gif(self.paths, out, loop_count=loop_count, workers=2, pool='thread')
+            self.assertEqual(self.head(out), gifenc.loop_extension(loop_count))
+            stream = gifenc.GifStream(out, loop_count=loop_count)
+            for path in self.paths:
+                stream.add_path(path)
+            stream.close()
+            self.assertEqual(self.head(out), gifenc.loop_extension(loop_count))
+
+    def test_play_once_without_loop_count(self):
+        out = os.path.join(self.folder, 'once.gif')
+        gifenc.encode_gif(self.paths, out)
+        self.assertNotEqual(self.head(out)[:2], b'\x21\xFF')
+
+
+class TraceTest(unittest.TestCase):
+    STAGES = ['decode', 'quantize', 'compress', 'gif_append']
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='gifenc_test_')
+        self.paths = write_frames(self.folder, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def traced(self, **kwargs):
+        tracer = tracing.Tracer()
+        gifenc.encode_gif(self.paths, os.path.join(self.folder, 'out.gif'), tracer=tracer, **kwargs)
+        counts = dict((name, len(values)) for name, values in tracer.durations())
+        tids = dict((name, set(e[3] for e in tracer.events if e[0] == name)) for name in counts)
+        return counts, tids
+
+    def test_serial_stages(self):
+        counts, tids = self.traced()
+        self.assertEqual(sorted(counts), sorted(self.STAGES))
+        self.assertEqual(set(counts.values()), set([5]))
+        self.assertEqual(set().union(*tids.values()), set([threading.current_thread().ident]))
+
+    def assertWorkerStages(self, pool):
+        counts, tids = self.traced(workers=2, pool=pool)
+        self.assertEqual(sorted(counts), sorted(self.STAGES))
+        self.assertEqual(set(counts.values()), set([5]))
+        main = threading.current_thread().ident
+        self.assertEqual(tids['gif_append'], set([main]))
+        for stage in ('decode', 'quantize', 'compress'):
+            self.assertNotIn(main, tids[stage])
+
+    def test_thread_pool_stages(self):
+        self.assertWorkerStages('thread')
+
+    def test_process_pool_stages(self):
+        self.assertWorkerStages('process')
+
+
+class PingpongTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='gifenc_test_')
+        # the last state repeats, so collapse merges across the turning point
+        self.paths = write_frames(self.folder, 4)
+        self.paths.append(self.paths[-1])
+        self.delays = [10, 20, 30, 40, 50]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_order(self):
+        self.assertEqual(gifenc.pingpong_order('abcd'), list('abcdcb'))
+        self.assertEqual(gifenc.pingpong_order('ab'), list('ab'))
+
+    def test_delays(self):
+        # on the way back frame k shows for the step between k - 1 and k
+        self.assertEqual(gifenc.pingpong_delays([10, 20, 30, 40]), [10, 20, 30, 30, 20, 10])
+        self.assertEqual(gifenc.pingpong_delays([10, 20]), [10, 20])
+        self.assertEqual(sum(gifenc.pingpong_delays(self.delays)), 2 * sum(self.delays[:-1]))
+
+    def encoded_frames(self, name, **kwargs):
+        out = os.path.join(self.folder, name)
+        gifenc.encode_gif(self.paths, out, self.delays, **kwargs)
+        return read_gif(out)
+
+    def assertPlaysForwardThenBack(self, **kwargs):
+        forward = [image for _, image in self.encoded_frames('forward.gif', **kwargs)]
+        expected = list(zip(gifenc.pingpong_delays(self.delays), gifenc.pingpong_order(forward)))
+        self.assertEqual(self.encoded_frames('pingpong.gif', pingpong=True, **kwargs), expected)
+        self.assertEqual(self.encoded_frames('collapsed.gif', pingpong=True, collapse=True, **kwargs),
+                         merge_repeats(expected))
+
+    def test_reused_blocks(self):
+        self.assertPlaysForwardThenBack()
+
+    def test_delta_frames(self):
+        self.assertPlaysForwardThenBack(delta=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
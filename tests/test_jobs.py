@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Job file parsing and the batch runner against the fake Revit backend.
+
+    python -m unittest discover -s tests
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import fakerevit  # noqa: E402  (puts GIF.pushbutton on sys.path)
+
+import jobs  # noqa: E402
+
+WIDTH = [{'name': 'Width', 'min': 0, 'max': fakerevit.PARAM_MAX}]
+
+
+class ParseJobsTest(unittest.TestCase):
+
+    def test_defaults_are_merged_into_every_job(self):
+        parsed = jobs.parse_jobs({
+            'defaults': {'folder': 'renders', 'dpi': 150, 'gif': {'loop': 3, 'width': 400}},
+            'jobs': [
+                {'element_id': 1, 'frames': 4, 'params': WIDTH},
+                {'name': 'own', 'element_id': 2, 'frames': 4, 'params': WIDTH, 'folder': 'elsewhere',
+                 'gif': {'delta': False}},
+            ]}, base_dir='base')
+        first, second = parsed
+        self.assertEqual(first.name, 'job_001')
+        self.assertEqual(first.folder, os.path.join('base', 'renders', 'job_001'))
+        self.assertEqual(first.export, {'dpi': 150, 'pixel_size': 2048, 'scale': 1.0})
+        self.assertEqual((first.gif['loop'], first.gif['width'], first.gif['delta']), (3, 400, True))
+        self.assertEqual(second.folder, os.path.join('base', 'elsewhere'))
+        self.assertEqual((second.gif['loop'], second.gif['delta']), (3, False))
+
+    def test_plain_list_and_duration(self):
+        job, = jobs.parse_jobs([{'element_id': 5, 'duration': 1.5, 'fps': 5, 'params': WIDTH,
+                                 'gif': False, 'instance': False}])
+        self.assertEqual((job.frames, job.fps, job.gif, job.is_instance), (8, 5.0, False, False))
+
+    def test_multi_target_phases(self):
+        job, = jobs.parse_jobs([{'element_id': [1, 2, 3], 'frames': 4, 'params': WIDTH,
+                                 'phase_step': 0.4}])
+        self.assertEqual(job.element_id, [1, 2, 3])
+        for actual, expected in zip(job.phases, [0.0, 0.4, 0.8]):
+            self.assertAlmostEqual(actual, expected)
+
+    def test_invalid_jobs_are_rejected(self):
+        bad = [
+            {'frames': 4, 'params': WIDTH},                                  # no element
+            {'element_id': [], 'frames': 4, 'params': WIDTH},
+            {'element_id': 1, 'frames': 1, 'params': WIDTH},                 # too few frames
+            {'element_id': 1, 'duration': 0, 'fps': 10, 'params': WIDTH},
+            {'element_id': 1, 'frames': 4},                                  # no parameters
+            {'element_id': 1, 'frames': 4, 'params': [{'name': 'Width', 'min': 1, 'max': 1}]},
+            {'element_id': [1, 2], 'frames': 4, 'params': WIDTH, 'phases': [0.5]},
+        ]
+        for spec in bad:
+            with self.assertRaises(ValueError):
+                jobs.parse_jobs([spec])
+        with self.assertRaises(ValueError):
+            jobs.parse_jobs({'jobs': []})
+
+
+class RunJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp(prefix='jobs_test_')
+        self.doc = fakerevit.FakeDoc(os.path.join(self.work, 'fake'))
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def test_failed_job_does_not_stop_the_queue(self):
+        path = os.path.join(self.work, 'jobs.json')
+        with open(path, 'w') as f:
+            json.dump({'defaults': {'folder': 'out', 'dpi': 72, 'pixel_size': 64, 'params': WIDTH},
+                       'jobs': [{'name': 'missing', 'element_id': 42, 'frames': 3},
+                                {'name': 'ok', 'element_id': 1000, 'frames': 3, 'apng': True}]}, f)
+        results = jobs.run_jobs(fakerevit, self.doc, jobs.load_jobs(path))
+        self.assertEqual([r.status for r in results], [jobs.STATUS_FAILED, jobs.STATUS_OK])
+        self.assertIn('42', results[0].error)
+        ok = results[1]
+        self.assertEqual((ok.frames, ok.exported, ok.reused), (3, 3, 0))
+        self.assertEqual(ok.gif, os.path.join(self.work, 'out', 'ok', 'animation.gif'))
+        for output in (ok.gif, ok.apng, os.path.join(self.work, 'out', 'ok', 'trace.json')):
+            self.assertTrue(os.path.getsize(output) > 0)
+        report = os.path.join(self.work, 'report.json')
+        jobs.write_report(report, results)
+        with open(report) as f:
+            self.assertEqual([r['status'] for r in json.load(f)], ['failed', 'ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
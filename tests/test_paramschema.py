@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Per-type parameter schema cache against a minimal stand-in DB.
+
+    python -m unittest discover -s tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GIF.pushbutton'))
+
+import frameplan  # noqa: E402
+import paramschema  # noqa: E402
+
+
+class ElementId(object):
+    def __init__(self, value):
+        self.Value = value
+
+
+class Definition(object):
+    def __init__(self, name):
+        self.Name = name
+
+
+class Parameter(object):
+    def __init__(self, name, storage='Double', read_only=False, unit='mm'):
+        self.Definition = Definition(name)
+        self.StorageType = storage
+        self.IsReadOnly = read_only
+        self.unit = unit
+        self.unit_probes = 0
+
+    def GetUnitTypeId(self):
+        self.unit_probes += 1
+        if self.unit is None:
+            raise AttributeError('GetUnitTypeId')
+        return self.unit
+
+
+class Symbol(object):
+    def __init__(self, value, parameters):
+        self.Id = ElementId(value)
+        self.Parameters = parameters
+
+
+class Instance(object):
+    def __init__(self, value, symbol, parameters):
+        self.Id = ElementId(value)
+        self.Symbol = symbol
+        self.Parameters = parameters
+
+
+class ParameterElement(object):
+    pass
+
+
+class db(object):
+    """Stand-in for the Revit DB module"""
+    ParameterElement = ParameterElement
+
+    class StorageType(object):
+        Double = 'Double'
+        String = 'String'
+
+    class UnitUtils(object):
+        @staticmethod
+        def ConvertToInternalUnits(value, unit):
+            return value / 304.8
+
+
+class Doc(object):
+    def __init__(self, elements):
+        self.elements = elements
+
+    def GetElement(self, element_id):
+        return self.elements.get(element_id.Value)
+
+
+class ChangeArgs(object):
+    def __init__(self, added=(), modified=(), deleted=()):
+        self.added, self.modified, self.deleted = added, modified, deleted
+
+    def GetAddedElementIds(self):
+        return [ElementId(v) for v in self.added]
+
+    def GetModifiedElementIds(self):
+        return [ElementId(v) for v in self.modified]
+
+    def GetDeletedElementIds(self):
+        return [ElementId(v) for v in self.deleted]
+
+
+def instance_of(symbol_value, instance_value=None):
+    symbol = Symbol(symbol_value, [Parameter('Depth'), Parameter('Angle', unit=None)])
+    parameters = [Parameter('Width'), Parameter('Height'), Parameter('Mark', storage='String'),
+                  Parameter('Area', read_only=True)]
+    return Instance(instance_value or symbol_value * 100, symbol, parameters)
+
+
+class SchemaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = paramschema.SchemaCache(db)
+
+    def test_descriptors_list_writable_numeric_parameters(self):
+        entry = self.cache.descriptors(instance_of(7), True)
+        self.assertEqual([(d.name, d.strategy, d.unit, d.symbol_id) for d in entry],
+                         [('Width', frameplan.STRATEGY_UNIT_TYPE_ID, 'mm', 7),
+                          ('Height', frameplan.STRATEGY_UNIT_TYPE_ID, 'mm', 7)])
+        types = self.cache.descriptors(instance_of(7), False)
+        self.assertEqual([(d.name, d.strategy) for d in types],
+                         [('Depth', frameplan.STRATEGY_UNIT_TYPE_ID), ('Angle', frameplan.STRATEGY_RAW)])
+
+    def test_instances_of_one_type_share_an_entry(self):
+        first = instance_of(7, 701)
+        second = instance_of(7, 702)
+        entry = self.cache.descriptors(first, True)
+        self.assertIs(self.cache.descriptors(second, True), entry)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(second.Parameters[0].unit_probes, 0)
+        self.cache.descriptors(second, False)  # type mode is its own entry
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_least_recently_used_entry_is_dropped(self):
+        cache = paramschema.SchemaCache(db, capacity=2)
+        cache.descriptors(instance_of(1), True)
+        cache.descriptors(instance_of(2), True)
+        cache.descriptors(instance_of(1), True)  # 2 is now the oldest
+        cache.descriptors(instance_of(3), True)
+        self.assertEqual(cache.misses, 3)
+        cache.descriptors(instance_of(1), True)
+        self.assertEqual(cache.misses, 3)
+        cache.descriptors(instance_of(2), True)
+        self.assertEqual(cache.misses, 4)
+
+    def test_invalidate(self):
+        for value in (1, 2):
+            self.cache.descriptors(instance_of(value), True)
+        self.cache.invalidate([1])
+        self.cache.descriptors(instance_of(2), True)
+        self.cache.descriptors(instance_of(1), True)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 3))
+        self.cache.invalidate()
+        self.cache.descriptors(instance_of(2), True)
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_document_changed(self):
+        for value in (1, 2, 3):
+            self.cache.descriptors(instance_of(value), True)
+        doc = Doc({50: ParameterElement(), 60: object()})
+        self.cache.document_changed(doc, ChangeArgs(added=[60], modified=[1], deleted=[2]))
+        for value in (1, 2, 3):
+            self.cache.descriptors(instance_of(value), True)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 5))
+        # a new project parameter can add to every type
+        self.cache.document_changed(doc, ChangeArgs(added=[50]))
+        self.cache.descriptors(instance_of(3), True)
+        self.assertEqual(self.cache.misses, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
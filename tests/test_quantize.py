@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Global palette, palette mapping and dithering; NumPy and pure Python parity.
+
+    python -m unittest discover -s tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GIF.pushbutton'))
+
+import gifenc  # noqa: E402
+import pngio  # noqa: E402
+import quantize  # noqa: E402
+
+WIDTH, HEIGHT = 37, 23
+
+
+def gradient(seed=5):
+    """Packed RGB: smooth gradients plus noise, more colors than a palette holds"""
+    rng = random.Random(seed)
+    rgb = bytearray()
+    for y in range(HEIGHT):
+        for x in range(WIDTH):
+            rgb += bytearray((x * 255 // (WIDTH - 1), y * 255 // (HEIGHT - 1), rng.randrange(256)))
+    return rgb
+
+
+def solid(colors):
+    """One row per color, WIDTH pixels each"""
+    rgb = bytearray()
+    for color in colors:
+        rgb += bytearray(color) * WIDTH
+    return pngio.Frame(WIDTH, len(colors), rgb)
+
+
+class without_numpy(object):
+    """Forces the pure Python histogram and lookup table"""
+
+    def __enter__(self):
+        self.saved = quantize.np
+        quantize.np = None
+
+    def __exit__(self, exc_type, exc, tb):
+        quantize.np = self.saved
+
+
+class PaletteTest(unittest.TestCase):
+
+    def test_few_colors_are_kept_exactly(self):
+        colors = [(0, 0, 0), (255, 255, 255), (200, 30, 40), (10, 120, 250)]
+        frame = solid(colors)
+        palette = quantize.build_palette([frame])
+        self.assertEqual(sorted(tuple(palette[i:i + 3]) for i in range(0, len(palette), 3)),
+                         sorted(colors))
+        indices = quantize.PaletteMapper(palette).map(frame)
+        for row, color in enumerate(colors):
+            for idx in indices[row * WIDTH:(row + 1) * WIDTH]:
+                self.assertEqual(tuple(palette[idx * 3:idx * 3 + 3]), color)
+
+    def test_palette_is_limited_and_shared_across_frames(self):
+        frames = [pngio.Frame(WIDTH, HEIGHT, gradient(seed)) for seed in (1, 2)]
+        palette = quantize.build_palette(frames, colors=16)
+        self.assertEqual(len(palette), 16 * 3)
+        self.assertEqual(quantize.build_palette([solid([(9, 9, 9)])] * 3), bytearray((9, 9, 9)))
+
+    def test_unknown_dither_mode(self):
+        with self.assertRaises(ValueError):
+            quantize.PaletteMapper(bytearray(3), 'stochastic')
+
+
+class DitherTest(unittest.TestCase):
+    # mid grey against a black and white palette
+    palette = bytearray((0, 0, 0, 255, 255, 255))
+    frame = solid([(128, 128, 128)] * 8)
+
+    def white_share(self, dither):
+        indices = quantize.PaletteMapper(self.palette, dither).map(self.frame)
+        return sum(indices) / float(len(indices))
+
+    def test_without_dither_every_pixel_gets_the_nearest_color(self):
+        self.assertEqual(self.white_share(quantize.DITHER_NONE), 1.0)
+
+    def test_ordered_dither_mixes_the_neighbours(self):
+        self.assertAlmostEqual(self.white_share(quantize.DITHER_ORDERED), 0.5, delta=0.1)
+
+    def test_diffusion_keeps_the_mean(self):
+        self.assertAlmostEqual(self.white_share(quantize.DITHER_DIFFUSION), 0.5, delta=0.05)
+
+
+@unittest.skipIf(quantize.np is None, 'NumPy not installed')
+class NumpyParityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rgb = gradient()
+        self.fast = pngio.Frame.from_rgb(WIDTH, HEIGHT, self.rgb)
+        self.slow = pngio.Frame(WIDTH, HEIGHT, bytearray(self.rgb))
+
+    def test_palette_and_lookup_table(self):
+        palette = quantize.build_palette([self.fast])
+        with without_numpy():
+            self.assertEqual(quantize.build_palette([self.slow]), palette)
+            palette = palette[:48 * 3]  # the pure Python table is slow to build for 255 colors
+            lut = quantize.PaletteMapper(palette).lut
+        self.assertEqual(quantize.PaletteMapper(palette).lut, lut)
+
+    def test_mapping(self):
+        palette = quantize.build_palette([self.fast], colors=32)
+        for dither in (quantize.DITHER_NONE, quantize.DITHER_ORDERED, quantize.DITHER_DIFFUSION):
+            mapper = quantize.PaletteMapper(palette, dither)
+            self.assertEqual(mapper.map(self.fast), mapper.map(self.slow), dither)
+
+    def test_websafe(self):
+        self.assertEqual(gifenc.quantize_websafe(self.fast), gifenc.quantize_websafe(self.slow))
+
+
+class WebsafeTest(unittest.TestCase):
+
+    def test_channels_map_onto_the_six_level_cube(self):
+        frame = solid([(0, 0, 0), (255, 255, 255), (51, 102, 204)])
+        indices = gifenc.quantize_websafe(frame)
+        palette = gifenc.websafe_palette()
+        self.assertEqual(len(palette), 216 * 3)
+        self.assertEqual([indices[0], indices[WIDTH]], [0, 215])
+        self.assertEqual(tuple(palette[indices[2 * WIDTH] * 3:indices[2 * WIDTH] * 3 + 3]), (51, 102, 204))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Area downsampling to the GIF output width.
+
+    python -m unittest discover -s tests
+"""
+import os
+import pickle
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'GIF.pushbutton'))
+
+import pngio  # noqa: E402
+import resample  # noqa: E402
+
+
+def gray(width, height, values):
+    """Packed-RGB frame (pure Python backing) with equal channels"""
+    return pngio.Frame(width, height, bytearray(v for v in values for _ in range(3)))
+
+
+class ResampleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp(prefix='resample_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def test_target_size_keeps_aspect_and_never_upscales(self):
+        self.assertEqual(resample.target_size(2048, 1536, 1024), (1024, 768))
+        self.assertEqual(resample.target_size(1000, 333, 300), (300, 100))
+        self.assertEqual(resample.target_size(640, 480, 800), (640, 480))
+        self.assertEqual(resample.target_size(640, 480, None), (640, 480))
+
+    def test_integer_factor_block_means(self):
+        frame = gray(4, 2, [0, 10, 20, 40,
+                            30, 40, 60, 60])
+        out = resample.downsample(frame, 2)
+        self.assertEqual((out.width, out.height), (2, 1))
+        self.assertEqual(out.rgb_bytes()[::3], bytearray([20, 45]))
+
+    def test_fractional_factor_weights_by_area(self):
+        # each output pixel covers one and a half input pixels
+        out = resample.downsample(gray(3, 1, [0, 90, 180]), 2)
+        self.assertEqual((out.width, out.height), (2, 1))
+        self.assertEqual(out.rgb_bytes()[::3], bytearray([30, 150]))
+
+    def test_same_frame_when_not_smaller(self):
+        frame = gray(3, 1, [1, 2, 3])
+        self.assertIs(resample.downsample(frame, 3), frame)
+
+    @unittest.skipIf(resample.np is None, 'NumPy not installed')
+    def test_numpy_matches_pure_python(self):
+        rng = random.Random(3)
+        width, height = 97, 61
+        rgb = bytearray(rng.randrange(256) for _ in range(width * height * 3))
+        for target in (40, 48, 33):
+            fast = resample.downsample(pngio.Frame.from_rgb(width, height, rgb), target)
+            slow = resample.downsample(pngio.Frame(width, height, bytearray(rgb)), target)
+            self.assertEqual((fast.width, fast.height), (slow.width, slow.height))
+            diff = max(abs(a - b) for a, b in zip(fast.rgb_bytes(), slow.rgb_bytes()))
+            self.assertTrue(diff <= 1, 'width {}: off by {}'.format(target, diff))
+
+    def test_scaled_loader(self):
+        self.assertIs(resample.scaled_loader(None, gray), gray)
+        loader = pickle.loads(pickle.dumps(resample.scaled_loader(2)))  # process pools pickle it
+        path = os.path.join(self.work, 'wide.png')
+        pngio.write_png(path, 4, 2, gray(4, 2, [0, 10, 20, 40, 30, 40, 60, 60]).rgb_bytes())
+        frame = loader(path)
+        self.assertEqual((frame.width, frame.height), (2, 1))
+        self.assertEqual(frame.rgb_bytes()[::3], bytearray([20, 45]))
+
+
+if __name__ == '__main__':
+    unittest.main()